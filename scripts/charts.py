@@ -1,16 +1,21 @@
 import os
 import logging
+import threading
+import time
 from dash import Dash, dcc, html, Input, Output
-from pages import home, bar_chart, heatmap, storage
+from pages import home, bar_chart, heatmap, storage, decimate, data_plane
+from scripts import metrics
 
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ASSETS_PATH = os.path.join(ROOT_DIR, 'assets')
 dash_app = Dash(__name__, assets_folder=ASSETS_PATH, suppress_callback_exceptions=True)
+metrics.time_callbacks(dash_app)
 LOGO_URL = dash_app.get_asset_url('logo.png')
 
 PATH_BAR_CHART = '/bar-chart'
 PATH_HEATMAP = '/heatmap'
 PATH_STORAGE = '/storage'
+PUBLISH_INTERVAL = 3600  # seconds, as often as the heatmap retrieves new data
 
 nav_links = html.Div([
     dcc.Link('דף הבית', href='/'),
@@ -30,6 +35,7 @@ def app_layout():
     # This is the single layout structure Dash requires for routing
     return html.Div([
         dcc.Location(id='url', refresh=False),
+        decimate.width_store(),
         html.Div(id='page-content')
     ])
 
@@ -38,11 +44,23 @@ def main():
     logging.info("Starting charts")
     heatmap.retrieve_data()
     bar_chart.retrieve_data()
+    if data_plane.publishing():
+        # the chart processes reading the published data only see new data when this one retrieves it
+        threading.Thread(target=refresh_published, daemon=True).start()
     # Use the new top-level layout function for routing
     dash_app.layout = app_layout
     dash_app.run(debug=False, host='0.0.0.0', port=9998)
 
 
+def refresh_published():
+    while True:
+        time.sleep(PUBLISH_INTERVAL)
+        try:
+            heatmap.retrieve_data()
+        except Exception as ex:
+            logging.exception("Could not refresh the published chart data: %s", ex)
+
+
 @dash_app.callback(Output('page-content', 'children'),
                    [Input('url', 'pathname')])
 def display_page(pathname):
@@ -57,6 +75,7 @@ def display_page(pathname):
         return home.home_layout(nav_links, LOGO_URL)
 
 
+decimate.register_width_callback(Input('url', 'pathname'))
 bar_chart.register_callbacks(dash_app)
 heatmap.register_callbacks(dash_app)
 storage.register_callbacks(dash_app)
@@ -0,0 +1,68 @@
+"""Data for the Dash pages. When the charts run in the same process as the server (see manager.py) the server
+registers its store and the pages read it directly, sharing the server's result cache. Otherwise they get the
+data from the server's /get endpoint."""
+import datetime
+import logging
+import os
+from urllib.parse import urlencode
+
+from scripts import noga, utils
+from scripts.storage.storage_top import fix_date
+
+SERVER_URL = os.environ.get("DATA_SERVER_URL", "http://0.0.0.0:9999")
+SMP_DATE_FORMAT = "%d-%m-%Y"
+VALUE_SIZE = 100  # rough size in bytes of a value in the nested result, for the result cache
+
+store = None
+result_cache = None
+
+
+def register(a_store, a_result_cache=None):
+    """Read a_store in process from now on, caching the results in a_result_cache if given."""
+    global store, result_cache
+    store = a_store
+    result_cache = a_result_cache
+    logging.info("Data service reading the store in process")
+
+
+def get(source, data_type, start_date=None, end_date=None, tag=None, time="hour", after=None):
+    """Values as {namespace: {date: {time: {tag: value}}}} like /get?format=json, or None if they could not
+    be retrieved. Results may be shared with other callers and must not be modified."""
+    start_date = start_date or noga.one_month_ago()
+    end_date = end_date or datetime.date.today().strftime(SMP_DATE_FORMAT)
+    if store is None:
+        return get_url(source, data_type, start_date, end_date, tag, time, after)
+    key = (source, data_type, tag, start_date, end_date, time, "object", after)
+    data = result_cache.get(key) if result_cache else None
+    if data is not None:
+        return data
+    try:
+        version = result_cache.version() if result_cache else None
+        data = {}
+        namespaces = []
+        if source == "noga" or source == "noga2":
+            data = noga.get(store, source, noga_type=data_type, start_date=start_date, end_date=end_date,
+                            tag=tag, time=time, after=after)
+            namespaces = [source + "." + a_type for a_type in noga.get_types(data_type)]
+    except Exception as ex:
+        logging.exception("Could not get data from store: %s", ex)
+        return None
+    if result_cache:
+        result_cache.put(key, data, VALUE_SIZE * count_values(data), namespaces,
+                         fix_date(start_date), fix_date(end_date), version)
+    return data
+
+
+def get_url(source, data_type, start_date, end_date, tag=None, time="hour", after=None):
+    """The same values from the server over HTTP."""
+    params = {"source": source, "type": data_type, "start_date": start_date, "end_date": end_date, "time": time,
+              "format": "bin"}
+    if tag:
+        params["tag"] = tag
+    if after:
+        params["after"] = after
+    return utils.retrieve_url(SERVER_URL + "/get?" + urlencode(params, safe=":-"))
+
+
+def count_values(data):
+    return sum(len(tags) for dates in data.values() for times in dates.values() for tags in times.values())
@@ -0,0 +1,129 @@
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_TAIL = "0123456789.eE+-"
+_START, _KEY, _ITEMS, _DONE = range(4)
+
+
+class JsonArrayStream:
+    """Incremental parser for a JSON document whose payload is a large array.
+
+    The array is either the whole document or, if key is set, the value of that top level key.
+    Bytes are fed as they arrive and the array items are returned as soon as each one is complete,
+    so only a single item has to be held in memory at a time."""
+
+    def __init__(self, key=None):
+        self.key = key
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._retry_at = 0
+        self._state = _START
+        self._first = True
+
+    def feed(self, chunk):
+        """Add bytes of the document. Returns the list of array items completed by this chunk."""
+        self._buffer = self._buffer[self._pos:] + self._text.decode(chunk)
+        self._retry_at -= self._pos
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self):
+        """Signal the end of the document. Returns the remaining items, raises ValueError if incomplete."""
+        self._buffer = self._buffer[self._pos:] + self._text.decode(b"", final=True)
+        self._pos = 0
+        self._retry_at = 0
+        items = self._parse(final=True)
+        if self._state != _DONE:
+            raise ValueError("Incomplete JSON document")
+        return items
+
+    def _parse(self, final):
+        items = []
+        if len(self._buffer) < self._retry_at:
+            return items
+        while self._state != _DONE:
+            char = self._next_char()
+            if char is None:
+                break
+            if self._state == _START:
+                expected = "[" if self.key is None else "{"
+                if char != expected:
+                    raise ValueError("Expected '{}' at start of JSON document".format(expected))
+                self._pos += 1
+                self._state = _ITEMS if self.key is None else _KEY
+            elif self._state == _KEY:
+                if char == "}":
+                    raise ValueError("Key '{}' not found in JSON document".format(self.key))
+                if char == "," and not self._first:
+                    self._pos += 1
+                    continue
+                mark = self._pos
+                if not self._parse_member(final):
+                    self._pos = mark  # parse the whole "key": value again once more data arrived
+                    break
+            elif self._state == _ITEMS:
+                if char == "]":
+                    self._pos += 1
+                    self._state = _DONE
+                elif char == "," and not self._first:
+                    self._pos += 1
+                else:
+                    item = self._decode(final)
+                    if item is _INCOMPLETE:
+                        break
+                    items.append(item)
+                    self._first = False
+        return items
+
+    def _next_char(self):
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+            self._pos += 1
+        return self._buffer[self._pos] if self._pos < len(self._buffer) else None
+
+    def _parse_member(self, final):
+        """Parse "key": and either enter the array of the wanted key or skip the value of any other key.
+        Returns False if more data is needed."""
+        key = self._decode(final)
+        if key is _INCOMPLETE:
+            return False
+        if self._next_char() != ":":
+            if self._pos < len(self._buffer):
+                raise ValueError("Expected ':' after key in JSON document")
+            return False
+        self._pos += 1
+        if key == self.key:
+            array_start = self._next_char()
+            if array_start is None:
+                return False
+            if array_start != "[":
+                raise ValueError("Value of key '{}' is not an array".format(self.key))
+            self._pos += 1
+            self._state = _ITEMS
+            self._first = True
+            return True
+        if self._next_char() is None or self._decode(final) is _INCOMPLETE:
+            return False
+        self._first = False
+        return True
+
+    def _decode(self, final):
+        """Decode the value at the current position, or return _INCOMPLETE if more data is needed."""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            # retry only after the buffer doubled, which keeps re-parsing of a long value linear
+            self._retry_at = len(self._buffer) + (len(self._buffer) - self._pos)
+            return _INCOMPLETE
+        if not final and (end == len(self._buffer) or isinstance(value, (int, float))
+                          and not self._buffer[end:].lstrip(_NUMBER_TAIL)):
+            return _INCOMPLETE  # a number at the end of the buffer, e.g. "3." or "1e", may still continue
+        self._pos = end
+        return value
+
+
+_INCOMPLETE = object()
@@ -5,7 +5,7 @@ import time
 import ischedule
 import psutil
 
-from scripts import server, charts
+from scripts import data_service, metrics, server, charts
 
 FORMAT = '%(asctime)s [%(levelname)s] : %(message)s'
 logging.basicConfig(format=FORMAT, level=logging.INFO)
@@ -25,10 +25,20 @@ def shcedule_mem_usage():
     ischedule.run_loop()
 
 
-# run the server and memory usage logging in threads
-threading.Thread(target=server.main).start()
-threading.Thread(target=shcedule_mem_usage).start()
-# wait for server to start
-time.sleep(4)
-# run the charts dash app in the main thread
-charts.main()
+def main():
+    metrics.Gauge("process_resident_memory_bytes", "Resident memory of the process",
+                  lambda: psutil.Process().memory_info().rss)
+    # the charts read the server's store in process
+    data_service.register(server.store, server.result_cache)
+    # run the server and memory usage logging in threads
+    threading.Thread(target=server.main).start()
+    threading.Thread(target=shcedule_mem_usage).start()
+    # wait for server to start
+    time.sleep(4)
+    # run the charts dash app in the main thread
+    charts.main()
+
+
+# render worker processes import this module again, they must not start the server
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Metrics in the Prometheus text format, served by the server at /metrics.
+
+Recording a value only takes a lock and a few list operations. Gauges are functions called when the
+metrics are scraped, so that nothing is computed for them otherwise."""
+import bisect
+import functools
+import math
+import threading
+import time
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_metrics = []
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+        _metrics.append(self)
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def lines(self):
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} counter".format(self.name)
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield "{}{} {}".format(self.name, _labels(self.labels, label_values), _number(value))
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}  # label values: [count per bucket (not cumulative) and +Inf, sum]
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bucket] += 1
+            counts[-1] += value
+
+    def time(self, *label_values):
+        """Context manager and decorator observing the seconds taken."""
+        return _Timer(self, label_values)
+
+    def lines(self):
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} histogram".format(self.name)
+        with self._lock:
+            values = [(label_values, list(counts)) for label_values, counts in self._values.items()]
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield "{}_bucket{} {}".format(self.name, _labels(self.labels + ("le",), label_values + (bound,)),
+                                              cumulative)
+            yield "{}_sum{} {}".format(self.name, _labels(self.labels, label_values), _number(counts[-1]))
+            yield "{}_count{} {}".format(self.name, _labels(self.labels, label_values), cumulative)
+
+
+class Gauge:
+    """A value computed by function when scraped. function returns a number, or a dict of numbers by
+    label values for a gauge with labels."""
+
+    def __init__(self, name, help_text, function, labels=()):
+        self.name = name
+        self.help = help_text
+        self.function = function
+        self.labels = labels
+        _metrics.append(self)
+
+    def lines(self):
+        value = self.function()
+        if value is None:
+            return
+        yield "# HELP {} {}".format(self.name, self.help)
+        yield "# TYPE {} gauge".format(self.name)
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for label_values, a_value in values:
+            yield "{}{} {}".format(self.name, _labels(self.labels, label_values), _number(a_value))
+
+
+class _Timer:
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.histogram.observe(time.perf_counter() - start, *self.label_values)
+        return timed
+
+
+def render():
+    """All the metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_metrics):
+        try:
+            lines.extend(metric.lines())
+        except Exception as ex:  # a gauge whose source went away shouldn't break the others
+            lines.append("# {} failed: {}".format(metric.name, ex))
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Duration of server requests until the response is "
+                            "returned (streamed responses continue after)", ("endpoint", "status"))
+STORAGE_SECONDS = Histogram("storage_operation_duration_seconds", "Duration of storage operations",
+                            ("backend", "operation"))
+NOGA_FETCH_SECONDS = Histogram("noga_fetch_duration_seconds", "Duration of NOGA API requests, including reading and "
+                               "storing the response", ("endpoint",))
+NOGA_FETCH_BYTES = Counter("noga_fetch_bytes_total", "Bytes of NOGA API responses, decompressed", ("endpoint",))
+DASH_CALLBACK_SECONDS = Histogram("dash_callback_duration_seconds", "Duration of Dash callbacks", ("callback",))
+
+STORAGE_OPERATIONS = ["retrieve_range", "retrieve_rows", "iter_range", "bulk_insert", "latest_date"]
+
+
+def instrument_store(store):
+    """Time the STORAGE_OPERATIONS of store, labelled with the class of the store.
+    iter_range is timed until its generator is exhausted or closed."""
+    backend = type(store).__name__
+    for operation in STORAGE_OPERATIONS:
+        method = getattr(store, operation, None)
+        if method is None:
+            continue
+        if operation == "iter_range":
+            setattr(store, operation, _timed_generator(method, STORAGE_SECONDS, backend, operation))
+        else:
+            setattr(store, operation, STORAGE_SECONDS.time(backend, operation)(method))
+    return store
+
+
+def _timed_generator(function, histogram, *label_values):
+    @functools.wraps(function)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            yield from function(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, *label_values)
+    return timed
+
+
+def time_callbacks(dash_app):
+    """Time the callbacks registered with dash_app.callback from now on, labelled with the function name."""
+    register = dash_app.callback
+
+    def callback(*args, **kwargs):
+        decorator = register(*args, **kwargs)
+
+        def wrap(function):
+            return decorator(DASH_CALLBACK_SECONDS.time(function.__name__)(function))
+        return wrap
+    dash_app.callback = callback
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)) + "}"
+
+
+def _escape(value):
+    if isinstance(value, float):
+        return _number(value)
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
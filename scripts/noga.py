@@ -1,15 +1,17 @@
-import json
+import asyncio
+import io
 import logging
-import tempfile
-import urllib.request
+import numpy as np
 import pandas as pd
 import re
 import os
 import datetime
+import itertools
 from dateutil.relativedelta import relativedelta
+import scripts.noga_client as noga_client
 import scripts.noga_labels as noga_labels
 import scripts.noga_tokens as noga_tokens
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from scripts.storage.storage_top import batches, fix_date, unfix_date, unfix_time
 
 SMP_CONST = "ConstrainedSmp"
 SMP_UNCONST = "UnconstrainedSmp"
@@ -23,6 +25,27 @@ COST_DEMAND = "SystemDemand"
 FORECAST_REN = "Renewable"
 FORECAST_DEMAND = "SystemDemand"
 
+STORE_BATCH_SIZE = int(os.environ.get("STORE_BATCH_SIZE", 5000))
+DATE_FORMAT = "%d-%m-%Y"
+
+# update() fetches every type in windows of UPDATE_WINDOW_DAYS days
+UPDATE_WINDOW_DAYS = int(os.environ.get("UPDATE_WINDOW_DAYS", 30))
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", 8))  # concurrent requests in total
+UPDATE_ENDPOINT_CONCURRENCY = int(os.environ.get("UPDATE_ENDPOINT_CONCURRENCY", 2))
+UPDATE_RETRIES = int(os.environ.get("UPDATE_RETRIES", 3))
+UPDATE_RETRY_DELAY = float(os.environ.get("UPDATE_RETRY_DELAY", 2))  # seconds, doubled on every retry
+# Days before today whose data may still change, they are fetched again by every update
+LEDGER_SETTLE_DAYS = int(os.environ.get("LEDGER_SETTLE_DAYS", 1))
+
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"  # reads xlsx files several times faster than the default openpyxl
+except ImportError:
+    EXCEL_ENGINE = None
+
+# functions called with (namespace, from_date, to_date) after values of those dates (yyyy-mm-dd) were stored
+write_listeners = []
+
 proxies = {
     'https': os.environ.get('PROXY_SERVER'),
 }
@@ -36,61 +59,91 @@ class NogaType:
         self.dict_key = dict_key
 
 
-def update(store, noga_type, start_date, end_date):
+def update(store, noga_type, start_date, end_date, window_days=None):
     """
     Collects data from NOGA API endpoints and stores it in the database.
-    Handles individual endpoint failures to prevent data loss and ensure
-    continuation of data collection for other endpoints.
+    Without a start_date, only the dates that the storage's ingestion ledger doesn't list as complete
+    are requested, from the start date of the type until end_date. Settled windows are complete once they
+    returned values.
+    The date range of every type is split into windows of window_days days which are fetched
+    concurrently on one event loop, with at most UPDATE_ENDPOINT_CONCURRENCY concurrent requests per endpoint.
+    Failed windows are retried with exponential backoff and a window that still fails doesn't
+    prevent the other windows and endpoints from being collected.
 
     Args:
         store: Db where to store the results
         noga_type (str): The specific NOGA2 type to fetch, or "all" for all types.
-        start_date (str): The start date for data collection (YYYY-MM-DD format).
-        end_date (str): The end date for data collection (YYYY-MM-DD format).
+        start_date (str): The start date for data collection (DD-MM-YYYY format), fetched even if already complete.
+        end_date (str): The end date for data collection (DD-MM-YYYY format).
+        window_days (int): Days per request, defaults to UPDATE_WINDOW_DAYS.
 
     Returns:
         str: A message indicating the total number of values inserted into storage.
     """
     noga2_types = NOGA2_TYPE_MAPPING if noga_type == "all" else ([noga_type] if noga_type else list(NOGA2_TYPE_MAPPING.keys()))
+    end_date = end_date or datetime.date.today().strftime(DATE_FORMAT)
+    window_days = window_days or UPDATE_WINDOW_DAYS
+    settled_until = datetime.date.today() - datetime.timedelta(days=LEDGER_SETTLE_DAYS + 1)
 
-    total_inserted_count = 0
+    counts = {}
+    window_counts = {}
+    failed_windows = {}
     failed_endpoints_details = {}
     all_new_keys = {}
+    windows_per_type = []
 
-    def process_type(a_type):
+    for a_type in noga2_types:
         namespace = "noga2." + a_type
-        ns_start_date = start_date or store.latest_date(namespace) or NOGA2_TYPE_MAPPING.get(a_type).start_date
-
-        if not ns_start_date:
+        data_type = NOGA2_TYPE_MAPPING.get(a_type)
+        if start_date:
+            ranges = [(parse_date(start_date), parse_date(end_date))]
+        elif data_type:
+            ranges = missing_ranges(parse_date(data_type.start_date), parse_date(end_date),
+                                    completed_windows(store, namespace, data_type.start_date, settled_until))
+        else:
             logging.warning(f"Skipping {namespace}: Could not determine a start date for data collection.")
-            return 0, {namespace: "Could not determine a start date"}, {}
-
-        try:
-            logging.info(f"Attempting to request data for {namespace} from {ns_start_date} to {end_date}")
-            json_list, new_keys = request_data(a_type, ns_start_date, end_date)
-            # Store results immediately after successful collection for this endpoint
-            if json_list:
-                current_endpoint_results = {namespace: json_list}
-                count = store_results(store, current_endpoint_results)
-                logging.info(f"Successfully inserted {count} values for {namespace}.")
-                return count, {}, {namespace: new_keys} if new_keys else {}
-            else:
-                logging.info(f"No new data found for {namespace} in the specified range.")
-                return 0, {namespace: "No new data"}, {}
-
-        except Exception as e:
-            # Log the error but continue with the next endpoint
-            logging.error(f"Failed to collect data for endpoint '{namespace}': {e}", exc_info=True)
-            return 0, {namespace: str(e)}, {}
-
-    with ThreadPoolExecutor(max_workers=len(noga2_types)) as executor:
-        future_to_type = {executor.submit(process_type, a_type): a_type for a_type in noga2_types}
-        for future in as_completed(future_to_type):
-            count, failed, new_keys = future.result()
-            total_inserted_count += count
-            failed_endpoints_details.update(failed)
-            all_new_keys.update(new_keys)
-
+            failed_endpoints_details[namespace] = "Could not determine a start date"
+            continue
+        # windows don't cross settled_until so that each of them is either complete or not
+        windows = [window for range_start, range_end in ranges
+                   for part in ((range_start, min(range_end, settled_until)),
+                                (max(range_start, settled_until + datetime.timedelta(days=1)), range_end))
+                   for window in date_windows(part[0], part[1], window_days)]
+        logging.info(f"Requesting data for {namespace} in {len(windows)} windows: " +
+                     ", ".join(f"{a.strftime(DATE_FORMAT)} - {b.strftime(DATE_FORMAT)}" for a, b in ranges))
+        counts[namespace] = 0
+        window_counts[namespace] = len(windows)
+        failed_windows[namespace] = []
+        all_new_keys[namespace] = set()
+        windows_per_type.append([(a_type, window) for window in windows])
+
+    # interleave the types so that the requests aren't all waiting on the same endpoint
+    all_windows = [w for ws in itertools.zip_longest(*windows_per_type) for w in ws if w]
+    results = asyncio.run(fetch_windows(store, all_windows, all_new_keys, settled_until))
+    for (a_type, window), result in zip(all_windows, results):
+        namespace = "noga2." + a_type
+        if isinstance(result, Exception):
+            # Log the error but continue with the other windows
+            from_date, to_date = window[0].strftime(DATE_FORMAT), window[1].strftime(DATE_FORMAT)
+            logging.error(f"Failed to collect data for '{namespace}' from {from_date} to {to_date}: {result}",
+                          exc_info=result)
+            failed_windows[namespace].append(f"{from_date} - {to_date}: {result}")
+        else:
+            counts[namespace] += result
+
+    for namespace, count in counts.items():
+        if failed_windows[namespace]:
+            failed = failed_windows[namespace]
+            failed_endpoints_details[namespace] = (f"{len(failed)} of {window_counts[namespace]} windows failed: " +
+                                                   "; ".join(sorted(failed)))
+        elif count:
+            logging.info(f"Successfully inserted {count} values for {namespace}.")
+        else:
+            logging.info(f"No new data found for {namespace} in the specified range.")
+            failed_endpoints_details[namespace] = "No new data"
+
+    total_inserted_count = sum(counts.values())
+    all_new_keys = {namespace: keys for namespace, keys in all_new_keys.items() if keys}
     return_message = f"Inserted {total_inserted_count} values into storage."
     if failed_endpoints_details:
         for namespace, reason in failed_endpoints_details.items():
@@ -99,65 +152,177 @@ def update(store, noga_type, start_date, end_date):
         return_message += f"\nNew keys: {all_new_keys}."
     return return_message
 
-def store_results(store, result):
-    values = []
+
+async def fetch_windows(store, windows, new_keys, settled_until):
+    """Fetch and store the (type, window) windows concurrently, recording them in the ingestion ledger.
+    Returns the number of values stored, or the exception raised, for every window."""
+    async with noga_client.NogaClient(UPDATE_WORKERS, UPDATE_ENDPOINT_CONCURRENCY) as client:
+        return await asyncio.gather(*[fetch_window(client, store, a_type, window, new_keys["noga2." + a_type],
+                                                   settled_until) for a_type, window in windows],
+                                    return_exceptions=True)
+
+
+async def fetch_window(client, store, a_type, window, new_keys, settled_until):
+    namespace = "noga2." + a_type
+    data_type = NOGA2_TYPE_MAPPING[a_type]
+    label_mapping = noga_labels.NS_LABEL_POST_MAP[a_type]
+    from_date, to_date = window[0].strftime(DATE_FORMAT), window[1].strftime(DATE_FORMAT)
+
+    async def fetch_and_store():
+        # Values are stored in batches, in a thread, while the response is still being read
+        logging.info("Request noga2.%s data from %s to %s using HTTP POST", a_type, from_date, to_date)
+        count = 0
+        values = []
+        async for day_item in client.post_stream(data_type.path, from_date, to_date, data_type.token,
+                                                 data_type.dict_key):
+            for entry in iter_values_from_post_response([day_item], label_mapping, new_keys):
+                values.extend(iter_values(namespace, [entry]))
+            if len(values) >= STORE_BATCH_SIZE:
+                count += await asyncio.to_thread(store_values, store, values)
+                values = []
+        count += await asyncio.to_thread(store_values, store, values)
+        logging.info("Inserted %s values of %s from %s to %s into storage", count, namespace, from_date, to_date)
+        return count
+
+    count = await with_retries_async(fetch_and_store, f"{namespace} from {from_date} to {to_date}")
+    # an empty window may be data the API didn't publish yet, it is fetched again until it has values
+    complete = window[1] <= settled_until and count > 0
+    await asyncio.to_thread(store.record_window, namespace, from_date, to_date, count, complete)
+    return count
+
+
+def date_windows(start, end, days):
+    """Split the inclusive range between two dates into consecutive (from, to) windows of up to days days."""
+    windows = []
+    while start <= end:
+        window_end = min(start + datetime.timedelta(days=days - 1), end)
+        windows.append((start, window_end))
+        start = window_end + datetime.timedelta(days=1)
+    return windows
+
+
+def completed_windows(store, namespace, type_start_date, settled_until):
+    """The (from, to) date windows of namespace in the ingestion ledger. A namespace without any is seeded
+    once from the latest date in the storage, as collected before there was a ledger."""
+    windows = [(parse_date(from_date), parse_date(to_date))
+               for from_date, to_date in store.completed_windows(namespace)]
+    if windows:
+        return windows
+    latest_date = store.latest_date(namespace)
+    if latest_date:
+        # the latest date itself may be partial
+        until = min(parse_date(latest_date) - datetime.timedelta(days=1), settled_until)
+        if parse_date(type_start_date) <= until:
+            logging.info(f"Seeding the ingestion ledger of {namespace} until {until.strftime(DATE_FORMAT)}")
+            store.record_window(namespace, type_start_date, until.strftime(DATE_FORMAT), None, True)
+            windows = [(parse_date(type_start_date), until)]
+    return windows
+
+
+def missing_ranges(start, end, completed):
+    """The (from, to) date ranges between start and end that are not covered by the completed windows."""
+    ranges = []
+    for done_start, done_end in sorted(completed):
+        if done_end < start:
+            continue
+        if done_start > end:
+            break
+        if done_start > start:
+            ranges.append((start, done_start - datetime.timedelta(days=1)))
+        start = max(start, done_end + datetime.timedelta(days=1))
+    if start <= end:
+        ranges.append((start, end))
+    return ranges
+
+
+def parse_date(date):
+    return datetime.date.fromisoformat(fix_date(date.replace("/", "-")))
+
+
+async def with_retries_async(function, description):
+    """Await function(), retrying up to UPDATE_RETRIES times in total with exponential backoff."""
+    delay = UPDATE_RETRY_DELAY
+    for attempt in range(1, UPDATE_RETRIES + 1):
+        try:
+            return await function()
+        except Exception as e:
+            if attempt == UPDATE_RETRIES:
+                raise
+            logging.warning(f"{description} failed (attempt {attempt} of {UPDATE_RETRIES}): {e}. "
+                            f"Retrying in {delay} seconds.")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+
+def iter_values(namespace, entries):
+    """Yield a (namespace, date, time, tag, value) tuple for every tag of every entry."""
+    for entry in entries:
+        date0 = entry.get("Date")
+        date = date0.replace("/", "-")
+        time = entry.get("Time")
+        for tag in [key for key in entry.keys()
+                    if key not in ["Date", "Time", "FileDate", "IsOnBlobList"] and entry.get(key) != "-"]:
+            match = pattern_value.match(str(entry.get(tag)).strip())
+            val = match.group(0)
+            if val == '':
+                continue
+            yield namespace, date, time[0:5], tag, val
+
+
+def store_values(store, values):
     count = 0
-    total_count = 0
-    for namespace in result:
-        for entry in result.get(namespace):
-            date0 = entry.get("Date")
-            date = date0.replace("/", "-")
-            time = entry.get("Time")
-            for tag in [key for key in entry.keys()
-                        if key not in ["Date", "Time", "FileDate", "IsOnBlobList"] and entry.get(key) != "-"]:
-                match = re.match(r'-?[0-9.]+', str(entry.get(tag)).strip())
-                val = match.group(0)
-                if val == '':
-                    continue
-                values.append((namespace, date, time[0:5], tag, val))
-                count = count + 1
-                total_count = total_count + 1
-                if count > 100:
-                    store.bulk_insert(values)
-                    values = []
-                    count = 0
-    if values:
-        store.bulk_insert(values)
-    logging.info("Inserted %s values into storage", total_count)
-    return total_count
+    for batch in batches(values, STORE_BATCH_SIZE):
+        store.bulk_insert(batch)
+        count += len(batch)
+        if write_listeners:
+            notify_write(batch)
+    return count
+
+
+def notify_write(values):
+    date_ranges = {}
+    for value in values:
+        date = fix_date(value[1])
+        date_range = date_ranges.get(value[0])
+        if date_range is None:
+            date_ranges[value[0]] = [date, date]
+        elif date < date_range[0]:
+            date_range[0] = date
+        elif date > date_range[1]:
+            date_range[1] = date
+    for namespace, (from_date, to_date) in date_ranges.items():
+        for listener in write_listeners:
+            listener(namespace, from_date, to_date)
 
 
 def upload(store, f):
+    return upload_bytes(store, f.filename, f.read())
+
+
+def upload_bytes(store, filename, data):
     # Only supports uploading files with titles in Hebrew
-    xl_file = tempfile.NamedTemporaryFile()
     try:
-        logging.debug("Saving file %s locally as %s", f.filename, xl_file.name)
-        f.save(xl_file.name)
-        logging.debug("Reading local file %s", xl_file.name)
-        df = pd.read_excel(xl_file.name, header=1)
-        logging.debug("Done reading local file %s", xl_file.name)
+        logging.debug("Reading file %s with the %s engine", filename, EXCEL_ENGINE or "default")
+        df = pd.read_excel(io.BytesIO(data), header=1, engine=EXCEL_ENGINE)
+        logging.debug("Done reading file %s", filename)
         labels = df.columns.values.tolist()
         logging.info("Labels in file: %s", labels)
         namespace, new_labels = noga_labels.new_labels(labels)
-        logging.info("Namespace for %s is %s", f.filename, namespace)
+        logging.info("Namespace for %s is %s", filename, namespace)
         df.columns = new_labels  # rename columns
-        if isinstance(df['Time'][1], datetime.time):
-            df['Time'] = df['Time'].apply(lambda x: str(x))
-        if isinstance(df['Date'][1], datetime.datetime):
-            df['Date'] = df['Date'].apply(lambda x: x.strftime('%d-%m-%Y'))
+        values = df_to_values(namespace, df)
     except ValueError as ve:
         logging.error("Error: " + str(ve))
         return {"failure": str(ve)}
-    finally:
-        xl_file.close()
-    json_list = df_to_json(df)
-    result = {namespace: json_list}
-    count = store_results(store, result)
+    count = store_values(store, values)
+    logging.info("Inserted %s values into storage", count)
     return {"success": True, "count": count}
 
 
-def get(store, source, noga_type, start_date, end_date, tag, time="hour"):
-    noga_types = NOGA2_TYPE_MAPPING if noga_type == "all" else [noga_type] if noga_type else NOGA2_TYPE_MAPPING
+def get(store, source, noga_type, start_date, end_date, tag, time="hour", after=None):
+    """after (HH:MM) keeps only the values of start_date with a later time, e.g. to get just the values
+    stored since a previous call."""
+    noga_types = get_types(noga_type)
     start_date = start_date or one_month_ago()
     logging.info("Retrieving %s data with type(s) %s from %s until %s with \"%s\" interval and tag \"%s\"",
                  source, ", ".join(noga_types), start_date, end_date, time, tag)
@@ -165,11 +330,48 @@ def get(store, source, noga_type, start_date, end_date, tag, time="hour"):
     for a_type in noga_types:
         data = store.retrieve_range(source + "." + a_type, start_date, end_date, time=time, tag=tag)
         result.update(data)
+    if after:
+        after = unfix_time(after)
+        first_date = unfix_date(fix_date(start_date))
+        for values in result.values():
+            if first_date in values:
+                values[first_date] = {t: tags for t, tags in values[first_date].items() if t > after}
+                if not values[first_date]:
+                    del values[first_date]
     for key in result:
         logging.info("Retrieved {} items of type {}".format(sum(len(v) for v in result[key].values()), key))
     return result
 
 
+def iter_rows(store, source, noga_type, start_date, end_date, tag, time="hour", after=None):
+    """The values of get() as batches of (namespace, date, time, tag, value) rows,
+    ordered by namespace, date and time. Values are read from storage as the batches are consumed."""
+    start_date = start_date or one_month_ago()
+    first_date = unfix_date(fix_date(start_date))
+    after = unfix_time(after) if after else None
+    for a_type in get_types(noga_type):
+        for rows in store.iter_range(source + "." + a_type, start_date, end_date, tag=tag, time=time):
+            if after:
+                rows = [row for row in rows if row[1] != first_date or row[2] > after]
+            if rows:
+                yield rows
+
+
+def get_tags(store, source, noga_type, start_date, end_date, tag):
+    """Tags of the values of get(), in the order of their types."""
+    if tag:
+        return [tag]
+    start_date = start_date or one_month_ago()
+    tags = {}
+    for a_type in get_types(noga_type):
+        tags.update(dict.fromkeys(store.range_tags(source + "." + a_type, start_date, end_date)))
+    return list(tags)
+
+
+def get_types(noga_type):
+    return NOGA2_TYPE_MAPPING if noga_type == "all" else [noga_type] if noga_type else NOGA2_TYPE_MAPPING
+
+
 def one_month_ago():
     date = datetime.date.today() + relativedelta(months=-1)
     return date.strftime("%d-%m-%Y")
@@ -191,9 +393,7 @@ def date_str(date_ordinal):
     return datetime.datetime.fromordinal(date_ordinal).strftime("%d/%m/%Y")
 
 
-def extract_values_from_post_response(jsons, mapping):
-    values = []
-    new_keys_logged = set()
+def iter_values_from_post_response(jsons, mapping, new_keys_logged):
     for day_item in jsons:
         date = day_item['date']
         time_items_key = next(k for k in day_item if k != 'date')
@@ -209,62 +409,51 @@ def extract_values_from_post_response(jsons, mapping):
                         logging.error("New key '%s' in noga2 response", k)
                         new_keys_logged.add(k)
                     continue
-            values.append(value)
-    return values, new_keys_logged
-
-def request_data(noga_type, start_date, end_date):
-    data_type = NOGA2_TYPE_MAPPING.get(noga_type)
-    logging.info("Request noga2.%s data from %s to %s using HTTP POST",
-                 noga_type, start_date, end_date)
-    if data_type is None:
-        return {"error": "Unrecognized Noga type"}
-    jsons = noga_post(data_type.path, start_date, end_date, data_type.token)
-    jsons = jsons[data_type.dict_key] if data_type.dict_key else jsons
-    label_mapping = noga_labels.NS_LABEL_POST_MAP[noga_type]
-    json_list, new_keys = extract_values_from_post_response(jsons, label_mapping)
-    logging.info("Received %s values for noga2.%s", len(json_list), noga_type)
-    return json_list, new_keys
-
-
-POST_URL = "https://apim-api.noga-iso.co.il/"
-
-
-def noga_post(path, from_date, to_date, token):
-    hdr = {
-        'Content-Type': 'application/json',
-        'Cache-Control': 'no-cache',
-        'Ocp-Apim-Subscription-Key': noga_tokens.decrypt_token(token, noga_tokens.NOGA_KEY)
-    }
-    data = json.dumps({"fromDate": from_date, "toDate": to_date})
-    req = urllib.request.Request(POST_URL + path, headers=hdr, data=bytes(data.encode("utf-8")))
-    req.get_method = lambda: 'POST'
-    response = urllib.request.urlopen(req)
-    return json.loads(response.read().decode("utf-8"))
-
-
-def df_to_json(df):
-    labels = df.columns.values.tolist()
-    logging.info("Labels: %s", labels)
-    df.drop(columns=[label for label in labels if label[:7] == "Unnamed"], inplace=True)
-    labels = df.columns.values.tolist()
-    new_labels = [camel_no_unit(label) for label in labels]
-    logging.info("New labels: %s", new_labels)
-    df.columns = new_labels  # rename columns
+            yield value
+
+
+def df_to_values(namespace, df):
+    """(namespace, date, time, tag, value) tuples of a frame with Date and Time columns and a column per tag,
+    melted a row after the other. Values are converted to numbers a column at a time, empty values, "-"
+    and values that don't start with a number are skipped."""
+    df = df.loc[:, [not label.startswith("Unnamed") for label in df.columns]]
+    df.columns = [camel_no_unit(label) for label in df.columns]
+    logging.info("New labels: %s", df.columns.values.tolist())
     count_before = len(df.index)
-    df.drop_duplicates(inplace=True)
-    count_after = len(df.index)
-    if count_after < count_before:
-        logging.info("Dropped duplicates. Before: %s. After: %s.", count_before, count_after)
-    json_list = []
-    for row in df.itertuples():
-        json_row = {"Date": row.Date, "Time": row.Time}
-        for i in range(2, len(labels)):
-            json_row[new_labels[i]] = str(row[i+1])
-        json_list.append(json_row)
-    return json_list
+    df = df.drop_duplicates()
+    if len(df.index) < count_before:
+        logging.info("Dropped duplicates. Before: %s. After: %s.", count_before, len(df.index))
+    if pd.api.types.is_datetime64_any_dtype(df["Date"]):
+        dates = df["Date"].dt.strftime(DATE_FORMAT)
+    else:  # text, or text and datetimes mixed
+        dates = df["Date"].map(lambda date: date.strftime(DATE_FORMAT) if isinstance(date, datetime.date)
+                               else str(date).replace("/", "-"))
+    times = df["Time"].astype(str).str[0:5]
+    tags = [label for label in df.columns if label not in ["Date", "Time", "FileDate", "IsOnBlobList"]]
+    numbers = np.column_stack([to_numbers(df.iloc[:, i]) for i, label in enumerate(df.columns) if label in tags])
+    keep = ~np.isnan(numbers.ravel())
+    return list(zip(itertools.repeat(namespace),
+                    np.repeat(dates.to_numpy(), len(tags))[keep].tolist(),
+                    np.repeat(times.to_numpy(), len(tags))[keep].tolist(),
+                    np.tile(np.array(tags, dtype=object), len(df.index))[keep].tolist(),
+                    numbers.ravel()[keep].tolist()))
+
+
+def to_numbers(column):
+    """Column as a float array, NaN where there's no number. Text values are taken up to the first
+    character that isn't part of a number, like pattern_value."""
+    if pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=float)
+    numbers = pd.to_numeric(column, errors="coerce")
+    text = numbers.isna() & column.notna()
+    if text.any():
+        numbers[text] = pd.to_numeric(column[text].astype(str).str.strip().str.extract(r"^(-?[0-9.]+)", expand=False),
+                                      errors="coerce")
+    return numbers.to_numpy(dtype=float)
 
 
 pattern_units = re.compile(r" [\[(].*[\])]")
+pattern_value = re.compile(r'-?[0-9.]+')
 
 
 def camel_no_unit(s):
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+import scripts.json_stream as json_stream
+import scripts.metrics as metrics
+import scripts.noga_tokens as noga_tokens
+
+POST_URL = "https://apim-api.noga-iso.co.il/"
+RESPONSE_CHUNK_SIZE = 64 * 1024
+NOGA_RATE_LIMIT = float(os.environ.get("NOGA_RATE_LIMIT", 4))  # requests started per second per endpoint, 0: none
+NOGA_KEEPALIVE = float(os.environ.get("NOGA_KEEPALIVE", 30))  # seconds an idle connection is kept
+NOGA_READ_TIMEOUT = float(os.environ.get("NOGA_READ_TIMEOUT", 300))  # seconds without response data
+
+
+def post_headers(token):
+    return {
+        'Content-Type': 'application/json',
+        'Cache-Control': 'no-cache',
+        'Accept-Encoding': 'gzip, deflate',
+        'Ocp-Apim-Subscription-Key': noga_tokens.decrypt_token(token, noga_tokens.NOGA_KEY)
+    }
+
+
+def post_data(from_date, to_date):
+    return json.dumps({"fromDate": from_date, "toDate": to_date}).encode("utf-8")
+
+
+class NogaClient:
+    """Asynchronous client of the NOGA API, used as an async context manager on a single event loop.
+
+    Connections are kept alive and reused between requests. Requests to the same endpoint are limited to
+    endpoint_concurrency at a time and rate_limit started per second. Responses may be gzip compressed."""
+
+    def __init__(self, connections=8, endpoint_concurrency=2, rate_limit=NOGA_RATE_LIMIT, url=POST_URL):
+        self.connections = connections
+        self.endpoint_concurrency = endpoint_concurrency
+        self.rate_limit = rate_limit
+        self.url = url
+        self._session = None
+        self._semaphores = {}
+        self._limiters = {}
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=NOGA_KEEPALIVE),
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=NOGA_READ_TIMEOUT),
+            trust_env=True)  # proxy from HTTPS_PROXY, like urllib
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def post_stream(self, path, from_date, to_date, token, key=None):
+        """Async generator of the items of the response array (or of its key), parsed as they arrive."""
+        semaphore = self._semaphores.setdefault(path, asyncio.Semaphore(self.endpoint_concurrency))
+        limiter = self._limiters.setdefault(path, _RateLimiter(self.rate_limit))
+        endpoint = path.split("/")[0]
+        async with semaphore:
+            await limiter.wait()
+            with metrics.NOGA_FETCH_SECONDS.time(endpoint):
+                async with self._session.post(self.url + path, headers=post_headers(token),
+                                              data=post_data(from_date, to_date)) as response:
+                    response.raise_for_status()
+                    parser = json_stream.JsonArrayStream(key)
+                    async for chunk in response.content.iter_chunked(RESPONSE_CHUNK_SIZE):
+                        metrics.NOGA_FETCH_BYTES.inc(len(chunk), endpoint)
+                        for item in parser.feed(chunk):
+                            yield item
+                    for item in parser.close():
+                        yield item
+
+
+class _RateLimiter:
+    """Spaces the calls to wait() at least 1 / rate seconds apart."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
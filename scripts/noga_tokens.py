@@ -1,5 +1,6 @@
 # Encrypted noga tokens. Need correct key to decrypt.
 import base64
+import functools
 import os
 from cryptography.fernet import Fernet
 
@@ -15,6 +16,7 @@ def encrypt_token(token, key):
     return Fernet(key).encrypt(token.encode())
 
 
+@functools.lru_cache(maxsize=None)
 def decrypt_token(encrypted_token, key):
     return Fernet(key).decrypt(encrypted_token).decode()
 
@@ -6,16 +6,16 @@ import logging
 from collections import defaultdict
 from typing import Dict, List, Tuple, Optional, Any
 
-from scripts import utils, noga
+from scripts import data_service, noga
 
 MAIN_GRAPH_ID = "main-graph"
 YEAR_RANGE_SLIDER = "year-range-slider"
 YEAR_FROM: int = 2021
 YEAR_TO: int = 2060  # excluding
 
-YEAR_URL = "http://0.0.0.0:9999/get?source=noga&type=cost&start_date=01-01-2021&end_date=31-12-2023&time=month"
-NEW_DATA_DEMAND_URL = "http://0.0.0.0:9999/get?source=noga2&type=energy&tag=ActualDemand&start_date=01-01-2024&time=month"
-NEW_DATA_REN_URL = "http://0.0.0.0:9999/get?source=noga2&type=energy&tag=RenewableSum&start_date=01-01-2024&time=month"
+YEAR_QUERY = dict(source="noga", data_type="cost", start_date="01-01-2021", end_date="31-12-2023", time="month")
+NEW_DATA_DEMAND_QUERY = dict(source="noga2", data_type="energy", tag="ActualDemand", start_date="01-01-2024", time="month")
+NEW_DATA_REN_QUERY = dict(source="noga2", data_type="energy", tag="RenewableSum", start_date="01-01-2024", time="month")
 
 months_list = calendar.month_abbr[1:]
 
@@ -43,15 +43,15 @@ def retrieve_data() -> Tuple[Dict[str, Any], int]:
     
     if cached_year_data is None:
         # Old noga data is retrieved only once
-        json_list = utils.retrieve_url(YEAR_URL)
+        json_list = data_service.get(**YEAR_QUERY)
         if json_list:
             cached_year_data = json_list["noga.cost"]
 
     if cached_year_data:
         cost_data_all.update(cached_year_data)
 
-    json_demand = utils.retrieve_url(NEW_DATA_DEMAND_URL)
-    json_ren = utils.retrieve_url(NEW_DATA_REN_URL)
+    json_demand = data_service.get(**NEW_DATA_DEMAND_QUERY)
+    json_ren = data_service.get(**NEW_DATA_REN_QUERY)
 
     if json_demand and json_ren:
         demand_data = json_demand.get("noga2.energy", {})
@@ -73,8 +73,8 @@ def retrieve_data() -> Tuple[Dict[str, Any], int]:
                         renewable = float(ren_val) / 6
                         conventional = demand - renewable
                         
-                        if date not in cost_data_all:
-                            cost_data_all[date] = {"00:00": {}}
+                        # Copy rather than update in place, the retrieved data may be shared
+                        cost_data_all[date] = {"00:00": dict(cost_data_all.get(date, {}).get("00:00", {}))}
                         cost_data_all[date]["00:00"][noga.COST_REN] = renewable
                         cost_data_all[date]["00:00"][noga.COST_CONV] = conventional
                     else:
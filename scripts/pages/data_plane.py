@@ -0,0 +1,139 @@
+"""Heatmap matrices shared between processes through memory-mapped files.
+
+With CHART_DATA_DIR set (preferably on a tmpfs such as /dev/shm), the process that reads the store in process
+(see data_service) publishes the matrix of every source as .npy files there after each refresh, along with a
+manifest holding a version counter. The other chart processes, e.g. Dash workers or charts run apart from the
+server, map the files read-only instead of retrieving the data and holding a copy each, and map them again only
+when the version changes. CHART_DATA_ROLE=publish or read sets the role of a process explicitly.
+A process that finds nothing published retrieves the data itself, as without CHART_DATA_DIR."""
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from scripts import data_service
+from .day_matrix import DayMatrix
+
+CHART_DATA_DIR = os.environ.get("CHART_DATA_DIR")
+CHART_DATA_ROLE = os.environ.get("CHART_DATA_ROLE", "auto")  # publish, read or auto: publish if reading the store
+MANIFEST = "manifest.json"
+ARRAYS = ["dates", "values", "summary"]
+
+_lock = threading.Lock()
+_published = {}  # publisher: source -> (matrix version, file prefix)
+_version = None  # publisher: the version of the last manifest written; reader: of the matrices mapped
+_manifest_mtime = None
+_matrices = {}  # reader: source -> mapped DayMatrix
+_prefixes = {}  # reader: source -> file prefix of its mapped matrix
+
+
+def publishing():
+    return bool(CHART_DATA_DIR) and (CHART_DATA_ROLE == "publish" or
+                                     CHART_DATA_ROLE == "auto" and data_service.store is not None)
+
+
+def reading():
+    return bool(CHART_DATA_DIR) and (CHART_DATA_ROLE == "read" or
+                                     CHART_DATA_ROLE == "auto" and data_service.store is None)
+
+
+def publish(matrices):
+    """Write the {source: DayMatrix} matrices that changed since they were last published and a new version of
+    the manifest, then remove the files of the previous versions. Nothing is written if nothing changed."""
+    global _version
+    with _lock:
+        changed = {source: matrix for source, matrix in matrices.items()
+                   if _published.get(source, (None,))[0] != matrix.version}
+        if not changed and set(_published) == set(matrices):
+            return
+        os.makedirs(CHART_DATA_DIR, exist_ok=True)
+        if _version is None:  # continue the counter of a previous publisher, readers compare versions
+            _version = (_read_manifest() or {}).get("version", 0)
+        _version += 1
+        for index, (source, matrix) in enumerate(changed.items()):
+            prefix = "{}.{}".format(_version, index)
+            arrays = {"dates": np.array(matrix.dates, dtype="datetime64[s]"),
+                      "values": matrix.values(),
+                      "summary": matrix.summary().to_numpy()}
+            for name, array in arrays.items():
+                _write_atomic(_path(prefix, name), lambda f, array=array: np.save(f, array))
+            _published[source] = (matrix.version, prefix)
+        for source in set(_published) - set(matrices):
+            del _published[source]
+        manifest = {"version": _version,
+                    "sources": {source: {"prefix": prefix, "version": version}
+                                for source, (version, prefix) in _published.items()}}
+        _write_atomic(os.path.join(CHART_DATA_DIR, MANIFEST),
+                      lambda f: f.write(json.dumps(manifest).encode("utf-8")))
+        _remove_unpublished()
+        logging.info("Published version %s of the chart data, %s source(s) changed", _version, len(changed))
+
+
+def load():
+    """The published {source: DayMatrix} matrices mapped read-only, or None if nothing is published.
+    The matrices of sources that didn't change since the last call are the same objects."""
+    global _version, _manifest_mtime, _matrices
+    try:
+        mtime = os.stat(os.path.join(CHART_DATA_DIR, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _lock:
+        if mtime == _manifest_mtime:
+            return _matrices
+        manifest = _read_manifest()
+        if manifest is None:
+            return _matrices or None
+        if manifest["version"] != _version:
+            try:
+                matrices = {source: _matrices[source] if _prefixes.get(source) == entry["prefix"]
+                            else _map(entry["prefix"], entry["version"])
+                            for source, entry in manifest["sources"].items()}
+            except FileNotFoundError:  # replaced by a newer version meanwhile, map that one on the next call
+                logging.info("Chart data version %s was replaced while mapping it", manifest["version"])
+                return _matrices or None
+            _matrices = matrices
+            _prefixes.clear()
+            _prefixes.update({source: entry["prefix"] for source, entry in manifest["sources"].items()})
+            _version = manifest["version"]
+            logging.info("Mapped version %s of the chart data", _version)
+        _manifest_mtime = mtime
+        return _matrices
+
+
+def _map(prefix, version):
+    dates, values, summary = (np.load(_path(prefix, name), mmap_mode="r") for name in ARRAYS)
+    return DayMatrix.mapped(dates.tolist(), values, summary, version)
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(CHART_DATA_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _path(prefix, name):
+    return os.path.join(CHART_DATA_DIR, "{}.{}.npy".format(prefix, name))
+
+
+def _write_atomic(path, write):
+    """Readers see either the previous file or the complete new one."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def _remove_unpublished():
+    """Readers that mapped the files keep their mapping until they map a newer version."""
+    published = {_path(prefix, name) for _, prefix in _published.values() for name in ARRAYS}
+    for name in os.listdir(CHART_DATA_DIR):
+        path = os.path.join(CHART_DATA_DIR, name)
+        if name.endswith(".npy") and path not in published:
+            try:
+                os.remove(path)
+            except OSError as ex:
+                logging.warning("Could not remove %s: %s", path, ex)
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+SLOT_MINUTES = 5
+SLOTS = 24 * 60 // SLOT_MINUTES
+TIMES = ["{:02d}:{:02d}".format(m // 60, m % 60) for m in range(0, 24 * 60, SLOT_MINUTES)]
+SLOT_INDEX = {time: slot for slot, time in enumerate(TIMES)}
+SLOT_HOURS = SLOT_MINUTES / 60
+# Columns of the daily summary: sum of the values, min, max, energy (MWh) of the positive and of the negative
+# values, and the fraction of the time slots that have a value
+SUMMARY_COLUMNS = ["sum", "min", "max", "positive_energy", "negative_energy", "coverage"]
+
+
+class DayMatrix:
+    """Values of a 5 minute series as a (time slot x date) matrix, the layout of the heatmap.
+
+    Dates are added at the end in place: columns are allocated ahead, so adding a date doesn't copy
+    the existing data, and frame() is a DataFrame over the same memory. Missing values are 0.
+    A summary row per date is kept up to date with the values of that date, see summary()."""
+
+    def __init__(self, capacity=64):
+        self._values = np.zeros((SLOTS, capacity))
+        self._present = np.zeros((SLOTS, capacity), dtype=bool)
+        self._summary = np.zeros((capacity, len(SUMMARY_COLUMNS)))
+        self._columns = {}
+        self.dates = []
+        self.version = 0  # incremented on every change
+        self.read_only = False
+        self._frame = None
+        self._summary_frame = None
+
+    @classmethod
+    def mapped(cls, dates, values, summary, version):
+        """A read-only matrix over (time slot x date) values and their summary held elsewhere, e.g. arrays
+        mapped from files by data_plane. It can't be updated."""
+        matrix = cls(capacity=0)
+        matrix._values = values
+        matrix._present = None
+        matrix._summary = summary
+        matrix._columns = {date: column for column, date in enumerate(dates)}
+        matrix.dates = dates
+        matrix.version = version
+        matrix.read_only = True
+        return matrix
+
+    def update(self, date, values):
+        """Set the {HH:MM: value} values of date. Times off the 5 minute grid are ignored.
+        date must be one of the dates already held or later than all of them."""
+        if self.read_only:
+            raise ValueError("A mapped matrix can't be updated")
+        column = self._column(date)
+        for time, value in values.items():
+            slot = SLOT_INDEX.get(time)
+            if slot is not None:
+                self._values[slot, column] = value
+                self._present[slot, column] = True
+        self._summarize(column)
+        self.version += 1
+        self._frame = None
+        self._summary_frame = None
+
+    def values(self):
+        """The (time slot x date) values, a view of the matrix."""
+        return self._values[:, :len(self.dates)]
+
+    def frame(self):
+        """The values as a DataFrame indexed by time with a column per date. Shares memory with the matrix."""
+        if self._frame is None:
+            self._frame = pd.DataFrame(self._values[:, :len(self.dates)], copy=False,
+                                       index=pd.Index(TIMES, name="Time"),
+                                       columns=pd.DatetimeIndex(self.dates, name="Date"))
+        return self._frame
+
+    def summary(self):
+        """The daily summary as a DataFrame indexed by date with the SUMMARY_COLUMNS columns."""
+        if self._summary_frame is None:
+            self._summary_frame = pd.DataFrame(self._summary[:len(self.dates)], copy=False,
+                                               index=pd.DatetimeIndex(self.dates, name="Date"),
+                                               columns=SUMMARY_COLUMNS)
+        return self._summary_frame
+
+    def _summarize(self, column):
+        values = self._values[:, column]
+        self._summary[column] = (values.sum(), values.min(), values.max(),
+                                 values[values > 0].sum() * SLOT_HOURS, values[values < 0].sum() * SLOT_HOURS,
+                                 self._present[:, column].sum() / SLOTS)
+
+    def _column(self, date):
+        column = self._columns.get(date)
+        if column is not None:
+            return column
+        if self.dates and date < self.dates[-1]:
+            raise ValueError("Date {} is before the last date {}".format(date, self.dates[-1]))
+        column = len(self.dates)
+        if column == self._values.shape[1]:
+            self._values = _grow(self._values, 1)
+            self._present = _grow(self._present, 1)
+            self._summary = _grow(self._summary, 0)
+        self.dates.append(date)
+        self._columns[date] = column
+        return column
+
+
+def _grow(array, axis):
+    """Copy of array with twice the size along axis, the new part zero."""
+    shape = list(array.shape)
+    shape[axis] *= 2
+    grown = np.zeros(shape, dtype=array.dtype)
+    grown[tuple(slice(0, n) for n in array.shape)] = array
+    return grown
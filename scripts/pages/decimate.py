@@ -0,0 +1,83 @@
+"""Decimation of long series to a number of points that depends on the width of the chart in pixels,
+so that the figures sent to the browser stay bounded for long date ranges."""
+from dash import dcc, Input, Output, clientside_callback
+import numpy as np
+
+WIDTH_STORE_ID = "window-width-store"
+DEFAULT_WIDTH = 1200  # pixels, until the browser reports the window width
+MIN_WIDTH = 300
+POINTS_PER_PIXEL = 2
+
+
+def width_store():
+    return dcc.Store(id=WIDTH_STORE_ID)
+
+
+def register_width_callback(trigger):
+    """Store the browser window width when trigger, an Input, changes."""
+    clientside_callback(
+        "function(_) { return window.innerWidth; }",
+        Output(WIDTH_STORE_ID, 'data'),
+        trigger
+    )
+
+
+def max_points(width, per_pixel=POINTS_PER_PIXEL):
+    """Number of points worth drawing across a chart as wide as the window."""
+    return max(int(width or DEFAULT_WIDTH), MIN_WIDTH) * per_pixel
+
+
+def lttb(x, y, n):
+    """Largest-Triangle-Three-Buckets: indices of n points of (x, y) that keep the shape of the line.
+    x must be increasing and numeric. Returns all the indices if there are no more than n points."""
+    size = len(y)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)  # n - 2 buckets between the first and the last point
+    indices = np.empty(n, dtype=int)
+    indices[0], indices[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < n - 1 else size
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(areas.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def min_max(values, n):
+    """Indices of the min and the max of each of n / 2 equal buckets of values, in order.
+    values may be 1-D, or 2-D to decimate each row, giving a row of indices per row.
+    Returns all the indices if there are no more than n values."""
+    values = np.asarray(values, dtype=float)
+    rows = values.reshape(-1, values.shape[-1])
+    size = rows.shape[1]
+    if n >= size or n < 2:
+        indices = np.broadcast_to(np.arange(size), rows.shape)
+    else:
+        width = -(-size // (n // 2))  # bucket width, rounded up
+        buckets = -(-size // width)
+        padded = np.pad(rows, ((0, 0), (0, buckets * width - size)), mode='edge').reshape(len(rows), buckets, width)
+        offsets = np.arange(buckets) * width
+        low = padded.argmin(axis=2) + offsets
+        high = padded.argmax(axis=2) + offsets
+        indices = np.sort(np.minimum(np.stack([low, high], axis=2).reshape(len(rows), -1), size - 1), axis=1)
+    return indices.reshape(values.shape[:-1] + indices.shape[-1:])
+
+
+def mean_bins(values, n):
+    """Average the columns of a 2-D array in bins of consecutive columns so that there are at most n columns.
+    Returns (binned values, index of the first column of each bin)."""
+    values = np.asarray(values, dtype=float)
+    size = values.shape[1]
+    if n >= size or n < 1:
+        return values, np.arange(size)
+    width = -(-size // n)
+    starts = np.arange(0, size, width)
+    sums = np.add.reduceat(values, starts, axis=1)
+    counts = np.diff(np.append(starts, size))
+    return sums / counts, starts
@@ -4,9 +4,10 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime
 import logging
-import pandas as pd
 
-from scripts import utils
+from scripts import data_service
+from . import data_plane, decimate, render_pool
+from .day_matrix import DayMatrix
 
 HEATMAP_ID = "heatmap-graph"
 SOURCES_ID = "sources-radioitems"
@@ -17,7 +18,9 @@ MODE_ABSOLUTE = "Absolute"
 MODE_PERCENT = "Percent"
 
 select_source = "Pv"
-start_date = "01-01-2024"
+FIRST_DATE = "01-01-2024"
+start_date = FIRST_DATE
+after = None  # the last time of start_date held, the next call only asks for later values
 
 last_call = datetime.fromtimestamp(0)  # epoch
 
@@ -36,9 +39,9 @@ BLUE_RED_COLORSCALE = [
     [1, 'rgb(215, 50, 40)']
 ]
 
-dfs = {}
+matrices = {}
+dfs = {}  # DataFrame views of matrices
 dfs_heatmap = None
-dfs_zero = None
 sources = []
 
 global_freeze_source = None  # The source for which the scale is frozen
@@ -51,20 +54,27 @@ last_scatter_yrange = {MODE_ABSOLUTE: None, MODE_PERCENT: None}
 
 
 def retrieve_data():
-    global last_call, dfs_zero, sources, dfs, start_date
+    global last_call, sources, start_date, after
+    if data_plane.reading() and map_published():
+        return
+    if any(matrix.read_only for matrix in matrices.values()):
+        # the published matrices are gone, retrieve them all in this process instead
+        logging.info("No published chart data, retrieving it")
+        matrices.clear()
+        dfs.clear()
+        start_date, after, last_call = FIRST_DATE, None, datetime.fromtimestamp(0)
     time_since_last_call = datetime.now() - last_call
     if time_since_last_call.total_seconds() < 3600:
         logging.info("Time since last call: {} seconds. No URL call.".format(int(time_since_last_call.total_seconds())))
         return
 
-    heatmap_url = f'http://0.0.0.0:9999/get?source=noga2&type=energy&start_date={start_date}&time=all&format=bin'
-    json_list = utils.retrieve_url(heatmap_url)
-    e = dict(sorted(json_list["noga2.energy"].items(), key=lambda d: datetime.strptime(d[0], "%d-%m-%Y")))
-    d2 = {}
-    date = None
-    for _date, time_dict in e.items():
-        date = datetime.strptime(_date, "%d-%m-%Y")
-        for time, sources_dict in time_dict.items():
+    json_list = data_service.get("noga2", "energy", start_date=start_date, time="all", after=after) or {}
+    e = json_list.get("noga2.energy", {})
+    updated = set()
+    for _date in sorted(e, key=lambda d: (d[6:10], d[3:5], d[0:2])):
+        date = datetime(int(_date[6:10]), int(_date[3:5]), int(_date[0:2]))
+        d2 = {}
+        for time, sources_dict in e[_date].items():
             # Noga has spurious data on 03-07-2025,14:36 and 28-05-2024,12:18
             if time == '12:18':
                 time = '12:15'  # No data for 12:15 so use 12:18 instead.
@@ -72,20 +82,37 @@ def retrieve_data():
                 continue  # There are points for 14:35 and 14:40, so just skip it.
             for source, value in sources_dict.items():
                 s = "Diesel" if source == "Solar" else source
-                d2.setdefault(s, {}).setdefault(date, {})[time] = value
-    start_date = date.strftime("%d-%m-%Y")
-    for source, date_dict in d2.items():
-        df = pd.DataFrame(date_dict).fillna(0)
-        df.index.name = "Time"
-        df.columns.name = "Date"
-        df = df.reindex(sorted(df.columns), axis=1).sort_index()
-        if source in dfs:
-            dfs[source] = df.combine_first(dfs[source])
-        else:
-            dfs[source] = df
-    dfs_zero = pd.DataFrame(0, index=dfs[select_source].index, columns=dfs[select_source].columns)
-    sources = [s for s in list(d2.keys()) if s not in ["DemandManagement", "Renewables"]]
+                d2.setdefault(s, {})[time] = value
+        for source, time_dict in d2.items():
+            if source not in matrices:
+                matrices[source] = DayMatrix()
+            matrices[source].update(date, time_dict)
+            updated.add(source)
+        if e[_date]:
+            start_date, after = _date, max(e[_date])
+    for source in updated:
+        dfs[source] = matrices[source].frame()
+    sources = [s for s in matrices if s not in ["DemandManagement", "Renewables"]]
     last_call = datetime.now()
+    if data_plane.publishing():
+        data_plane.publish(matrices)
+
+
+def map_published():
+    """Use the matrices published by another process (see data_plane) instead of retrieving them.
+    False if there are none."""
+    global sources
+    published = data_plane.load()
+    if published is None:
+        return False
+    for source in [s for s in matrices if s not in published]:
+        del matrices[source], dfs[source]
+    for source, matrix in published.items():
+        if matrices.get(source) is not matrix:
+            matrices[source] = matrix
+            dfs[source] = matrix.frame()
+    sources = [s for s in matrices if s not in ["DemandManagement", "Renewables"]]
+    return True
 
 
 def compute_percent_df(source_df, demand_df):
@@ -163,9 +190,10 @@ def register_callbacks(app):
         Output(HEATMAP_ID, 'figure'),
         [Input(SOURCES_ID, 'value'),
          Input(FREEZE_SCALE_ID, 'value'),
-         Input(DISPLAY_MODE_ID, 'value')]
+         Input(DISPLAY_MODE_ID, 'value'),
+         Input(decimate.WIDTH_STORE_ID, 'data')]
     )
-    def update_heatmap_output(source, freeze_scale_value, display_mode):
+    def update_heatmap_output(source, freeze_scale_value, display_mode, width):
         global dfs, global_freeze_source, last_zrange, last_scatter_yrange
         freeze_checked = FREEZE_SCALE_VALUE in freeze_scale_value
         is_percent = display_mode == MODE_PERCENT
@@ -193,18 +221,9 @@ def register_callbacks(app):
         else:
             dfs_heatmap = source_df
 
-        n_y = len(dfs_heatmap.index) / 4
-
-        if is_percent:
-            scatter_y = dfs_heatmap.mean()
-            scatter_hover = '<i>%{x} : %{y:,.1f}%</i><extra></extra>'
-            scatter_yaxis_label = "%"
-            heatmap_hover = '<i>%{x} %{y}</i><br>%{z:,.1f}%<extra></extra>'
-        else:
-            scatter_y = dfs_heatmap.sum() / 12
-            scatter_hover = '<i>%{x} : %{y:,.2f} MWh</i><extra></extra>'
-            scatter_yaxis_label = "MWh"
-            heatmap_hover = '<i>%{x} %{y}</i><br>%{z:,.2f} MW<extra></extra>'
+        # Per-date statistics of the absolute values come from the matrix summary, percents are computed
+        summary = None if is_percent else matrices[source].summary()
+        scatter_y = dfs_heatmap.mean() if is_percent else summary["sum"] / 12
 
         # Decide the scatter Y range to apply.
         #
@@ -228,8 +247,12 @@ def register_callbacks(app):
             scatter_yrange = current_data_yrange
 
         # Heatmap Z range — same pattern as scatter Y range.
-        current_zmin = dfs_heatmap.min().min()
-        current_zmax = dfs_heatmap.max().max()
+        if summary is None:
+            current_zmin = dfs_heatmap.min().min()
+            current_zmax = dfs_heatmap.max().max()
+        else:
+            current_zmin = summary["min"].min()
+            current_zmax = summary["max"].max()
         if freeze_checked:
             if last_zrange[display_mode] is None:
                 last_zrange[display_mode] = [current_zmin, current_zmax]
@@ -238,50 +261,75 @@ def register_callbacks(app):
             last_zrange[display_mode] = [current_zmin, current_zmax]
             zmin, zmax = current_zmin, current_zmax
 
-        fig = make_subplots(rows=2, cols=1, row_heights=[100, 600], vertical_spacing=0.05, shared_xaxes=True)
-
-        fig.add_trace(
-            go.Scatter(
-                x=dfs_heatmap.columns.values,
-                y=scatter_y,
-                hovertemplate=scatter_hover
-            ),
-            row=1, col=1)
-
-        fig.add_trace(
-            go.Heatmap(
-                x=dfs_heatmap.columns.values,
-                y=dfs_heatmap.index,
-                z=dfs_heatmap,
-                colorscale=BLUE_RED_COLORSCALE,
-                zmin=zmin,
-                zmax=zmax,
-                colorbar={
-                    'len': 0.8,
-                    'y': 0.4,
-                    'ticksuffix': '%' if is_percent else ''
-                },
-                hovertemplate=heatmap_hover
-            ),
-            row=2, col=1)
-
-        fig.update_xaxes(showticklabels=False, row=1, col=1)
-        # Always set an explicit range on the scatter Y axis — this is the only reliable
-        # way to control it. Plotly ignores uirevision for axis range when new trace data
-        # is provided, so we must own the range completely rather than delegating to Plotly.
-        fig.update_yaxes(title_text=scatter_yaxis_label, range=scatter_yrange, col=1, row=1)
-        fig.update_yaxes(
-            tickvals=[0, n_y - 1, n_y * 2 - 1, n_y * 3 - 1, n_y * 4 - 1],
-            ticktext=['00:00', '06:00', '12:00', '18:00', '24:00'],
-            row=2, col=1)
-        fig.update_layout(
-            height=800,
-            uirevision=True,
-            title=go.layout.Title(
-                x=0.5,
-                xanchor='center',
-                font={"family": "Hebrew", "size": 36},
-                text='תמהיל הייצור'
-            ),
-        )
-        return fig
\ No newline at end of file
+        data = {
+            "values": dfs_heatmap.to_numpy(),
+            "dates": dfs_heatmap.columns.values,
+            "times": list(dfs_heatmap.index),
+            "scatter_y": scatter_y.to_numpy(),
+        }
+        return render_pool.render(heatmap_figure, data, is_percent, zmin, zmax, scatter_yrange, width)
+
+
+def heatmap_figure(data, is_percent, zmin, zmax, scatter_yrange, width):
+    """The daily values over the heatmap of the values (times x dates) of data, with the dates averaged in
+    bins of about a pixel of width."""
+    n_y = len(data["times"]) / 4
+    if is_percent:
+        scatter_hover = '<i>%{x} : %{y:,.1f}%</i><extra></extra>'
+        scatter_yaxis_label = "%"
+        heatmap_hover = '<i>%{x} %{y}</i><br>%{z:,.1f}%<extra></extra>'
+    else:
+        scatter_hover = '<i>%{x} : %{y:,.2f} MWh</i><extra></extra>'
+        scatter_yaxis_label = "MWh"
+        heatmap_hover = '<i>%{x} %{y}</i><br>%{z:,.2f} MW<extra></extra>'
+
+    # No more than a column of cells per pixel: average the dates of long ranges in bins
+    heatmap_z, bin_starts = decimate.mean_bins(data["values"], decimate.max_points(width, per_pixel=1))
+
+    fig = make_subplots(rows=2, cols=1, row_heights=[100, 600], vertical_spacing=0.05, shared_xaxes=True)
+
+    fig.add_trace(
+        go.Scatter(
+            x=data["dates"],
+            y=data["scatter_y"],
+            hovertemplate=scatter_hover
+        ),
+        row=1, col=1)
+
+    fig.add_trace(
+        go.Heatmap(
+            x=data["dates"][bin_starts],
+            y=data["times"],
+            z=heatmap_z,
+            colorscale=BLUE_RED_COLORSCALE,
+            zmin=zmin,
+            zmax=zmax,
+            colorbar={
+                'len': 0.8,
+                'y': 0.4,
+                'ticksuffix': '%' if is_percent else ''
+            },
+            hovertemplate=heatmap_hover
+        ),
+        row=2, col=1)
+
+    fig.update_xaxes(showticklabels=False, row=1, col=1)
+    # Always set an explicit range on the scatter Y axis — this is the only reliable
+    # way to control it. Plotly ignores uirevision for axis range when new trace data
+    # is provided, so we must own the range completely rather than delegating to Plotly.
+    fig.update_yaxes(title_text=scatter_yaxis_label, range=scatter_yrange, col=1, row=1)
+    fig.update_yaxes(
+        tickvals=[0, n_y - 1, n_y * 2 - 1, n_y * 3 - 1, n_y * 4 - 1],
+        ticktext=['00:00', '06:00', '12:00', '18:00', '24:00'],
+        row=2, col=1)
+    fig.update_layout(
+        height=800,
+        uirevision=True,
+        title=go.layout.Title(
+            x=0.5,
+            xanchor='center',
+            font={"family": "Hebrew", "size": 36},
+            text='תמהיל הייצור'
+        ),
+    )
+    return fig
@@ -0,0 +1,112 @@
+"""Building of the large figures in worker processes, so that concurrent callbacks don't wait for each other on the GIL.
+
+With RENDER_PROCESSES workers, render() passes the numeric arrays of the data to a worker through shared memory
+instead of pickling them, and the worker returns the figures as dicts, which Dash sends like figures.
+With 0 (the default), or when the pool fails, the figures are built in the calling thread.
+
+The workers import the main module again (as __mp_main__), which must not start anything outside of
+`if __name__ == "__main__"`."""
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import plotly.graph_objects as go
+
+RENDER_PROCESSES = int(os.environ.get("RENDER_PROCESSES", 0))
+# fork isn't safe once the server threads run
+RENDER_START_METHOD = os.environ.get("RENDER_START_METHOD",
+                                     "forkserver" if sys.platform.startswith("linux") else "spawn")
+PRELOADED_MODULES = ["numpy", "pandas", "plotly.graph_objects"]
+
+_executor = None
+_lock = threading.Lock()
+
+
+def render(function, data, *args):
+    """function(data, *args) with data a dict, in a worker process if there is a pool.
+    Exceptions of function are raised as they are, a failure of the pool falls back to the calling thread."""
+    executor = _pool()
+    if executor is None:
+        return function(data, *args)
+    blocks = []
+    try:
+        shared = {}
+        for name, value in data.items():
+            if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+                block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+                blocks.append(block)
+                np.ndarray(value.shape, value.dtype, buffer=block.buf)[...] = value
+                shared[name] = (block.name, value.shape, value.dtype.str)
+        rest = {name: value for name, value in data.items() if name not in shared}
+        future = executor.submit(_render, function, shared, rest, args)
+    except (BrokenProcessPool, OSError) as ex:
+        _close(blocks)
+        return _fallback(executor, function, ex, data, args)
+    try:
+        return future.result()
+    except BrokenProcessPool as ex:
+        return _fallback(executor, function, ex, data, args)
+    finally:
+        _close(blocks)
+
+
+def _pool():
+    global _executor
+    if RENDER_PROCESSES <= 0:
+        return None
+    with _lock:
+        if _executor is None:
+            context = multiprocessing.get_context(RENDER_START_METHOD)
+            if RENDER_START_METHOD == "forkserver":
+                context.set_forkserver_preload(PRELOADED_MODULES)
+            _executor = ProcessPoolExecutor(max_workers=RENDER_PROCESSES, mp_context=context)
+            logging.info("Rendering in %s worker processes (%s)", RENDER_PROCESSES, RENDER_START_METHOD)
+        return _executor
+
+
+def _fallback(executor, function, ex, data, args):
+    """Render in this thread and drop the pool, the next render starts a new one."""
+    global _executor
+    logging.warning("Rendering %s in a worker failed, rendering in this thread: %s", function.__name__, ex)
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+    return function(data, *args)
+
+
+def _close(blocks):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+def _render(function, shared, rest, args):
+    """Runs in a worker: the data with views of the shared arrays, and the result with figures as dicts."""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in shared.values()]
+    data = dict(rest)
+    try:
+        for (key, (_, shape, dtype)), block in zip(shared.items(), blocks):
+            data[key] = np.ndarray(shape, dtype, buffer=block.buf)
+        return _plain(function(data, *args))
+    finally:
+        data.clear()
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:  # a view is still referenced, by a raised exception, the mapping goes with it
+                pass
+
+
+def _plain(result):
+    if isinstance(result, go.Figure):
+        return result.to_dict()
+    if isinstance(result, tuple):
+        return tuple(_plain(item) for item in result)
+    return result
@@ -1,10 +1,14 @@
 from dash import dcc, html, Input, Output, clientside_callback, callback_context
 import plotly.graph_objects as go
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import bisect
 import logging
 import math
+import threading
 import numpy as np
-from . import heatmap
+from . import decimate, heatmap, render_pool
+from .day_matrix import SLOT_HOURS, SLOT_MINUTES, SLOTS, TIMES
 
 STORAGE_ID = "storage-graph"
 STORAGE_STORE_ID = "storage-graph-store"
@@ -22,6 +26,12 @@ BTN_YEAR_ID = "btn-last-year"
 # Constants for XY graph time range
 XY_START_TIME = datetime(1900, 1, 1, 0, 0)
 XY_END_TIME = datetime(1900, 1, 2, 0, 0)
+XY_TIMES = np.array([XY_START_TIME + timedelta(minutes=m) for m in range(0, 24 * 60, SLOT_MINUTES)])
+TIME_STRS = np.array(TIMES)
+
+# Time slots as polar angles and as offsets from midnight
+THETA = np.arange(SLOTS) * SLOT_MINUTES * 360 / (24 * 60)
+SLOT_OFFSETS = np.arange(SLOTS) * np.timedelta64(SLOT_MINUTES, 'm')
 
 VALUE_BATTERIES = 'BatteriesNet'
 VALUE_PSP = 'PspNet'
@@ -35,16 +45,25 @@ last_start_date = None
 last_end_date = None
 last_source = VALUE_BATTERIES
 
+# Aggregates and figures of the latest ranges, keyed by (source, start, end, matrix version)
+AGGREGATES_CACHE_SIZE = 16
+_aggregates = OrderedDict()
+_range_figures = OrderedDict()  # key + (points,)
+_main_figures = OrderedDict()  # key + (points per day, is_xy)
+_cache_lock = threading.Lock()
+
+# The per-day traces of long ranges are decimated to about this many points per pixel of width in total,
+# but not to less than MIN_DAY_POINTS points per day
+MAIN_POINTS_PER_PIXEL = 20
+MIN_DAY_POINTS = 24
+
 def get_date_range_bounds():
     # Helper to get min/max allowed dates based on data
-    if not heatmap.dfs:
+    if not heatmap.matrices:
         heatmap.retrieve_data()
-        
-    all_dates = []
-    if heatmap.dfs:
-        for source_df in heatmap.dfs.values():
-            all_dates.extend(source_df.columns)
-    
+
+    all_dates = [d for matrix in heatmap.matrices.values() if matrix.dates for d in (matrix.dates[0], matrix.dates[-1])]
+
     today = datetime.now().date()
     yesterday = today - timedelta(days=1)
     
@@ -237,9 +256,10 @@ def register_callbacks(app):
          Input(GRAPH_TYPE_ID, 'value'),
          Input(BTN_WEEK_ID, 'n_clicks'),
          Input(BTN_MONTH_ID, 'n_clicks'),
-         Input(BTN_YEAR_ID, 'n_clicks')]
+         Input(BTN_YEAR_ID, 'n_clicks'),
+         Input(decimate.WIDTH_STORE_ID, 'data')]
     )
-    def update_storage_graph(start_date, end_date, source, graph_type, _btn_week, _btn_month, _btn_year):
+    def update_storage_graph(start_date, end_date, source, graph_type, _btn_week, _btn_month, _btn_year, width):
         global last_start_date, last_end_date, last_source
         
         ctx = callback_context
@@ -271,314 +291,328 @@ def register_callbacks(app):
         # Ensure data is available (refresh if needed, handled by retrieve_data logic)
         heatmap.retrieve_data()
         
-        if source not in heatmap.dfs:
-            logging.warning(f"Source {source} not found in heatmap.dfs")
+        if source not in heatmap.matrices:
+            logging.warning(f"Source {source} not found in heatmap.matrices")
             return go.Figure(), go.Figure(), go.Figure(), go.Figure(), [], start_date, end_date, min_date_allowed, max_date_allowed
-            
-        df = heatmap.dfs[source]
-        
+
+        matrix = heatmap.matrices[source]
+
         if start_date:
             dt_start = datetime.fromisoformat(start_date).replace(hour=0, minute=0, second=0, microsecond=0)
         else:
             dt_start = datetime.min
-            
+
         if end_date:
             dt_end = datetime.fromisoformat(end_date).replace(hour=0, minute=0, second=0, microsecond=0)
         else:
             dt_end = datetime.max
-            
-        # Filter columns by date
-        cols = [c for c in df.columns if dt_start <= c <= dt_end]
-        df_filtered = df[cols]
-        
-        if df_filtered.empty:
+
+        key = (source, dt_start, dt_end, matrix.version)
+        aggregates = _memoized(_aggregates, key, lambda: range_aggregates(matrix, dt_start, dt_end))
+        if aggregates is None:
             return go.Figure(), go.Figure(), go.Figure(), go.Figure(), [], start_date, end_date, min_date_allowed, max_date_allowed
 
-        fig_main = go.Figure()
-        fig_cum = go.Figure()
-        fig_daily = go.Figure()
-        fig_daily_energy = go.Figure()
-        
-        times = df_filtered.index.tolist()
-        dt_times = [datetime.strptime(t, "%H:%M") for t in times]
-        theta = [(dt.hour + dt.minute / 60.0) * 360 / 24 for dt in dt_times]
-        
-        # Vectorized calculations
-        # Calculate time difference in hours for each time step
-        # Assuming times are sorted and consistent
-        time_objs = [datetime.strptime(t, "%H:%M") for t in times]
-        diff_seconds = [(time_objs[i+1] - time_objs[i]).total_seconds() for i in range(len(time_objs)-1)]
-        diff_seconds.append(300.0) # Assume 5 minutes for the last interval
-        diff_hours = np.array(diff_seconds) / 3600.0
-        
-        # Calculate energy for all points (Power * Time)
-        # df_filtered is (Time x Date), diff_hours is (Time,)
-        # We multiply each column by diff_hours
-        energy_df = df_filtered.mul(diff_hours, axis=0)
-        
-        # Global Stats
-        total_positive_energy = energy_df[energy_df > 0].sum().sum()
-        total_negative_energy = energy_df[energy_df < 0].sum().sum()
-        max_power_discharging_total = df_filtered.max().max()
-        max_power_charging_total = df_filtered.min().min()
-        
-        # Ensure max stats are bounded by 0 as per original logic (only if they cross 0)
-        if max_power_discharging_total < 0: max_power_discharging_total = 0
-        if max_power_charging_total > 0: max_power_charging_total = 0
+        points = decimate.max_points(width)
+        fig_cum, fig_daily, fig_daily_energy, info_children = _memoized(
+            _range_figures, key + (points,), lambda: render_pool.render(range_figures, aggregates, points))
+        day_points = max(decimate.max_points(width, MAIN_POINTS_PER_PIXEL) // len(aggregates["dates"]), MIN_DAY_POINTS)
+        fig_main = _memoized(_main_figures, key + (day_points, is_xy),
+                             lambda: render_pool.render(main_figure, aggregates, source, is_xy, day_points))
 
-        # Daily Stats
-        daily_max_discharge = df_filtered.max().clip(lower=0)
-        daily_max_charge = df_filtered.min().clip(upper=0)
-        
-        daily_energy_discharge = energy_df[energy_df > 0].sum()
-        daily_energy_charge = energy_df[energy_df < 0].sum()
-        
-        # Cumulative Energy
-        # Flatten energy values column by column (chronological)
-        sorted_cols = sorted(df_filtered.columns)
-        df_sorted = df_filtered[sorted_cols]
-        energy_sorted = energy_df[sorted_cols]
-        
-        flat_energy = energy_sorted.values.flatten(order='F')
-        cumulative_y = np.cumsum(flat_energy)
-        
-        # Construct cumulative x-axis
-        # This creates a full datetime for every point
-        time_deltas = [timedelta(hours=t.hour, minutes=t.minute) for t in time_objs]
-        cumulative_x = []
-        for d in sorted_cols:
-            cumulative_x.extend([d + t for t in time_deltas])
-
-        # Main Graph Traces
-        # We still iterate to add traces per day to allow for individual hover info and potential future interactivity
-        for i, date_col in enumerate(sorted_cols):
-            series = df_sorted[date_col]
-            power_values = series.values
-            date_str = date_col.strftime('%d-%m-%Y')
-            
-            # Create customdata for hover (Power, Time, Date)
-            # We can construct this efficiently
-            # But zip is fast enough for per-day slices
-            custom_data_for_hover = list(zip(power_values, times, [date_str]*len(times)))
-            
-            if is_xy:
-                fig_main.add_trace(go.Scattergl(
-                    x=dt_times,
-                    y=power_values,
-                    customdata=custom_data_for_hover,
-                    mode='lines',
-                    name=date_str,
-                    hovertemplate='Date: %{customdata[2]}<br>Time: %{customdata[1]}<br>Power: %{y:.2f} MW<extra></extra>',
-                    showlegend=False,
-                    line=dict(width=1.5)
-                ))
-            else:
-                fig_main.add_trace(go.Scatterpolargl(
-                    r=power_values,
-                    theta=theta,
-                    customdata=custom_data_for_hover,
-                    mode='markers',
-                    marker=dict(
-                        size=6
-                    ),
-                    name=date_str,
-                    hovertemplate='Date: %{customdata[2]}<br>Time: %{customdata[1]}<br>Power: %{customdata[0]:.2f} MW<extra></extra>',
-                    showlegend=False
-                ))
-
-        # Add cumulative energy trace
-        fig_cum.add_trace(go.Scatter(
-            x=cumulative_x,
-            y=cumulative_y,
+        return fig_main, fig_cum, fig_daily, fig_daily_energy, info_children, start_date, end_date, min_date_allowed, max_date_allowed
+
+
+def _memoized(cache, key, compute):
+    """Return cache[key], computing it on a miss. Keeps the AGGREGATES_CACHE_SIZE most recently used keys."""
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            return value
+    value = compute()
+    if value is not None:
+        with _cache_lock:
+            cache[key] = value
+            while len(cache) > AGGREGATES_CACHE_SIZE:
+                cache.popitem(last=False)
+    return value
+
+
+def range_aggregates(matrix, dt_start, dt_end):
+    """Power and cumulative energy of the dates of matrix between dt_start and dt_end as (days x slots) arrays,
+    with their daily and total statistics taken from the matrix summary. None if there are no dates in the range."""
+    lo = bisect.bisect_left(matrix.dates, dt_start)
+    hi = bisect.bisect_right(matrix.dates, dt_end)
+    if lo >= hi:
+        return None
+    dates = matrix.dates[lo:hi]
+    power = np.ascontiguousarray(matrix.values()[:, lo:hi].T)  # days x slots
+    summary = matrix.summary().iloc[lo:hi]
+    daily_max = summary["max"].to_numpy()
+    daily_min = summary["min"].to_numpy()
+    daily_energy_discharge = summary["positive_energy"].to_numpy()
+    daily_energy_charge = summary["negative_energy"].to_numpy()
+    return {
+        "dates": dates,
+        "date_strs": [d.strftime('%d-%m-%Y') for d in dates],
+        "power": power,
+        "min_power": float(daily_min.min()),
+        "max_power": float(daily_max.max()),
+        "daily_max_discharge": daily_max.clip(min=0),
+        "daily_max_charge": daily_min.clip(max=0),
+        "daily_energy_discharge": daily_energy_discharge,
+        "daily_energy_charge": daily_energy_charge,
+        "total_positive_energy": float(daily_energy_discharge.sum()),
+        "total_negative_energy": float(daily_energy_charge.sum()),
+        "cumulative_x": (np.array(dates, dtype='datetime64[m]')[:, None] + SLOT_OFFSETS).ravel(),
+        "cumulative_y": np.cumsum(power.ravel() * SLOT_HOURS),
+    }
+
+
+def range_figures(aggregates, points):
+    """The cumulative energy, daily power and daily energy figures and the info panel of a range.
+    The cumulative energy is decimated to the given number of points."""
+    fig_cum = go.Figure()
+    fig_daily = go.Figure()
+    fig_daily_energy = go.Figure()
+    dates = aggregates["dates"]
+    cumulative_y = aggregates["cumulative_y"]
+    indices = decimate.lttb(np.arange(len(cumulative_y)), cumulative_y, points)
+
+    # Add cumulative energy trace
+    fig_cum.add_trace(go.Scatter(
+        x=aggregates["cumulative_x"][indices],
+        y=cumulative_y[indices],
+        mode='lines',
+        name='Cumulative Energy',
+        line=dict(color='blue'),
+        hovertemplate='%{x}<br>Energy: %{y:,.2f} MWh<extra></extra>'
+    ))
+
+    # Add daily max charge/discharge traces
+    fig_daily.add_trace(go.Scatter(
+        x=dates,
+        y=aggregates["daily_max_discharge"],
+        mode='lines+markers',
+        name='Max Discharge',
+        line=dict(color=COLOR_DISCHARGE),
+        hovertemplate='Date: %{x}<br>Max Discharge: %{y:,.2f} MW<extra></extra>'
+    ))
+
+    fig_daily.add_trace(go.Scatter(
+        x=dates,
+        y=-aggregates["daily_max_charge"],  # Negate to show as positive
+        mode='lines+markers',
+        name='Max Charge',
+        line=dict(color=COLOR_CHARGE),
+        hovertemplate='Date: %{x}<br>Max Charge: %{y:,.2f} MW<extra></extra>'
+    ))
+
+    # Add daily energy charge/discharge traces
+    fig_daily_energy.add_trace(go.Scatter(
+        x=dates,
+        y=aggregates["daily_energy_discharge"],
+        mode='lines+markers',
+        name='Energy Discharge',
+        line=dict(color=COLOR_DISCHARGE),
+        hovertemplate='Date: %{x}<br>Energy Discharge: %{y:,.2f} MWh<extra></extra>'
+    ))
+
+    fig_daily_energy.add_trace(go.Scatter(
+        x=dates,
+        y=-aggregates["daily_energy_charge"],  # Negate to show as positive
+        mode='lines+markers',
+        name='Energy Charge',
+        line=dict(color=COLOR_CHARGE),
+        hovertemplate='Date: %{x}<br>Energy Charge: %{y:,.2f} MWh<extra></extra>'
+    ))
+
+    # Max stats are bounded by 0 (only if they cross 0)
+    max_power_discharging_total = max(aggregates["max_power"], 0)
+    max_power_charging_total = min(aggregates["min_power"], 0)
+    total_positive_energy = aggregates["total_positive_energy"]
+    total_negative_energy = aggregates["total_negative_energy"]
+    efficiency = total_positive_energy / -total_negative_energy if total_negative_energy != 0 else 0
+
+    info_children = html.Div([
+        html.P(f'פריקה מקסימלית: {max_power_discharging_total:,.2f} MW', style={'fontSize': '20px'}),
+        html.P(f'טעינה מקסימלית: {-max_power_charging_total:,.2f} MW', style={'fontSize': '20px'}),
+        html.P(f'נצילות: {efficiency:.2%}', style={'fontSize': '20px'})
+    ])
+
+    # Cumulative Figure Layout
+    fig_cum.update_layout(
+        title=go.layout.Title(text="אנרגיה מצטברת (MWh)", x=0.5, xanchor='center', font={"family": "Hebrew", "size": 24}),
+        paper_bgcolor='white',
+        plot_bgcolor='white',
+        dragmode=False,
+        xaxis=dict(title="זמן", gridcolor='lightgrey', fixedrange=True),
+        yaxis=dict(title="אנרגיה (MWh)", gridcolor='lightgrey', fixedrange=True, zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
+        margin=dict(l=40, r=40, t=40, b=40),
+        showlegend=False
+    )
+
+    # Daily Figure Layout
+    fig_daily.update_layout(
+        title=go.layout.Title(text="הספק מקסימלי יומי (MW)", x=0.5, xanchor='center', font={"family": "Hebrew", "size": 24}),
+        paper_bgcolor='white',
+        plot_bgcolor='white',
+        dragmode=False,
+        xaxis=dict(title="תאריך", gridcolor='lightgrey', fixedrange=True),
+        yaxis=dict(title="הספק (MW)", gridcolor='lightgrey', fixedrange=True, rangemode='tozero', zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
+        margin=dict(l=40, r=40, t=40, b=40),
+        showlegend=False
+    )
+
+    # Daily Energy Figure Layout
+    fig_daily_energy.update_layout(
+        title=go.layout.Title(text="אנרגיה יומית (MWh)", x=0.5, xanchor='center', font={"family": "Hebrew", "size": 24}),
+        paper_bgcolor='white',
+        plot_bgcolor='white',
+        dragmode=False,
+        xaxis=dict(title="תאריך", gridcolor='lightgrey', fixedrange=True),
+        yaxis=dict(title="אנרגיה (MWh)", gridcolor='lightgrey', fixedrange=True, rangemode='tozero', zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
+        margin=dict(l=40, r=40, t=40, b=40),
+        showlegend=False
+    )
+
+    return fig_cum, fig_daily, fig_daily_energy, info_children
+
+
+def main_figure(aggregates, source, is_xy, day_points):
+    """The per-day power figure of a range, XY or polar, with the days decimated to day_points points each.
+    All the days are in a single trace, so that the figure stays bounded for long ranges."""
+    fig_main = go.Figure()
+    power = aggregates["power"]
+    slots = decimate.min_max(power, day_points)
+    power_values = np.take_along_axis(power, slots, axis=1)
+    date_strs = np.array(aggregates["date_strs"], dtype=object)
+
+    def hover_data(day_slots):  # the date and the time of every point
+        return np.column_stack([np.repeat(date_strs, day_slots.shape[1]), TIME_STRS[day_slots].ravel()])
+
+    if is_xy:
+        # The days are separated by a NaN point so that the line of one day doesn't continue into the next
+        gap_slots = np.column_stack([slots, slots[:, -1]])
+        gap_values = np.column_stack([power_values, np.full(len(power_values), np.nan)])
+        fig_main.add_trace(go.Scattergl(
+            x=XY_TIMES[gap_slots].ravel(),
+            y=gap_values.ravel(),
+            customdata=hover_data(gap_slots),
             mode='lines',
-            name='Cumulative Energy',
-            line=dict(color='blue'),
-            hovertemplate='%{x}<br>Energy: %{y:,.2f} MWh<extra></extra>'
-        ))
-        
-        # Add daily max charge/discharge traces
-        fig_daily.add_trace(go.Scatter(
-            x=daily_max_discharge.index,
-            y=daily_max_discharge.values,
-            mode='lines+markers',
-            name='Max Discharge',
-            line=dict(color=COLOR_DISCHARGE),
-            hovertemplate='Date: %{x}<br>Max Discharge: %{y:,.2f} MW<extra></extra>'
-        ))
-        
-        fig_daily.add_trace(go.Scatter(
-            x=daily_max_charge.index,
-            y=-daily_max_charge.values, # Negate to show as positive
-            mode='lines+markers',
-            name='Max Charge',
-            line=dict(color=COLOR_CHARGE),
-            hovertemplate='Date: %{x}<br>Max Charge: %{y:,.2f} MW<extra></extra>'
-        ))
-        
-        # Add daily energy charge/discharge traces
-        fig_daily_energy.add_trace(go.Scatter(
-            x=daily_energy_discharge.index,
-            y=daily_energy_discharge.values,
-            mode='lines+markers',
-            name='Energy Discharge',
-            line=dict(color=COLOR_DISCHARGE),
-            hovertemplate='Date: %{x}<br>Energy Discharge: %{y:,.2f} MWh<extra></extra>'
+            connectgaps=False,
+            hovertemplate='Date: %{customdata[0]}<br>Time: %{customdata[1]}<br>Power: %{y:.2f} MW<extra></extra>',
+            showlegend=False,
+            line=dict(width=1.5)
         ))
-        
-        fig_daily_energy.add_trace(go.Scatter(
-            x=daily_energy_charge.index,
-            y=-daily_energy_charge.values, # Negate to show as positive
-            mode='lines+markers',
-            name='Energy Charge',
-            line=dict(color=COLOR_CHARGE),
-            hovertemplate='Date: %{x}<br>Energy Charge: %{y:,.2f} MWh<extra></extra>'
+    else:
+        fig_main.add_trace(go.Scatterpolargl(
+            r=power_values.ravel(),
+            theta=THETA[slots].ravel(),
+            customdata=hover_data(slots),
+            mode='markers',
+            marker=dict(
+                size=6
+            ),
+            hovertemplate='Date: %{customdata[0]}<br>Time: %{customdata[1]}<br>Power: %{r:.2f} MW<extra></extra>',
+            showlegend=False
         ))
 
-        efficiency = total_positive_energy / -total_negative_energy if total_negative_energy != 0 else 0
+    title_text = 'אגירה בסוללות' if source == VALUE_BATTERIES else 'אגירה שאובה'
 
-        info_children = html.Div([
-            html.P(f'פריקה מקסימלית: {max_power_discharging_total:,.2f} MW', style={'fontSize': '20px'}),
-            html.P(f'טעינה מקסימלית: {-max_power_charging_total:,.2f} MW', style={'fontSize': '20px'}),
-            html.P(f'נצילות: {efficiency:.2%}', style={'fontSize': '20px'})
-        ])
+    # Main Figure Layout
+    if is_xy:
+        tickvals = [datetime(1900, 1, 1, h, 0) for h in range(0, 24, 3)]
+        tickvals.append(XY_END_TIME)
+        ticktext = [f"{h:02d}:00" for h in range(0, 24, 3)] + ["24:00"]
 
-        title_text = 'אגירה בסוללות' if source == VALUE_BATTERIES else 'אגירה שאובה'
-
-        # Main Figure Layout
-        if is_xy:
-            tickvals = [datetime(1900, 1, 1, h, 0) for h in range(0, 24, 3)]
-            tickvals.append(XY_END_TIME)
-            ticktext = [f"{h:02d}:00" for h in range(0, 24, 3)] + ["24:00"]
-            
-            # Ensure the range covers 24:00 with a small padding
-            range_x = [XY_START_TIME - timedelta(minutes=10), XY_END_TIME + timedelta(minutes=10)]
-            
-            fig_main.update_layout(
-                title=go.layout.Title(
-                    x=0.5, xanchor='center', font={"family": "Hebrew", "size": 36}, text=title_text
-                ),
-                paper_bgcolor='white',
-                plot_bgcolor='white',
-                dragmode=False,
-                xaxis=dict(
-                    title="זמן", 
-                    gridcolor='lightgrey', 
-                    tickformat="%H:%M", 
-                    fixedrange=True,
-                    tickvals=tickvals,
-                    ticktext=ticktext,
-                    range=range_x # Explicitly set range to include 24:00 with padding
-                ),
-                yaxis=dict(title="הספק (MW)", gridcolor='lightgrey', fixedrange=True, zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
-                margin=dict(l=40, r=40, t=60, b=40),
-                showlegend=False
-            )
-            
-        else:
-            # Polar Layout
-            all_power_values_flat = df_sorted.values.flatten()
-            if len(all_power_values_flat) > 0:
-                min_p, max_p = min(all_power_values_flat), max(all_power_values_flat)
-                span = max_p - min_p if max_p != min_p else 1.0
-                
-                target_step = span / 6
-                magnitude = 10 ** math.floor(math.log10(target_step)) if target_step > 0 else 1
-                rescaled_step = target_step / magnitude
-                
-                nice_options = [1, 2, 2.5, 5, 10]
-                closest_nice_step = min(nice_options, key=lambda x: abs(x - rescaled_step))
-                nice_step = closest_nice_step * magnitude
-                
-                r_min = math.floor(min_p / nice_step) * nice_step
-                r_max = math.ceil(max_p / nice_step) * nice_step
-                
-                # Extend r_min by one step
-                r_min -= nice_step
-                
-                tickvals = []
-                curr = r_min
-                while curr <= r_max + (nice_step / 1000):
-                    tickvals.append(curr)
-                    curr += nice_step
-            else:
-                r_min, r_max = -1, 1
-                tickvals = [-1, 0, 1]
-                nice_step = 1
-            
-            range_vals = [r_min, r_max + (nice_step / 10) if len(all_power_values_flat) > 0 else 1]
+        # Ensure the range covers 24:00 with a small padding
+        range_x = [XY_START_TIME - timedelta(minutes=10), XY_END_TIME + timedelta(minutes=10)]
 
-            fig_main.update_layout(
-                title=go.layout.Title(
-                    x=0.5, xanchor='center', font={"family": "Hebrew", "size": 36}, text=title_text
-                ),
-                paper_bgcolor='white',
-                dragmode=False,
-                margin=dict(l=40, r=40, t=60, b=40),
-                polar=dict(
-                    bgcolor="white",
-                    radialaxis=dict(
-                        visible=True,
-                        range=range_vals,
-                        tickvals=tickvals,
-                        gridcolor='darkgrey'
-                    ),
-                    angularaxis=dict(
-                        direction="clockwise", rotation=90, tickmode='array',
-                        tickvals=[0, 45, 90, 135, 180, 225, 270, 315],
-                        ticktext=['00:00', '03:00', '06:00', '09:00', '12:00', '15:00', '18:00', '21:00'],
-                        gridcolor='darkgrey'
-                    )
-                ),
-                showlegend=False
-            )
-            
-            # Add a thicker zero line for polar plot
-            zero_line_theta = [i for i in range(0, 361)]
-            zero_line_r = [0] * len(zero_line_theta)
-            
-            fig_main.add_trace(go.Scatterpolar(
-                r=zero_line_r,
-                theta=zero_line_theta,
-                mode='lines',
-                line=dict(color='black', width=2),
-                hoverinfo='skip',
-                showlegend=False
-            ))
-
-        # Cumulative Figure Layout
-        fig_cum.update_layout(
-            title=go.layout.Title(text="אנרגיה מצטברת (MWh)", x=0.5, xanchor='center', font={"family": "Hebrew", "size": 24}),
+        fig_main.update_layout(
+            title=go.layout.Title(
+                x=0.5, xanchor='center', font={"family": "Hebrew", "size": 36}, text=title_text
+            ),
             paper_bgcolor='white',
             plot_bgcolor='white',
             dragmode=False,
-            xaxis=dict(title="זמן", gridcolor='lightgrey', fixedrange=True),
-            yaxis=dict(title="אנרגיה (MWh)", gridcolor='lightgrey', fixedrange=True, zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
-            margin=dict(l=40, r=40, t=40, b=40),
+            xaxis=dict(
+                title="זמן",
+                gridcolor='lightgrey',
+                tickformat="%H:%M",
+                fixedrange=True,
+                tickvals=tickvals,
+                ticktext=ticktext,
+                range=range_x  # Explicitly set range to include 24:00 with padding
+            ),
+            yaxis=dict(title="הספק (MW)", gridcolor='lightgrey', fixedrange=True, zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
+            margin=dict(l=40, r=40, t=60, b=40),
             showlegend=False
         )
 
-        # Daily Figure Layout
-        fig_daily.update_layout(
-            title=go.layout.Title(text="הספק מקסימלי יומי (MW)", x=0.5, xanchor='center', font={"family": "Hebrew", "size": 24}),
+    else:
+        # Polar Layout
+        min_p, max_p = aggregates["min_power"], aggregates["max_power"]
+        span = max_p - min_p if max_p != min_p else 1.0
+
+        target_step = span / 6
+        magnitude = 10 ** math.floor(math.log10(target_step)) if target_step > 0 else 1
+        rescaled_step = target_step / magnitude
+
+        nice_options = [1, 2, 2.5, 5, 10]
+        closest_nice_step = min(nice_options, key=lambda x: abs(x - rescaled_step))
+        nice_step = closest_nice_step * magnitude
+
+        r_min = math.floor(min_p / nice_step) * nice_step
+        r_max = math.ceil(max_p / nice_step) * nice_step
+
+        # Extend r_min by one step
+        r_min -= nice_step
+
+        tickvals = []
+        curr = r_min
+        while curr <= r_max + (nice_step / 1000):
+            tickvals.append(curr)
+            curr += nice_step
+
+        range_vals = [r_min, r_max + (nice_step / 10)]
+
+        fig_main.update_layout(
+            title=go.layout.Title(
+                x=0.5, xanchor='center', font={"family": "Hebrew", "size": 36}, text=title_text
+            ),
             paper_bgcolor='white',
-            plot_bgcolor='white',
             dragmode=False,
-            xaxis=dict(title="תאריך", gridcolor='lightgrey', fixedrange=True),
-            yaxis=dict(title="הספק (MW)", gridcolor='lightgrey', fixedrange=True, rangemode='tozero', zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
-            margin=dict(l=40, r=40, t=40, b=40),
+            margin=dict(l=40, r=40, t=60, b=40),
+            polar=dict(
+                bgcolor="white",
+                radialaxis=dict(
+                    visible=True,
+                    range=range_vals,
+                    tickvals=tickvals,
+                    gridcolor='darkgrey'
+                ),
+                angularaxis=dict(
+                    direction="clockwise", rotation=90, tickmode='array',
+                    tickvals=[0, 45, 90, 135, 180, 225, 270, 315],
+                    ticktext=['00:00', '03:00', '06:00', '09:00', '12:00', '15:00', '18:00', '21:00'],
+                    gridcolor='darkgrey'
+                )
+            ),
             showlegend=False
         )
-        
-        # Daily Energy Figure Layout
-        fig_daily_energy.update_layout(
-            title=go.layout.Title(text="אנרגיה יומית (MWh)", x=0.5, xanchor='center', font={"family": "Hebrew", "size": 24}),
-            paper_bgcolor='white',
-            plot_bgcolor='white',
-            dragmode=False,
-            xaxis=dict(title="תאריך", gridcolor='lightgrey', fixedrange=True),
-            yaxis=dict(title="אנרגיה (MWh)", gridcolor='lightgrey', fixedrange=True, rangemode='tozero', zeroline=True, zerolinecolor='lightgrey', zerolinewidth=1),
-            margin=dict(l=40, r=40, t=40, b=40),
+
+        # Add a thicker zero line for polar plot
+        zero_line_theta = [i for i in range(0, 361)]
+        zero_line_r = [0] * len(zero_line_theta)
+
+        fig_main.add_trace(go.Scatterpolar(
+            r=zero_line_r,
+            theta=zero_line_theta,
+            mode='lines',
+            line=dict(color='black', width=2),
+            hoverinfo='skip',
             showlegend=False
-        )
-        
-        return fig_main, fig_cum, fig_daily, fig_daily_energy, info_children, start_date, end_date, min_date_allowed, max_date_allowed
+        ))
+
+    return fig_main
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """LRU cache of query results, bounded by number of entries and total size, with a time to live.
+
+    Every entry records the namespaces and the date range it was computed from. When values are written
+    invalidate() drops exactly the entries that overlap the written namespace and dates."""
+
+    def __init__(self, max_entries=256, max_size=256 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        """Take before computing a value to put(), so that a value computed while a write happened isn't cached."""
+        with self._lock:
+            return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def put(self, key, value, size, namespaces, from_date, to_date, version):
+        """Cache value computed from the given namespaces between the from_date and to_date dates (inclusive)."""
+        if size > self.max_size:
+            return
+        with self._lock:
+            if version != self._version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, frozenset(namespaces), from_date, to_date,
+                                        time.monotonic() + self.ttl)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, namespace, from_date, to_date):
+        """Drop the entries of namespace that overlap the dates from_date to to_date (inclusive)."""
+        with self._lock:
+            self._version += 1
+            for key in [key for key, entry in self._entries.items()
+                        if namespace in entry.namespaces and entry.from_date <= to_date and from_date <= entry.to_date]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._size = 0
+
+    def size(self):
+        with self._lock:
+            return len(self._entries), self._size
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key).size
+
+
+class _Entry:
+    __slots__ = ("value", "size", "namespaces", "from_date", "to_date", "expires")
+
+    def __init__(self, value, size, namespaces, from_date, to_date, expires):
+        self.value = value
+        self.size = size
+        self.namespaces = namespaces
+        self.from_date = from_date
+        self.to_date = to_date
+        self.expires = expires
@@ -0,0 +1,259 @@
+import datetime
+import threading
+from functools import lru_cache
+
+import numpy as np
+from furl import furl
+
+from scripts.storage.ledger import FileLedger
+from scripts.storage.storage_top import Storage, fix_date, unfix_date, FETCH_SIZE
+
+MINUTES_PER_DAY = 24 * 60
+TAG_SPACE = 1 << 15  # max tags per namespace, tag ids are stored as int16
+COMPACT_THRESHOLD = 100000  # pending inserts that trigger a merge into the sorted columns
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+TIME_KEYS = ["{:02d}:{:02d}".format(m // 60, m % 60) for m in range(MINUTES_PER_DAY)]
+
+
+class ColumnarCache(Storage):
+    """In-memory storage keeping each namespace as sorted NumPy columns
+    (date ordinal, minute of day, tag id, float32 value) instead of nested dicts."""
+
+    def __init__(self, uri="cache://"):
+        self._lock = threading.RLock()
+        # e.g. cache://?ledger=ledger.json keeps the ingestion ledger in a file
+        self._ledger = FileLedger(furl(uri).args.get("ledger"))
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._ledger.clear()
+            self._namespaces = {}
+
+    def insert(self, namespace, date, time, tag, value):
+        self.bulk_insert([(namespace, date, time, tag, value)])
+
+    def bulk_insert(self, values):
+        with self._lock:
+            for value in values:
+                columns = self._namespaces.get(value[0])
+                if columns is None:
+                    columns = self._namespaces[value[0]] = _Columns()
+                columns.append(_ordinal(value[1]), _minute(value[2]), value[3], float(value[4]))
+            for columns in self._namespaces.values():
+                if len(columns.pending_dates) > COMPACT_THRESHOLD:
+                    columns.compact()
+
+    def retrieve(self, namespace, date, time="all", tag=None):
+        if time not in ["all", "day", "hour"] and tag:  # single value
+            value = self.retrieve_value(namespace, date, time, tag)
+            return {namespace: {unfix_date(date): {time: {tag: value}}}}
+        values = self.retrieve_range(namespace, date, date, tag=tag, time=time).get(namespace)
+        return {namespace: {unfix_date(date): values.get(unfix_date(date), {})}}
+
+    def retrieve_value(self, namespace, date, time, tag):
+        with self._lock:
+            columns = self._compacted(namespace)
+            if columns is None or tag not in columns.tag_ids or ":" not in str(time):  # e.g. time="month"
+                return None
+            ordinal = _ordinal(date)
+            lo = np.searchsorted(columns.dates, ordinal, side="left")
+            hi = np.searchsorted(columns.dates, ordinal, side="right")
+            found = np.flatnonzero((columns.minutes[lo:hi] == _minute(time)) &
+                                   (columns.tags[lo:hi] == columns.tag_ids[tag]))
+            return _as_float64(columns.values[lo + found])[0].item() if len(found) else None
+
+    def retrieve_range(self, namespace, from_date, to_date, tag=None, time="day"):
+        dates, minutes, tags, values, tag_names = self._select(namespace, from_date, to_date, tag, time)
+        result = {}
+        for date, minute, tag_id, value in zip(dates.tolist(), minutes.tolist(), tags.tolist(), values.tolist()):
+            per_date = result.get(date)
+            if per_date is None:
+                per_date = result[date] = {}
+            per_time = per_date.get(minute)
+            if per_time is None:
+                per_time = per_date[minute] = {}
+            per_time[tag_names[tag_id]] = value
+        return {namespace: {_date_key(date): {TIME_KEYS[minute]: per_time for minute, per_time in per_date.items()}
+                            for date, per_date in result.items()}}
+
+    def retrieve_rows(self, namespace, from_date, to_date, tag=None, time="day"):
+        dates, minutes, tags, values, tag_names = self._select(namespace, from_date, to_date, tag, time)
+        return [(namespace, _date_key(date), TIME_KEYS[minute], tag_names[tag_id], value)
+                for date, minute, tag_id, value in zip(dates.tolist(), minutes.tolist(), tags.tolist(), values.tolist())]
+
+    def iter_range(self, namespace, from_date, to_date, tag=None, time="day", batch_size=FETCH_SIZE):
+        dates, minutes, tags, values, tag_names = self._select(namespace, from_date, to_date, tag, time)
+        for start in range(0, len(dates), batch_size):
+            end = start + batch_size
+            yield [(namespace, _date_key(date), TIME_KEYS[minute], tag_names[tag_id], value)
+                   for date, minute, tag_id, value in zip(dates[start:end].tolist(), minutes[start:end].tolist(),
+                                                          tags[start:end].tolist(), values[start:end].tolist())]
+
+    def range_tags(self, namespace, from_date, to_date):
+        with self._lock:
+            columns = self._compacted(namespace)
+            if columns is None:
+                return []
+            lo = np.searchsorted(columns.dates, _ordinal(from_date), side="left")
+            hi = np.searchsorted(columns.dates, _ordinal(to_date), side="right")
+            return sorted(columns.tag_names[tag_id] for tag_id in np.unique(columns.tags[lo:hi]).tolist())
+
+    def _select(self, namespace, from_date, to_date, tag, time):
+        """Sorted (dates, minutes, tag ids, values, tag names) of the range, aggregated by time"""
+        with self._lock:
+            columns = self._compacted(namespace)
+            if columns is None or (tag and tag not in columns.tag_ids):
+                empty = np.empty(0, dtype=np.int64)
+                return empty, empty, empty, np.empty(0), []
+            lo = np.searchsorted(columns.dates, _ordinal(from_date), side="left")
+            hi = np.searchsorted(columns.dates, _ordinal(to_date), side="right")
+            dates = columns.dates[lo:hi]
+            minutes = columns.minutes[lo:hi]
+            tags = columns.tags[lo:hi]
+            values = columns.values[lo:hi]
+            tag_names = list(columns.tag_names)
+            tag_id = columns.tag_ids.get(tag)
+        mask = None
+        if tag:
+            mask = tags == tag_id
+        if time not in ["all", "hour", "day", "month"]:
+            time_mask = minutes == _minute(time)
+            mask = time_mask if mask is None else mask & time_mask
+        if mask is not None:
+            dates, minutes, tags, values = dates[mask], minutes[mask], tags[mask], values[mask]
+        values = _as_float64(values)
+        if time == "month":
+            dates = _month_start(dates)
+            minutes = np.zeros_like(minutes)
+        elif time == "day":
+            minutes = np.zeros_like(minutes)
+        elif time == "hour":
+            minutes = minutes // 60 * 60
+        if time in ["month", "day", "hour"]:
+            keys, inverse = np.unique(_key(dates, minutes, tags), return_inverse=True)
+            values = np.bincount(inverse, weights=values, minlength=len(keys))
+            dates, minutes, tags = _split_key(keys)
+        return dates, minutes, tags, values, tag_names
+
+    def latest_date(self, namespace):
+        with self._lock:
+            columns = self._compacted(namespace)
+            if columns is None or not len(columns.dates):
+                return None
+            return _date_key(int(columns.dates[-1]))
+
+    def record_window(self, namespace, from_date, to_date, count, complete):
+        self._ledger.record_window(namespace, from_date, to_date, count, complete)
+
+    def completed_windows(self, namespace):
+        return self._ledger.completed_windows(namespace)
+
+    def size(self):
+        with self._lock:
+            return sum(len(self._compacted(namespace).dates) for namespace in self._namespaces)
+
+    def nbytes(self):
+        """Bytes used by the column arrays, excluding pending inserts."""
+        with self._lock:
+            return sum(columns.nbytes() for columns in self._namespaces.values())
+
+    def _compacted(self, namespace):
+        columns = self._namespaces.get(namespace)
+        if columns is not None:
+            columns.compact()
+        return columns
+
+    def __str__(self):
+        with self._lock:
+            return str({namespace: self.size() for namespace in self._namespaces})
+
+
+class _Columns:
+    """Columns of a single namespace, sorted by (date, minute, tag) and unique.
+    New rows are collected in pending lists and merged on the next read."""
+
+    def __init__(self):
+        self.dates = np.empty(0, dtype=np.int32)
+        self.minutes = np.empty(0, dtype=np.int16)
+        self.tags = np.empty(0, dtype=np.int16)
+        self.values = np.empty(0, dtype=np.float32)
+        self.tag_names = []
+        self.tag_ids = {}
+        self._clear_pending()
+
+    def _clear_pending(self):
+        self.pending_dates = []
+        self.pending_minutes = []
+        self.pending_tags = []
+        self.pending_values = []
+
+    def append(self, date, minute, tag, value):
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            if len(self.tag_names) >= TAG_SPACE:
+                raise ValueError("Too many tags in namespace")
+            tag_id = self.tag_ids[tag] = len(self.tag_names)
+            self.tag_names.append(tag)
+        self.pending_dates.append(date)
+        self.pending_minutes.append(minute)
+        self.pending_tags.append(tag_id)
+        self.pending_values.append(value)
+
+    def compact(self):
+        if not self.pending_dates:
+            return
+        dates = np.concatenate((self.dates, np.array(self.pending_dates, dtype=np.int32)))
+        minutes = np.concatenate((self.minutes, np.array(self.pending_minutes, dtype=np.int16)))
+        tags = np.concatenate((self.tags, np.array(self.pending_tags, dtype=np.int16)))
+        values = np.concatenate((self.values, np.array(self.pending_values, dtype=np.float32)))
+        self._clear_pending()
+        keys = _key(dates, minutes, tags)
+        # stable sort keeps insertion order among duplicates, so the last one of each run wins
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)
+        order = order[last]
+        self.dates, self.minutes, self.tags, self.values = dates[order], minutes[order], tags[order], values[order]
+
+    def nbytes(self):
+        return self.dates.nbytes + self.minutes.nbytes + self.tags.nbytes + self.values.nbytes
+
+
+def _key(dates, minutes, tags):
+    return (np.asarray(dates, dtype=np.int64) * MINUTES_PER_DAY + minutes) * TAG_SPACE + tags
+
+
+def _split_key(keys):
+    date_minutes, tags = np.divmod(keys, TAG_SPACE)
+    dates, minutes = np.divmod(date_minutes, MINUTES_PER_DAY)
+    return dates, minutes, tags
+
+
+def _month_start(ordinals):
+    days = (ordinals.astype(np.int64) - EPOCH_ORDINAL).astype("datetime64[D]")
+    return days.astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + EPOCH_ORDINAL
+
+
+def _as_float64(values):
+    """Widen float32 values to float64, rounded to the 7 significant digits float32 can hold
+    so that e.g. 2345.2 is returned as 2345.2 rather than 2345.199951171875."""
+    values = values.astype(np.float64)
+    magnitude = np.floor(np.log10(np.abs(values), where=values != 0, out=np.zeros_like(values)))
+    scale = 10.0 ** (6 - magnitude)
+    return np.round(values * scale) / scale
+
+
+@lru_cache(maxsize=4096)
+def _ordinal(date):
+    return datetime.date.fromisoformat(fix_date(date)).toordinal()
+
+
+@lru_cache(maxsize=4096)
+def _date_key(ordinal):
+    return datetime.date.fromordinal(ordinal).strftime("%d-%m-%Y")
+
+
+def _minute(time):
+    hours, minutes = str(time).split(":")[0:2]
+    return int(hours) * 60 + int(minutes)
@@ -1,14 +1,20 @@
+from furl import furl
+
+from scripts.storage.ledger import FileLedger
 from scripts.storage.storage_top import Storage, fix_date, unfix_date, dict_key_value
 import threading
 
 
 class InMemCache(Storage):
-    def __init__(self):
+    def __init__(self, uri="cache://"):
         self._lock = threading.RLock()
+        # e.g. cache://?ledger=ledger.json keeps the ingestion ledger in a file
+        self._ledger = FileLedger(furl(uri).args.get("ledger"))
         self.clear()
 
     def clear(self):
         with self._lock:
+            self._ledger.clear()
             self._in_mem_cache = {}
 
     def _insert(self, val):
@@ -96,6 +102,12 @@ class InMemCache(Storage):
             per_namespace = self._in_mem_cache.get(namespace)
             return unfix_date(max(per_namespace)) if per_namespace else None
 
+    def record_window(self, namespace, from_date, to_date, count, complete):
+        self._ledger.record_window(namespace, from_date, to_date, count, complete)
+
+    def completed_windows(self, namespace):
+        return self._ledger.completed_windows(namespace)
+
     def size(self):
         with self._lock:
             return _count(self._in_mem_cache)
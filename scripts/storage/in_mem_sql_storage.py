@@ -1,37 +1,54 @@
 from furl import furl
 from scripts.storage.sql_storage import SqlStorageTemplate
 import sqlite3
+import threading
 from contextlib import contextmanager
 
 
 class InMemSqlStorage(SqlStorageTemplate):
 
-    SQL_ON_CONFLICT = " ON CONFLICT(namespace, date, time, tag) DO UPDATE SET value=excluded.value"
+    SQL_ID_COLUMN = "INTEGER PRIMARY KEY"
+    SQL_DIMENSION_ON_CONFLICT = "ON CONFLICT DO NOTHING"
+    SQL_TABLE_EXISTS = "SELECT name FROM sqlite_master WHERE type = 'table' AND name = {p}"
+    SQL_PARAM = "?"
+    SQL_INSERT_ROW = "(?, date(?), time(?), ?, ?)"
+    SQL_ON_CONFLICT = "ON CONFLICT(namespace_id, tag_id, date, time) DO UPDATE SET value=excluded.value"
+    SQL_LEDGER_ON_CONFLICT = "ON CONFLICT(namespace, from_date, to_date) " \
+                             "DO UPDATE SET row_count=excluded.row_count, complete=excluded.complete"
     SQL_AND_DATE = " AND date = date('{date}')"
     SQL_AND_DATE_RANGE = " AND date BETWEEN date('{from_date}') AND date('{to_date}')"
     SQL_AND_TIME = " AND time = time('{time}')"
-    SQL_SUM_HOUR = "SELECT namespace, date, strftime('%H', time), tag, SUM(value) from main_table " \
-                   "WHERE namespace = '{namespace}' "
-    SQL_SUM_DAY = "SELECT namespace, date, '00:00', tag, SUM(value) from main_table " \
-                  "WHERE namespace = '{namespace}' "
-    SQL_SUM_MONTH = "SELECT namespace, strftime('%Y-%m-01', date), '00:00', tag, SUM(value) from main_table " \
-                    "WHERE namespace = '{namespace}' "
-    SQL_GROUP_BY_DATE = " GROUP BY date, tag"
-    SQL_GROUP_BY_HOUR = " GROUP BY date, strftime('%H', time), tag"
-    SQL_GROUP_BY_MONTH = " GROUP BY strftime('%Y-%m-01', date), tag"
+    SQL_HOUR = "strftime('%H:00:00', time)"
+    SQL_MONTH = "strftime('%Y-%m-01', date)"
+    SQL_MIDNIGHT = "'00:00:00'"
+    # there is a single connection, its write transactions are serialized by a lock instead
+    SQL_LOCK_NAMESPACES = None
+    SQL_LOCK_ALL_NAMESPACES = None
 
     def __init__(self, uri="sqlite://energy-data"):
         self.url = furl(uri)
+        self._init_options()
         file_name = str(self.url.host)
         self.db = sqlite3.connect(file_name, check_same_thread=False)
-        self._execute_query(self.SQL_CREATE_TABLE)
+        self._write_lock = threading.RLock()
+        self._create_tables()
 
     @contextmanager
     def _managed_cursor(self, commit=False):
-        cursor = self.db.cursor()
-        try:
-            yield cursor
-            if commit:
+        if not commit:
+            cursor = self.db.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+            return
+        with self._write_lock:
+            cursor = self.db.cursor()
+            try:
+                yield cursor
                 self.db.commit()
-        finally:
-            cursor.close()
+            except BaseException:
+                self.db.rollback()
+                raise
+            finally:
+                cursor.close()
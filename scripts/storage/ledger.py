@@ -0,0 +1,42 @@
+import json
+import os
+import threading
+
+from scripts.storage.storage_top import fix_date, unfix_date
+
+
+class FileLedger:
+    """Ingestion ledger for the in-memory backends: which date windows of a namespace were ingested,
+    with their value counts. Kept in memory, and written to a JSON file if file_name is set.
+    The file describes the data of the running process only, it is not read back on startup
+    since the cached values themselves don't survive a restart."""
+
+    def __init__(self, file_name=None):
+        self._lock = threading.Lock()
+        self.file_name = file_name
+        self._windows = {}
+
+    def clear(self):
+        with self._lock:
+            self._windows = {}
+            self._save()
+
+    def record_window(self, namespace, from_date, to_date, count, complete):
+        with self._lock:
+            key = fix_date(from_date) + "/" + fix_date(to_date)
+            self._windows.setdefault(namespace, {})[key] = {"count": count, "complete": complete}
+            self._save()
+
+    def completed_windows(self, namespace):
+        with self._lock:
+            return sorted([tuple(unfix_date(date) for date in key.split("/"))
+                           for key, window in self._windows.get(namespace, {}).items() if window["complete"]],
+                          key=lambda window: fix_date(window[0]))
+
+    def _save(self):
+        if not self.file_name:
+            return
+        temp_name = self.file_name + ".tmp"
+        with open(temp_name, "w") as f:
+            json.dump(self._windows, f)
+        os.replace(temp_name, self.file_name)
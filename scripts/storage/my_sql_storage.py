@@ -9,26 +9,32 @@ energy_db_name = "energy_data"
 
 
 class MySqlStorage(SqlStorageTemplate):
+    SQL_ID_COLUMN = "SMALLINT AUTO_INCREMENT PRIMARY KEY"
+    SQL_DIMENSION_ON_CONFLICT = "ON DUPLICATE KEY UPDATE id = id"
+    SQL_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS {table} " \
+                       "(namespace_id SMALLINT, date DATE, time TIME, tag_id SMALLINT, value REAL, " \
+                       "CONSTRAINT {table}_pk PRIMARY KEY (namespace_id, tag_id, date, time), " \
+                       "INDEX {table}_date (namespace_id, date))"
+    SQL_CREATE_INDEX = None  # MySQL has no CREATE INDEX IF NOT EXISTS, the index is created with the table
+    SQL_TABLE_EXISTS = "SELECT table_name FROM information_schema.tables " \
+                       "WHERE table_schema = DATABASE() AND table_name = {p}"
     SQL_ON_CONFLICT = "as new_value ON DUPLICATE KEY UPDATE value=new_value.value"
+    SQL_LEDGER_ON_CONFLICT = "as new_value ON DUPLICATE KEY UPDATE " \
+                             "row_count=new_value.row_count, complete=new_value.complete"
     SQL_AND_DATE = " AND date = date('{date}')"
     SQL_AND_DATE_RANGE = " AND date BETWEEN date('{from_date}') AND date('{to_date}')"
     SQL_AND_TIME = " AND time = time('{time}')"
-    SQL_SUM_HOUR = "SELECT namespace, date, hour(time), tag, SUM(value) from main_table " \
-                   "WHERE namespace = '{namespace}' "
-    SQL_SUM_DAY = "SELECT namespace, date, time('00:00'), tag, SUM(value) from main_table " \
-                  "WHERE namespace = '{namespace}' "
-    SQL_SUM_MONTH = "SELECT namespace, date(concat_ws('-', year(date), month(date), 1)), '00:00', tag, SUM(value) from main_table " \
-                    "WHERE namespace = '{namespace}' "
-    SQL_GROUP_BY_DATE = " GROUP BY date, tag"
-    SQL_GROUP_BY_HOUR = " GROUP BY date, hour(time), tag"
-    SQL_GROUP_BY_MONTH = "GROUP BY date(concat_ws('-', year(date), month(date), 1)), tag"
+    SQL_HOUR = "maketime(hour(time), 0, 0)"
+    SQL_MONTH = "date(concat_ws('-', year(date), month(date), 1))"
+    SQL_MIDNIGHT = "time('00:00')"
 
     def __init__(self, uri):
         self.url = furl(uri)
+        self._init_options()
         self.pool = self._init_pool()
         self._execute_query("CREATE DATABASE IF NOT EXISTS energy_data")
         self.pool = self._init_pool(database=energy_db_name)
-        self._execute_query(self.SQL_CREATE_TABLE)
+        self._create_tables()
 
     def _init_pool(self, database=None):
         user = self.url.username
@@ -45,6 +51,18 @@ class MySqlStorage(SqlStorageTemplate):
             db_config["database"] = database
         return MySQLConnectionPool(pool_name="mysql_pool", pool_size=5, **db_config)
 
+    @contextmanager
+    def _streaming_cursor(self):
+        # an unbuffered cursor reads the rows from the connection as they are fetched
+        conn = self.pool.get_connection()
+        cursor = conn.cursor(buffered=False)
+        try:
+            yield cursor
+        finally:
+            conn.consume_results()  # rows left unread when a stream was closed early
+            cursor.close()
+            conn.close()
+
     @contextmanager
     def _managed_cursor(self, commit=False):
         conn = self.pool.get_connection()
@@ -1,31 +1,48 @@
+import io
+import itertools
 from contextlib import contextmanager
 
 from scripts.storage.sql_storage import SqlStorageTemplate
-from scripts.storage.storage_top import fix_date
 import psycopg2
 from psycopg2 import pool
+from psycopg2.extras import execute_values
 from furl import furl
 
+COPY_THRESHOLD = 0  # off: the COPY path is opt-in with the copy_threshold URI parameter until benchmarked
+_cursor_ids = itertools.count()
+
 
 class PostgresStorage(SqlStorageTemplate):
-    SQL_ON_CONFLICT = "ON CONFLICT ON CONSTRAINT main_table_pk DO UPDATE SET value = EXCLUDED.value"
+    SQL_ID_COLUMN = "SMALLSERIAL PRIMARY KEY"
+    SQL_DIMENSION_ON_CONFLICT = "ON CONFLICT DO NOTHING"
+    SQL_TABLE_EXISTS = "SELECT table_name FROM information_schema.tables " \
+                       "WHERE table_schema = current_schema() AND table_name = {p}"
+    SQL_ON_CONFLICT = "ON CONFLICT ON CONSTRAINT readings_pk DO UPDATE SET value = EXCLUDED.value"
+    SQL_LEDGER_ON_CONFLICT = "ON CONFLICT ON CONSTRAINT ingest_ledger_pk " \
+                             "DO UPDATE SET row_count = EXCLUDED.row_count, complete = EXCLUDED.complete"
     SQL_AND_DATE = " AND date = '{date}'"
     SQL_AND_DATE_RANGE = " AND date BETWEEN '{from_date}' AND '{to_date}'"
     SQL_AND_TIME = " AND time = '{time}'"
-    SQL_SUM_HOUR = "SELECT namespace, date, to_char(time, 'HH24') as hour, tag, SUM(value) from main_table " \
-                   "WHERE namespace = '{namespace}' "
-    SQL_SUM_DAY = "SELECT namespace, date, '00:00', tag, SUM(value) from main_table " \
-                  "WHERE namespace = '{namespace}' "
-    SQL_SUM_MONTH = "SELECT namespace, to_char(date, 'YYYY-MM-01'), '00:00', tag, sum(value) from main_table " \
-                    "WHERE namespace = '{namespace}' "
-    SQL_GROUP_BY_DATE = " GROUP BY namespace, date, tag"
-    SQL_GROUP_BY_HOUR = " GROUP BY namespace, date, hour, tag"
-    SQL_GROUP_BY_MONTH = "GROUP BY namespace, to_char(date, 'YYYY-MM-01'), tag"
+    SQL_HOUR = "make_time(extract(hour from time)::int, 0, 0)"
+    SQL_MONTH = "date_trunc('month', date)::date"
+    SQL_MIDNIGHT = "time '00:00'"
+
+    # With copy_threshold set, large batches are copied into a per-connection staging table and merged
+    # with a single statement.
+    # seq keeps the arrival order so that the last of duplicate values wins, as with regular inserts.
+    SQL_CREATE_STAGING = "CREATE TEMP TABLE IF NOT EXISTS readings_staging " \
+                         "(seq BIGSERIAL, namespace_id SMALLINT, date DATE, time TIME, tag_id SMALLINT, value REAL) " \
+                         "ON COMMIT DELETE ROWS"
+    SQL_COPY_STAGING = "COPY readings_staging (namespace_id, date, time, tag_id, value) FROM STDIN"
+    SQL_MERGE_STAGING = "INSERT INTO readings (namespace_id, date, time, tag_id, value) " \
+                        "SELECT DISTINCT ON (namespace_id, tag_id, date, time) namespace_id, date, time, tag_id, value " \
+                        "FROM readings_staging ORDER BY namespace_id, tag_id, date, time, seq DESC " + SQL_ON_CONFLICT
 
     def __init__(self, uri):
         self.url = furl(uri)
+        self._init_options()
         self.pool = self._init_pool()
-        self._execute_query(self.SQL_CREATE_TABLE)
+        self._create_tables()
 
     def _init_pool(self):
         user = self.url.username
@@ -34,6 +51,10 @@ class PostgresStorage(SqlStorageTemplate):
         port = self.url.port
         return psycopg2.pool.SimpleConnectionPool(1, 10, user=user, password=password, host=host, port=port)
 
+    def _init_options(self):
+        super()._init_options()
+        self.copy_threshold = int(self.url.args.get("copy_threshold", COPY_THRESHOLD))
+
     @contextmanager
     def _managed_cursor(self, commit=False):
         conn = self.pool.getconn()
@@ -46,14 +67,29 @@ class PostgresStorage(SqlStorageTemplate):
             cursor.close()
             self.pool.putconn(conn)
 
-    def bulk_insert(self, values):
-        # in postgres we can't have duplicates in the same command.
-        if len(values) > 1:
-            values_dict = {}
-            for value in values:
-                values_dict[str(value[:-1])] = value
-            values = values_dict.values()
-        self._execute_query(self.SQL_INSERT + (",".join([self._fix(v) for v in values])) + self.SQL_ON_CONFLICT)
-
-    def _fix(self, value):
-        return "('{}', '{}', '{}', '{}', {})".format(value[0], fix_date(value[1]), value[2], value[3], value[4])
+    @contextmanager
+    def _streaming_cursor(self):
+        # a named cursor keeps the result on the server, fetchmany() transfers a batch at a time
+        conn = self.pool.getconn()
+        cursor = conn.cursor(name="iter_rows_{}".format(next(_cursor_ids)))
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            conn.rollback()  # ends the transaction of the named cursor
+            self.pool.putconn(conn)
+
+    def _insert_rows(self, curr, rows):
+        if self.copy_threshold and len(rows) >= self.copy_threshold:
+            self._copy_rows(curr, rows)
+            return
+        # in postgres we can't have duplicates in the same command, the last value wins.
+        rows = list({row[:-1]: row for row in rows}.values())
+        execute_values(curr, self.SQL_INSERT + "%s " + self.SQL_ON_CONFLICT, rows, page_size=self.batch_size)
+
+    def _copy_rows(self, curr, rows):
+        data = io.StringIO("".join(["{}\t{}\t{}\t{}\t{}\n".format(*row) for row in rows]))
+        curr.execute(self.SQL_CREATE_STAGING)
+        curr.copy_expert(self.SQL_COPY_STAGING, data)
+        curr.execute(self.SQL_MERGE_STAGING)
+
@@ -1,46 +1,152 @@
+import datetime
+import logging
 from contextlib import contextmanager
 
-from scripts.storage.storage_top import Storage, fix_date, unfix_date, unfix_time, dict_key_value
+from scripts.storage.storage_top import Storage, fix_date, unfix_date, unfix_time, batches, FETCH_SIZE
+
+BATCH_SIZE = 1000
+# readings table of each granularity, and the table its sums are computed from
+ROLLUPS = {"hour": ("readings_hour", "readings"), "day": ("readings_day", "readings_hour"),
+           "month": ("readings_month", "readings_day")}
+READINGS_TABLES = ["readings"] + [table for (table, source) in ROLLUPS.values()]
+LEGACY_TABLES = ["main_table", "rollup_hour", "rollup_day", "rollup_month"]
+ROLLUPS_BUILT = "rollups_built"  # flag set once the roll-up tables hold the sums of all the readings
 
 
 class SqlStorageTemplate(Storage):
-    SQL_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS main_table " \
-                       "(namespace VARCHAR(80), date DATE, time TIME, tag VARCHAR(50), value REAL, " \
-                       "CONSTRAINT main_table_pk PRIMARY KEY (namespace, date, time, tag))"
+    # Namespaces and tags are kept once in dimension tables, readings refer to them by id.
+    # The primary key serves queries by (namespace, tag, date), the date index those of all the tags of a namespace.
+    SQL_ID_COLUMN = None
+    SQL_CREATE_DIMENSION = "CREATE TABLE IF NOT EXISTS {table} (id {id_column}, name VARCHAR(80) UNIQUE)"
+    SQL_DIMENSION_INSERT = "INSERT INTO {table} (name) VALUES ({p}) "
+    SQL_DIMENSION_ON_CONFLICT = None
+    SQL_DIMENSION = "SELECT id, name FROM {table}"
+
+    SQL_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS {table} " \
+                       "(namespace_id SMALLINT, date DATE, time TIME, tag_id SMALLINT, value REAL, " \
+                       "CONSTRAINT {table}_pk PRIMARY KEY (namespace_id, tag_id, date, time))"
+    SQL_CREATE_INDEX = "CREATE INDEX IF NOT EXISTS {table}_date ON {table} (namespace_id, date)"
 
-    SQL_INSERT = "INSERT INTO main_table VALUES "
+    SQL_INSERT = "INSERT INTO readings VALUES "
+    SQL_PARAM = "%s"
+    SQL_INSERT_ROW = "(%s, %s, %s, %s, %s)"
     SQL_ON_CONFLICT = None
 
-    SQL_RETRIEVE = "SELECT * FROM main_table " \
-                   "WHERE namespace = '{namespace}'"
+    SQL_CREATE_LEDGER = "CREATE TABLE IF NOT EXISTS ingest_ledger " \
+                        "(namespace VARCHAR(80), from_date DATE, to_date DATE, row_count INTEGER, complete BOOLEAN, " \
+                        "CONSTRAINT ingest_ledger_pk PRIMARY KEY (namespace, from_date, to_date))"
+    SQL_LEDGER_INSERT = "INSERT INTO ingest_ledger VALUES ({p}, {p}, {p}, {p}, {p}) "
+    SQL_LEDGER_ON_CONFLICT = None
+    SQL_COMPLETED_WINDOWS = "SELECT from_date, to_date FROM ingest_ledger " \
+                            "WHERE namespace = {p} AND complete ORDER BY from_date"
 
-    SQL_LATEST_DATE = "SELECT max(date) from main_table WHERE namespace = '{namespace}'"
+    SQL_RETRIEVE = "SELECT namespace_id, date, time, tag_id, value FROM {table} " \
+                   "WHERE namespace_id = {namespace_id}"
+
+    SQL_LATEST_DATE = "SELECT max(date) from readings WHERE namespace_id = {namespace_id}"
 
     SQL_AND_DATE = None
     SQL_AND_DATE_RANGE = None
     SQL_AND_TIME = None
-    SQL_AND_TAG = " AND tag = '{tag}'"
+    SQL_AND_TAG = " AND tag_id = {tag_id}"
+
+    SQL_SUM = "SELECT namespace_id, {date}, {time}, tag_id, SUM(value) FROM {source} " \
+              "WHERE namespace_id = {namespace_id}"
+    SQL_GROUP_BY = " GROUP BY namespace_id, {group_by}, tag_id"
+
+    SQL_ORDER_BY = " ORDER BY 2, 3"  # date and time, which are expressions in aggregate queries
+    SQL_RANGE_TAGS = "SELECT DISTINCT tag_id FROM {table} WHERE namespace_id = {namespace_id}"
+
+    SQL_SIZE = "SELECT count(*) from readings"
+
+    # Flags of the state of the database, a row per flag that is set
+    SQL_CREATE_FLAGS = "CREATE TABLE IF NOT EXISTS storage_flags (name VARCHAR(80) PRIMARY KEY)"
+    SQL_FLAG = "SELECT 1 FROM storage_flags WHERE name = '{name}'"
+    SQL_SET_FLAG = "INSERT INTO storage_flags VALUES ('{name}')"
+    SQL_CLEAR_FLAG = "DELETE FROM storage_flags WHERE name = '{name}'"
+    # Serializes the transactions that write the readings and roll-ups of the same namespaces
+    SQL_LOCK_NAMESPACES = "SELECT id FROM namespaces WHERE id IN ({ids}) ORDER BY id FOR UPDATE"
+    SQL_LOCK_ALL_NAMESPACES = "SELECT id FROM namespaces ORDER BY id FOR UPDATE"
 
-    SQL_SUM_HOUR = None
-    SQL_SUM_DAY = None
-    SQL_SUM_MONTH = None
-    SQL_GROUP_BY_DATE = None
-    SQL_GROUP_BY_HOUR = None
-    SQL_GROUP_BY_MONTH = None
+    # Roll-up tables keep the hourly, daily and monthly sums of readings, with the same columns.
+    # Each one is refreshed from the finer one for the dates touched by bulk_insert, in the transaction of
+    # the insert. They are read once rebuild_rollups() set the ROLLUPS_BUILT flag, and kept up to date only then.
+    SQL_ROLLUP_DELETE = "DELETE FROM {table} WHERE namespace_id = {namespace_id}"
+    SQL_ROLLUP_INSERT = "INSERT INTO {table} (namespace_id, date, time, tag_id, value) "
+    SQL_DATE_RANGES = "SELECT namespace_id, min(date), max(date) FROM readings GROUP BY namespace_id"
 
-    SQL_SIZE = "SELECT count(*) from main_table"
+    SQL_HOUR = None  # start of the hour of column time
+    SQL_MONTH = None  # first day of the month of column date
+    SQL_MIDNIGHT = None
+
+    SQL_TABLE_EXISTS = None
+    SQL_MIGRATE_DIMENSION = "INSERT INTO {table} (name) SELECT DISTINCT {column} FROM main_table WHERE true "
+    SQL_MIGRATE_READINGS = "INSERT INTO readings (namespace_id, date, time, tag_id, value) " \
+                           "SELECT n.id, m.date, m.time, t.id, m.value FROM main_table m " \
+                           "JOIN namespaces n ON n.name = m.namespace JOIN tags t ON t.name = m.tag"
+
+    def _init_options(self):
+        """Options passed as URI query parameters, e.g. sqlite://energy-data?batch_size=5000"""
+        self.batch_size = int(self.url.args.get("batch_size", BATCH_SIZE))
+
+    def _create_tables(self):
+        self._execute_query(self.SQL_CREATE_DIMENSION.format(table="namespaces", id_column=self.SQL_ID_COLUMN),
+                            self.SQL_CREATE_DIMENSION.format(table="tags", id_column=self.SQL_ID_COLUMN),
+                            *[self.SQL_CREATE_TABLE.format(table=table) for table in READINGS_TABLES],
+                            *[self.SQL_CREATE_INDEX.format(table=table) for table in READINGS_TABLES
+                              if self.SQL_CREATE_INDEX],
+                            self.SQL_CREATE_LEDGER,
+                            self.SQL_CREATE_FLAGS)
+        self._ids = {"namespaces": {}, "tags": {}}
+        self._names = {"namespaces": {}, "tags": {}}
+        self.migrate()
+        with self._managed_cursor(commit=True) as curr:
+            self._lock_namespaces(curr)
+            self.rollups_ready = self._rollups_built(curr)
+            if not self.rollups_ready:
+                curr.execute("SELECT 1 FROM readings LIMIT 1")
+                if not curr.fetchall():  # nothing to build
+                    self._set_rollups_built(curr)
+                    self.rollups_ready = True
+        # readings stored before the roll-up tables existed are aggregated on every read until rebuild_rollups()
+        if not self.rollups_ready:
+            logging.warning("Roll-up tables aren't built, run scripts/storage/rebuild_rollups.py to build them")
+
+    def migrate(self):
+        """Move the readings of main_table, the schema that kept namespace and tag names in every row,
+        to the readings table and build the roll-ups. Does nothing if there is no main_table."""
+        if not self._get_records(self.SQL_TABLE_EXISTS.format(p=self.SQL_PARAM), ("main_table",)):
+            return
+        logging.info("Migrating main_table to the readings table")
+        with self._managed_cursor(commit=True) as curr:
+            curr.execute(self.SQL_CLEAR_FLAG.format(name=ROLLUPS_BUILT))  # until rebuild_rollups() completes
+            for table, column in [("namespaces", "namespace"), ("tags", "tag")]:
+                curr.execute(self.SQL_MIGRATE_DIMENSION.format(table=table, column=column) +
+                             self.SQL_DIMENSION_ON_CONFLICT)
+            curr.execute(self.SQL_MIGRATE_READINGS)
+            for table in LEGACY_TABLES:
+                curr.execute("DROP TABLE IF EXISTS " + table)
+        self.rebuild_rollups()
+        logging.info("Migrated %s readings", self.size())
 
     def clear(self):
-        self._execute_query("DROP TABLE main_table",
-                            self.SQL_CREATE_TABLE)
+        self._execute_query(*["DROP TABLE " + table for table in READINGS_TABLES],
+                            "DROP TABLE namespaces",
+                            "DROP TABLE tags",
+                            "DROP TABLE ingest_ledger",
+                            "DROP TABLE storage_flags")
+        self._create_tables()
 
     @contextmanager
     def _managed_cursor(self, commit=False):
         raise NotImplementedError
 
-    def _get_records(self, query):
+    def _get_records(self, query, params=None):
         with self._managed_cursor() as curr:
-            curr.execute(query)
+            if params is None:
+                curr.execute(query)
+            else:
+                curr.execute(query, params)
             records = curr.fetchall()
             return records
 
@@ -49,16 +155,112 @@ class SqlStorageTemplate(Storage):
             for query in queries:
                 curr.execute(query)
 
+    def _id(self, table, name, create=False):
+        """Id of a namespace or tag name, None if unknown. Added to the table if create is set."""
+        ids = self._ids[table]
+        if name not in ids:
+            if create:
+                with self._managed_cursor(commit=True) as curr:
+                    curr.execute(self.SQL_DIMENSION_INSERT.format(table=table, p=self.SQL_PARAM) +
+                                 self.SQL_DIMENSION_ON_CONFLICT, (name,))
+            self._load_dimension(table)
+        return ids.get(name)
+
+    def _name(self, table, name_id):
+        names = self._names[table]
+        if name_id not in names:  # added by another process
+            self._load_dimension(table)
+        return names[name_id]
+
+    def _load_dimension(self, table):
+        records = self._get_records(self.SQL_DIMENSION.format(table=table))
+        self._ids[table].update({name: name_id for (name_id, name) in records})
+        self._names[table].update(records)
+
     def retrieve_value(self, namespace, date, time, tag):
+        namespace_id, tag_id = self._id("namespaces", namespace), self._id("tags", tag)
+        if namespace_id is None or tag_id is None:
+            return None
         records = self._get_records((self.SQL_RETRIEVE + self.SQL_AND_DATE + self.SQL_AND_TAG + self.SQL_AND_TIME)
-                                    .format(namespace=namespace, date=fix_date(date), time=time, tag=tag))
+                                    .format(table="readings", namespace_id=namespace_id, date=fix_date(date),
+                                            time=time, tag_id=tag_id))
         return records[0][-1] if records else None
 
     def insert(self, namespace, date, time, tag, value):
         self.bulk_insert([(namespace, fix_date(date), time, tag, value)])
 
     def bulk_insert(self, values):
-        self._execute_query(self.SQL_INSERT + (",".join([self._fix(v) for v in values])) + self.SQL_ON_CONFLICT)
+        rows = [self._row(value) for value in values]
+        if not rows:
+            return
+        date_ranges = _date_ranges(rows)
+        with self._managed_cursor(commit=True) as curr:
+            # a concurrent insert of the same namespace waits, or its month roll-ups would miss the other's days
+            self._lock_namespaces(curr, sorted(date_ranges))
+            self._insert_rows(curr, rows)
+            if self._rollups_built(curr):
+                self._refresh_rollups(curr, date_ranges)
+                self.rollups_ready = True  # built by another process
+
+    def rebuild_rollups(self):
+        """Build the roll-up tables from all the readings, in a single transaction."""
+        with self._managed_cursor(commit=True) as curr:
+            self._lock_namespaces(curr)
+            for table, source in ROLLUPS.values():
+                curr.execute("DELETE FROM " + table)
+            curr.execute(self.SQL_DATE_RANGES)
+            for namespace_id, from_date, to_date in curr.fetchall():
+                logging.info("Building roll-ups of %s from %s to %s",
+                             self._name("namespaces", namespace_id), from_date, to_date)
+                self._refresh_rollups(curr, {namespace_id: (str(from_date), str(to_date))})
+            self._set_rollups_built(curr)
+        self.rollups_ready = True
+
+    def _refresh_rollups(self, curr, date_ranges):
+        """Recompute the roll-ups of the given {namespace_id: (from_date, to_date)} ranges (yyyy-mm-dd)."""
+        for namespace_id, (from_date, to_date) in date_ranges.items():
+            month_from, month_to = _month_range(from_date, to_date)
+            for time, delete_from, delete_to, sum_to in [("hour", from_date, to_date, to_date),
+                                                         ("day", from_date, to_date, to_date),
+                                                         ("month", month_from, month_to, _month_end(month_to))]:
+                table, source = ROLLUPS[time]
+                curr.execute((self.SQL_ROLLUP_DELETE + self.SQL_AND_DATE_RANGE)
+                             .format(table=table, namespace_id=namespace_id,
+                                     from_date=delete_from, to_date=delete_to))
+                curr.execute(self.SQL_ROLLUP_INSERT.format(table=table) +
+                             self._sum_query(source, namespace_id, delete_from, sum_to, None, time))
+
+    def _lock_namespaces(self, curr, namespace_ids=None):
+        """Lock the rows of the namespaces (all of them if None) until the end of the transaction of curr."""
+        if not self.SQL_LOCK_NAMESPACES:
+            return
+        if namespace_ids is None:
+            curr.execute(self.SQL_LOCK_ALL_NAMESPACES)
+        elif namespace_ids:
+            curr.execute(self.SQL_LOCK_NAMESPACES.format(ids=", ".join(str(i) for i in namespace_ids)))
+        curr.fetchall()
+
+    def _rollups_built(self, curr):
+        curr.execute(self.SQL_FLAG.format(name=ROLLUPS_BUILT))
+        return bool(curr.fetchall())
+
+    def _set_rollups_built(self, curr):
+        curr.execute(self.SQL_CLEAR_FLAG.format(name=ROLLUPS_BUILT))
+        curr.execute(self.SQL_SET_FLAG.format(name=ROLLUPS_BUILT))
+
+    def _sum_query(self, source, namespace_id, from_date, to_date, tag_id, time):
+        date, time, group_by = {"hour": ("date", self.SQL_HOUR, "date, " + self.SQL_HOUR),
+                                "day": ("date", self.SQL_MIDNIGHT, "date"),
+                                "month": (self.SQL_MONTH, self.SQL_MIDNIGHT, self.SQL_MONTH)}[time]
+        query = self.SQL_SUM + self.SQL_AND_DATE_RANGE + (self.SQL_AND_TAG if tag_id is not None else "") + \
+            self.SQL_GROUP_BY
+        return query.format(date=date, time=time, source=source, namespace_id=namespace_id, tag_id=tag_id,
+                            from_date=from_date, to_date=to_date, group_by=group_by)
+
+    def _insert_rows(self, curr, rows):
+        query = self.SQL_INSERT + self.SQL_INSERT_ROW + " " + self.SQL_ON_CONFLICT
+        for batch in batches(rows, self.batch_size):
+            curr.executemany(query, batch)
 
     def retrieve(self, namespace, date, tag=None, time="all"):
         return self._retrieve(namespace=namespace, date=fix_date(date), tag=tag, time=time)
@@ -67,52 +269,172 @@ class SqlStorageTemplate(Storage):
         return self._retrieve(namespace, date_from=fix_date(from_date), date_to=fix_date(to_date), tag=tag, time=time)
 
     def latest_date(self, namespace):
-        records = self._get_records(self.SQL_LATEST_DATE.format(namespace=namespace))
+        namespace_id = self._id("namespaces", namespace)
+        if namespace_id is None:
+            return None
+        records = self._get_records(self.SQL_LATEST_DATE.format(namespace_id=namespace_id))
         return unfix_date(records[0][0])
 
     def size(self):
         records = self._get_records(self.SQL_SIZE)
         return records[0][0]
 
+    def record_window(self, namespace, from_date, to_date, count, complete):
+        query = self.SQL_LEDGER_INSERT.format(p=self.SQL_PARAM) + self.SQL_LEDGER_ON_CONFLICT
+        with self._managed_cursor(commit=True) as curr:
+            curr.execute(query, (namespace, fix_date(from_date), fix_date(to_date), count, complete))
+
+    def completed_windows(self, namespace):
+        records = self._get_records(self.SQL_COMPLETED_WINDOWS.format(p=self.SQL_PARAM), (namespace,))
+        return [(unfix_date(from_date), unfix_date(to_date)) for (from_date, to_date) in records]
+
+    def retrieve_rows(self, namespace, from_date, to_date, tag=None, time="day"):
+        return [row for rows in self.iter_range(namespace, from_date, to_date, tag=tag, time=time) for row in rows]
+
+    def iter_range(self, namespace, from_date, to_date, tag=None, time="day", batch_size=FETCH_SIZE):
+        return self._iter_rows(self._queries(namespace, fix_date(from_date), fix_date(to_date), tag, time),
+                               batch_size, ordered=True)
+
+    def _iter_rows(self, queries, batch_size, ordered):
+        # a range has few distinct dates, times, namespaces and tags, each one is converted once
+        namespaces = _Converted(lambda namespace_id: self._name("namespaces", namespace_id))
+        tags = _Converted(lambda tag_id: self._name("tags", tag_id))
+        dates = _Converted(unfix_date)
+        times = _Converted(unfix_time)
+        for query in queries:
+            with self._streaming_cursor() as curr:
+                curr.execute(query + self.SQL_ORDER_BY if ordered else query)
+                while True:
+                    records = curr.fetchmany(batch_size)
+                    if not records:
+                        break
+                    yield [(namespaces[namespace_id], dates[date], times[time], tags[tag_id], value)
+                           for (namespace_id, date, time, tag_id, value) in records]
+
+    @contextmanager
+    def _streaming_cursor(self):
+        """Cursor that reads the rows of a query as they are fetched instead of all at once."""
+        with self._managed_cursor() as curr:
+            yield curr
+
+    def range_tags(self, namespace, from_date, to_date):
+        namespace_id = self._id("namespaces", namespace)
+        if namespace_id is None:
+            return []
+        table = "readings_day" if self.rollups_ready else "readings"
+        query = (self.SQL_RANGE_TAGS + self.SQL_AND_DATE_RANGE).format(table=table, namespace_id=namespace_id,
+                                                                       from_date=fix_date(from_date),
+                                                                       to_date=fix_date(to_date))
+        return sorted(self._name("tags", tag_id) for (tag_id,) in self._get_records(query))
+
     def _retrieve(self, namespace, date=None, date_from=None, date_to=None, tag=None, time="all"):
         if date and tag and time not in ["all", "day", "hour"]:
             date = fix_date(date)
             value = self.retrieve_value(namespace, date, time, tag)
             return {namespace: {unfix_date(date): {time: {tag: value}}}}
-        if date:
-            sql_and_date = self.SQL_AND_DATE.format(date=date)
-        else:
-            sql_and_date = self.SQL_AND_DATE_RANGE.format(from_date=date_from, to_date=date_to)
-        sql_and_tag = self.SQL_AND_TAG if tag else ""
-        if time == "month":
-            query = (self.SQL_SUM_MONTH + sql_and_date + sql_and_tag + self.SQL_GROUP_BY_MONTH) \
-                .format(namespace=namespace, tag=tag)
-        elif time == "day":
-            query = (self.SQL_SUM_DAY + sql_and_date + sql_and_tag + self.SQL_GROUP_BY_DATE) \
-                .format(namespace=namespace, tag=tag)
-        elif time == "hour":
-            query = (self.SQL_SUM_HOUR + sql_and_date + sql_and_tag + self.SQL_GROUP_BY_HOUR) \
-                .format(namespace=namespace, tag=tag)
-        else:
-            query = (self.SQL_RETRIEVE + sql_and_date +
-                     (self.SQL_AND_TIME if time != "all" else "") +
-                     (self.SQL_AND_TAG if tag else "")) \
-                .format(namespace=namespace, time=time, tag=tag)
-        records = self._get_records(query)
-        return self._records_to_dict(records)
-
-    def _records_to_dict(self, records):
+        queries = self._queries(namespace, date_from or date, date_to or date, tag, time)
         d = {}
-        for record in records:
-            (namespace, date, time, tag, value) = record
-            date = unfix_date(date)
-            time = unfix_time(time)  # remove seconds
-            ns = dict_key_value(d, namespace)
-            dt = dict_key_value(ns, date)
-            tm = dict_key_value(dt, time)
-            tm[tag] = value
+        for rows in self._iter_rows(queries, FETCH_SIZE, ordered=False):
+            for (namespace, date, time, tag, value) in rows:
+                ns = d.get(namespace)
+                if ns is None:
+                    ns = d[namespace] = {}
+                dt = ns.get(date)
+                if dt is None:
+                    dt = ns[date] = {}
+                tm = dt.get(time)
+                if tm is None:
+                    tm = dt[time] = {}
+                tm[tag] = value
         return d
 
-    def _fix(self, value):
-        return "('{}', date('{}'), time('{}'), '{}', {})" \
-            .format(value[0], fix_date(value[1]), value[2], value[3], value[4])
+    def _queries(self, namespace, date_from, date_to, tag, time):
+        """Queries of the values of a range, in the order of their dates"""
+        namespace_id = self._id("namespaces", namespace)
+        tag_id = self._id("tags", tag) if tag else None
+        if namespace_id is None or (tag and tag_id is None):
+            return []
+        if time in ["hour", "day", "month"]:
+            if self.rollups_ready:
+                return self._rollup_queries(namespace_id, date_from, date_to, tag_id, time)
+            return [self._sum_query("readings", namespace_id, date_from, date_to, tag_id, time)]
+        query = (self.SQL_RETRIEVE + self.SQL_AND_DATE_RANGE +
+                 (self.SQL_AND_TIME if time != "all" else "") +
+                 (self.SQL_AND_TAG if tag else "")) \
+            .format(table="readings", namespace_id=namespace_id, from_date=date_from, to_date=date_to,
+                    time=time, tag_id=tag_id)
+        return [query]
+
+    def _rollup_queries(self, namespace_id, date_from, date_to, tag_id, time):
+        query = self.SQL_RETRIEVE + self.SQL_AND_DATE_RANGE + (self.SQL_AND_TAG if tag_id is not None else "")
+        if time != "month":
+            return [query.format(table=ROLLUPS[time][0], namespace_id=namespace_id, tag_id=tag_id,
+                                 from_date=date_from, to_date=date_to)]
+        # whole months are read from readings_month, the days of partial months at either end are summed up
+        month_from, month_to = _month_range(date_from, date_to)
+        full_from = month_from if month_from == date_from else _next_month(month_from)
+        full_to = month_to if _month_end(month_to) == date_to else _previous_month(month_to)
+        if full_from > full_to:
+            return [self._sum_query("readings_day", namespace_id, date_from, date_to, tag_id, "month")]
+        queries = [query.format(table="readings_month", namespace_id=namespace_id, tag_id=tag_id,
+                                from_date=full_from, to_date=full_to)]
+        if date_from < full_from:
+            queries.insert(0, self._sum_query("readings_day", namespace_id, date_from, _previous_day(full_from),
+                                              tag_id, "month"))
+        if _next_month(full_to) <= date_to:
+            queries.append(self._sum_query("readings_day", namespace_id, _next_month(full_to), date_to,
+                                           tag_id, "month"))
+        return queries
+
+    def _row(self, value):
+        return (self._id("namespaces", value[0], create=True), fix_date(value[1]), value[2],
+                self._id("tags", value[3], create=True), float(value[4]))
+
+
+class _Converted(dict):
+    """Values converted by a function, each distinct value once"""
+
+    def __init__(self, convert):
+        super().__init__()
+        self.convert = convert
+
+    def __missing__(self, key):
+        value = self[key] = self.convert(key)
+        return value
+
+
+def _date_ranges(rows):
+    """{namespace_id: [from_date, to_date]} of rows"""
+    date_ranges = {}
+    for row in rows:
+        date_range = date_ranges.get(row[0])
+        if date_range is None:
+            date_ranges[row[0]] = [row[1], row[1]]
+        elif row[1] < date_range[0]:
+            date_range[0] = row[1]
+        elif row[1] > date_range[1]:
+            date_range[1] = row[1]
+    return date_ranges
+
+
+def _month_range(from_date, to_date):
+    """First days of the months of from_date and to_date"""
+    return from_date[0:8] + "01", to_date[0:8] + "01"
+
+
+def _month_end(month):
+    return _previous_day(_next_month(month))
+
+
+def _next_month(month):
+    year, month = int(month[0:4]), int(month[5:7])
+    return "{:04d}-{:02d}-01".format(year + month // 12, month % 12 + 1)
+
+
+def _previous_month(month):
+    year, month = int(month[0:4]), int(month[5:7])
+    return "{:04d}-{:02d}-01".format(year - (month == 1), (month - 2) % 12 + 1)
+
+
+def _previous_day(date):
+    return (datetime.date.fromisoformat(date) - datetime.timedelta(days=1)).isoformat()
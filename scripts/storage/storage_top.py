@@ -1,3 +1,6 @@
+FETCH_SIZE = 10000  # rows per batch of iter_range
+
+
 class Storage:
 
     def clear(self):
@@ -30,9 +33,37 @@ class Storage:
         """Retrieve values for the given range of dates."""
         pass
 
+    def retrieve_rows(self, namespace, from_date, to_date, tag=None, time="day"):
+        """The values of retrieve_range() as a list of (namespace, date, time, tag, value) rows."""
+        return [(ns, date, time_key, tag_key, value)
+                for ns, dates in self.retrieve_range(namespace, from_date, to_date, tag=tag, time=time).items()
+                for date, times in dates.items()
+                for time_key, tags in times.items()
+                for tag_key, value in tags.items()]
+
+    def iter_range(self, namespace, from_date, to_date, tag=None, time="day", batch_size=FETCH_SIZE):
+        """The values of retrieve_range() as lists of at most batch_size (namespace, date, time, tag, value) rows,
+        ordered by date and time."""
+        rows = self.retrieve_rows(namespace, from_date, to_date, tag=tag, time=time)
+        rows.sort(key=lambda row: (fix_date(row[1]), row[2]))
+        yield from batches(rows, batch_size)
+
+    def range_tags(self, namespace, from_date, to_date):
+        """Sorted tags with values between from_date and to_date."""
+        return sorted({row[3] for row in self.retrieve_rows(namespace, from_date, to_date)})
+
     def latest_date(self, namespace):
         pass
 
+    def record_window(self, namespace, from_date, to_date, count, complete):
+        """Record in the ingestion ledger that the dates from_date to to_date were ingested with count values.
+        Complete windows are not fetched again by noga.update."""
+        pass
+
+    def completed_windows(self, namespace):
+        """Returns the (from_date, to_date) windows recorded as complete for the namespace, sorted by date."""
+        return []
+
     def size(self):
         pass
 
@@ -46,6 +77,18 @@ def dict_key_value(d, key):
     return d.get(key)
 
 
+def batches(values, size):
+    """Split a sequence into lists of at most size items."""
+    batch = []
+    for value in values:
+        batch.append(value)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def fix_date(date):
     return date[6:10] + "-" + date[3:5] + "-" + date[0:2] if date[2] == "-" else date
 
@@ -1,6 +1,7 @@
 import scripts.storage.my_sql_storage as mysql
 import scripts.storage.postgres_storage as postgres
 import scripts.storage.in_mem_cache as cache
+import scripts.storage.columnar_cache as columnar
 import scripts.storage.in_mem_sql_storage as sqlite
 
 
@@ -9,8 +10,10 @@ def new_instance(uri):
         return mysql.MySqlStorage(uri)
     elif uri.startswith("postgres"):
         return postgres.PostgresStorage(uri)
+    elif uri.startswith("cache-columnar"):
+        return columnar.ColumnarCache(uri)
     elif uri.startswith("cache"):
-        return cache.InMemCache()
+        return cache.InMemCache(uri)
     elif uri.startswith("sqlite"):
         return sqlite.InMemSqlStorage(uri)
     raise ValueError("Wrong type of storage:", uri)
@@ -0,0 +1,160 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import scripts.noga as noga
+
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 2))
+UPLOAD_JOBS_KEPT = int(os.environ.get("UPLOAD_JOBS_KEPT", 100))  # finished jobs are forgotten after this many
+UPLOAD_MAX_FILE_MB = int(os.environ.get("UPLOAD_MAX_FILE_MB", 200))  # size of an Excel file, once decompressed
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR")  # where the uploaded files wait for their job, default: the temp directory
+UPLOAD_EXTENSIONS = (".xlsx", ".xls")
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+class UploadJob:
+    """Files of one batch upload, stored one after the other by a background worker."""
+
+    def __init__(self, source, files):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.created = time.time()
+        self.finished = None
+        self.files = [{"name": name, "state": "queued", "count": 0} for name, _, _ in files]
+
+    def state(self):
+        states = {file["state"] for file in self.files}
+        if states <= {"done", "failed"}:
+            return "failed" if states == {"failed"} else "done"
+        return "queued" if states == {"queued"} else "running"
+
+    def to_dict(self):
+        with _lock:
+            return {
+                "job": self.id,
+                "source": self.source,
+                "state": self.state(),
+                "files": [dict(file) for file in self.files],
+                "done": sum(file["state"] in ("done", "failed") for file in self.files),
+                "total": len(self.files),
+                "count": sum(file["count"] for file in self.files),
+                "created": self.created,
+                "finished": self.finished,
+            }
+
+
+def submit(store, source, parts):
+    """Queue the (file name, file object) uploaded parts, zip archives standing for the Excel files they hold.
+    The parts are copied to temporary files, the archives are only decompressed by the worker, a file at a time.
+    Returns the job, whose progress is available from get() while a worker stores the files.
+    Raises ValueError if there are no files or a file is larger than UPLOAD_MAX_FILE_MB,
+    zipfile.BadZipFile for a broken archive."""
+    paths = []
+    try:
+        for name, f in parts:
+            paths.append((name, spool(f)))
+        files = list_files(paths)
+        if not files:
+            raise ValueError("No files to upload")
+    except Exception:
+        remove(path for _, path in paths)
+        raise
+    job = UploadJob(source, files)
+    with _lock:
+        _jobs[job.id] = job
+        finished = [job_id for job_id, a_job in _jobs.items() if a_job.finished]
+        for job_id in finished[:max(len(finished) - UPLOAD_JOBS_KEPT, 0)]:
+            del _jobs[job_id]
+    logging.info("Upload job %s queued with %s file(s)", job.id, len(files))
+    _executor.submit(_run, store, job, files, [path for _, path in paths])
+    return job
+
+
+def get(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def spool(f):
+    """Copy the file object to a temporary file, returns its path."""
+    with tempfile.NamedTemporaryFile(prefix="upload-", dir=UPLOAD_DIR, delete=False) as temp:
+        shutil.copyfileobj(f, temp)
+    return temp.name
+
+
+def list_files(paths):
+    """The (file name, path, archive member or None) files of the (file name, path) uploaded parts,
+    reading only the directories of the zip archives."""
+    files = []
+    for name, path in paths:
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir() and info.filename.lower().endswith(UPLOAD_EXTENSIONS) \
+                            and not info.filename.startswith("__MACOSX/"):
+                        check_size(name + "/" + info.filename, info.file_size)
+                        files.append((name + "/" + info.filename, path, info))
+        else:
+            check_size(name, os.path.getsize(path))
+            files.append((name, path, None))
+    return files
+
+
+def check_size(name, size):
+    if size > UPLOAD_MAX_FILE_MB * 1024 * 1024:
+        raise ValueError("File {} is larger than {} MB".format(name, UPLOAD_MAX_FILE_MB))
+
+
+def read_file(path, member):
+    if member is None:
+        with open(path, "rb") as f:
+            return f.read()
+    with zipfile.ZipFile(path) as archive:
+        # reads no more than the size checked by list_files, whatever the compressed data holds
+        return archive.read(member)
+
+
+def remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as ex:
+            logging.warning("Could not remove %s: %s", path, ex)
+
+
+def _run(store, job, files, paths):
+    try:
+        for file, (name, path, member) in zip(job.files, files):
+            _update(file, state="running")
+            try:
+                if job.source == "noga":
+                    result = noga.upload_bytes(store, name, read_file(path, member))
+                else:
+                    result = {"failure": "Unsupported source {}".format(job.source)}
+            except Exception as ex:
+                logging.exception("Upload job %s failed to store %s", job.id, name)
+                result = {"failure": str(ex)}
+            if "success" in result:
+                _update(file, state="done", count=result["count"])
+            else:
+                _update(file, state="failed", failure=result["failure"])
+    finally:
+        remove(paths)
+    with _lock:
+        job.finished = time.time()
+    logging.info("Upload job %s finished: %s", job.id, job.to_dict()["state"])
+
+
+def _update(file, **values):
+    with _lock:
+        file.update(values)
@@ -0,0 +1,270 @@
+"""Load test of the server's /get and of the Dash callbacks of the heatmap, storage and bar chart pages.
+Not a unit test, run it directly, e.g.:
+
+    PYTHONPATH=. python test/bench_load.py --storage sqlite://load.db --days 90 --users 16 --duration 60
+
+With --storage it starts a server process like manager.py on ports 9999 and 9998, with the given store filled
+with --days of synthetic data until yesterday (sqlite:// or cache:// stores, the store is cleared), and reports
+the growth of its RSS. Without it, it runs against --url and --dash-url, e.g. a server started with
+
+    PYTHONPATH=. python test/bench_load.py serve --storage sqlite://load.db --days 90
+
+Every user sends requests of the traffic mix one after the other, optionally waiting --think seconds in between.
+Prints throughput and p50/p95/p99 latency per request kind and in total as JSON.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage"))
+import bench_storage  # noqa: E402
+
+SERVER_URL = "http://localhost:9999"
+DASH_URL = "http://localhost:9998"
+DASH_UPDATE_PATH = "/_dash-update-component"
+GET_FORMATS = ["json", "bin", "html", "csv", "tsv", "ndjson", "arrow", "parquet"]
+GET_TIMES = ["all", "hour", "day", "month"]
+GET_RANGES = {"day": 1, "week": 7, "month": 30, "year": 365}  # days until yesterday, time=all up to a month
+SEEDED_NAMESPACES = ["noga2.energy", "noga2.smp"]
+NAMESPACE_TAGS = bench_storage.namespace_tags()
+WIDTH = 1400  # browser window width sent to the Dash callbacks
+
+
+def date_before(days, date_format="%d-%m-%Y"):
+    return (datetime.date.today() - datetime.timedelta(days=days)).strftime(date_format)
+
+
+def get_request(rng):
+    """A /get of a seeded namespace in a random format, granularity and range."""
+    a_format, a_time = rng.choice(GET_FORMATS), rng.choice(GET_TIMES)
+    range_name = rng.choice([name for name, days in GET_RANGES.items() if a_time != "all" or days <= 30])
+    namespace = rng.choice(SEEDED_NAMESPACES)
+    source, a_type = namespace.split(".", 1)
+    params = {"source": source, "type": a_type, "format": a_format, "time": a_time,
+              "start_date": date_before(GET_RANGES[range_name]), "end_date": date_before(1)}
+    if rng.random() < 0.3:
+        params["tag"] = rng.choice(NAMESPACE_TAGS[namespace])
+    return "get_" + a_format, "GET", SERVER_URL + "/get", {"params": params}
+
+
+def dash_request(name, outputs, inputs, changed):
+    """A Dash callback request: outputs as (id, property), inputs as (id, property, value), changed the index of
+    the input that triggered the callback."""
+    output_specs = [{"id": an_id, "property": prop} for an_id, prop in outputs]
+    body = {
+        "output": ".".join(outputs[0]) if len(outputs) == 1 else
+        ".." + "...".join(".".join(output) for output in outputs) + "..",
+        "outputs": output_specs[0] if len(outputs) == 1 else output_specs,
+        "inputs": [{"id": an_id, "property": prop, "value": value} for an_id, prop, value in inputs],
+        "changedPropIds": [".".join(inputs[changed][:2])],
+        "state": [],
+    }
+    return name, "POST", DASH_URL + DASH_UPDATE_PATH, {"json": body}
+
+
+def heatmap_request(rng):
+    inputs = [("sources-radioitems", "value", rng.choice(["Pv", "Wind", "Gas", "ActualDemand", "BatteriesNet"])),
+              ("freeze-scale", "value", []),
+              ("display-mode-radioitems", "value", rng.choice(["Absolute", "Percent"])),
+              ("window-width-store", "data", WIDTH)]
+    return dash_request("dash_heatmap", [("heatmap-graph", "figure")], inputs, 0)
+
+
+def storage_request(rng):
+    outputs = [("storage-graph-store", "data"), ("cumulative-graph", "figure"), ("daily-graph", "figure"),
+               ("daily-energy-graph", "figure"), ("storage-info", "children"), ("storage-date-range", "start_date"),
+               ("storage-date-range", "end_date"), ("storage-date-range", "min_date_allowed"),
+               ("storage-date-range", "max_date_allowed")]
+    button = rng.choice(["btn-last-week", "btn-last-month", "btn-last-year"])
+    inputs = [("storage-date-range", "start_date", date_before(7, "%Y-%m-%d")),
+              ("storage-date-range", "end_date", date_before(1, "%Y-%m-%d")),
+              ("storage-source-radio", "value", rng.choice(["BatteriesNet", "PspNet"])),
+              ("graph-type-checklist", "value", rng.choice([[], ["xy"]])),
+              ("btn-last-week", "n_clicks", 1 if button == "btn-last-week" else 0),
+              ("btn-last-month", "n_clicks", 1 if button == "btn-last-month" else 0),
+              ("btn-last-year", "n_clicks", 1 if button == "btn-last-year" else 0),
+              ("window-width-store", "data", WIDTH)]
+    return dash_request("dash_storage", outputs, inputs, [input[0] for input in inputs].index(button))
+
+
+def bar_chart_request(rng):
+    year = datetime.date.today().year
+    inputs = [("year-range-slider", "value", [rng.randint(2021, year - 1), year])]
+    return dash_request("dash_bar_chart", [("main-graph", "figure")], inputs, 0)
+
+
+# (weight, request builder), about what a dashboard visit with some API use looks like
+TRAFFIC_MIX = [
+    (5, get_request),
+    (2, heatmap_request),
+    (2, storage_request),
+    (1, bar_chart_request),
+]
+
+
+def user(index, deadline, think, results, lock):
+    rng = random.Random(index)
+    session = requests.Session()
+    weights = [weight for weight, _ in TRAFFIC_MIX]
+    builders = [builder for _, builder in TRAFFIC_MIX]
+    while time.monotonic() < deadline:
+        name, method, url, kwargs = rng.choices(builders, weights)[0](rng)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=300, **kwargs)
+            size, ok = len(response.content), response.ok
+        except requests.RequestException:
+            size, ok = 0, False
+        seconds = time.perf_counter() - start
+        with lock:
+            results.setdefault(name, []).append((seconds, ok, size))
+        if think:
+            time.sleep(rng.uniform(0, 2 * think))
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summary(samples, seconds):
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    return {
+        "requests": len(samples),
+        "errors": sum(not sample[1] for sample in samples),
+        "requests_per_second": round(len(samples) / seconds, 2),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "p50_ms": round(percentile(latencies, 0.5), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "mean_bytes": round(statistics.mean(sample[2] for sample in samples)),
+    }
+
+
+class RssMonitor(threading.Thread):
+    """Samples the RSS of a process every second."""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.process = psutil.Process(pid)
+        self.start_rss = self.peak_rss = self.end_rss = self.process.memory_info().rss
+        self.running = True
+
+    def run(self):
+        while self.running:
+            self.end_rss = self.process.memory_info().rss
+            self.peak_rss = max(self.peak_rss, self.end_rss)
+            time.sleep(1)
+
+    def stop(self):
+        self.running = False
+        self.join()
+        return {"start_bytes": self.start_rss, "end_bytes": self.end_rss, "peak_bytes": self.peak_rss,
+                "growth_bytes": self.end_rss - self.start_rss}
+
+
+def run_load(users, duration, think, warmup, pid=None):
+    results, lock = {}, threading.Lock()
+    if warmup:  # the first calls fill the pages' data and the caches
+        user(-1, time.monotonic() + warmup, 0, {}, lock)
+    monitor = RssMonitor(pid) if pid else None
+    if monitor:
+        monitor.start()
+    start = time.monotonic()
+    threads = [threading.Thread(target=user, args=(i, start + duration, think, results, lock)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.monotonic() - start
+    report = {
+        "users": users,
+        "seconds": round(seconds, 1),
+        "total": summary([sample for samples in results.values() for sample in samples], seconds),
+        "requests": {name: summary(samples, seconds) for name, samples in sorted(results.items())},
+    }
+    if monitor:
+        report["rss"] = monitor.stop()
+    return report
+
+
+def serve(storage_uri, days):
+    """Run the server and the charts in this process like manager.py, with the store filled with synthetic data."""
+    os.environ["STORAGE_URI"] = storage_uri
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+    from scripts import data_service, server
+    server.store.clear()
+    start_date = datetime.date.today() - datetime.timedelta(days=days)
+    for namespace in SEEDED_NAMESPACES:
+        bench_storage.timed_insert(server.store, bench_storage.synthetic_rows(namespace, NAMESPACE_TAGS[namespace],
+                                                                              days, start_date))
+    data_service.register(server.store, server.result_cache)
+    threading.Thread(target=server.main, daemon=True).start()
+    import charts
+    charts.main()
+
+
+def start_server(storage_uri, days):
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--storage", storage_uri,
+                                "--days", str(days)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 600
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited with {}".format(process.returncode))
+        try:
+            requests.get(SERVER_URL + "/metrics", timeout=1)
+            requests.get(DASH_URL + "/", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(1)
+    process.kill()
+    raise RuntimeError("Server didn't start")
+
+
+def main(argv=None):
+    global SERVER_URL, DASH_URL
+    parser = argparse.ArgumentParser(description="Load test of /get and the Dash callbacks")
+    parser.add_argument("mode", nargs="?", choices=["run", "serve"], default="run")
+    parser.add_argument("--storage", help="start a server with this sqlite:// or cache:// store, it is cleared")
+    parser.add_argument("--days", type=int, default=90, help="days of synthetic data in the started server")
+    parser.add_argument("--url", default=SERVER_URL, help="server URL when not started by the test")
+    parser.add_argument("--dash-url", default=DASH_URL, help="charts URL when not started by the test")
+    parser.add_argument("--pid", type=int, help="process to report the RSS of when not started by the test")
+    parser.add_argument("--users", type=int, default=8, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--think", type=float, default=0, help="mean seconds a user waits between requests")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds of a single user before measuring")
+    parser.add_argument("--output", help="file to write the JSON results to, as well as printing them")
+    args = parser.parse_args(argv)
+    if args.mode == "serve":
+        if not args.storage:
+            parser.error("serve needs --storage")
+        serve(args.storage, args.days)
+        return
+    SERVER_URL, DASH_URL = args.url, args.dash_url
+    process = start_server(args.storage, args.days) if args.storage else None
+    try:
+        report = run_load(args.users, args.duration, args.think, args.warmup, process.pid if process else args.pid)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+    output = json.dumps({"storage": args.storage, "days": args.days, "commit": bench_storage.commit(),
+                         "report": report}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+
+from scripts.pages import data_plane
+from scripts.pages.day_matrix import DayMatrix, TIMES
+
+
+def matrix(days, scale=1.0):
+    m = DayMatrix()
+    for day in range(1, days + 1):
+        m.update(datetime(2024, 1, day), {time: scale * (day + slot) for slot, time in enumerate(TIMES[::12])})
+    return m
+
+
+class TestDataPlane(unittest.TestCase):
+    """One process both publishes and reads here, publish() keeps the version of the publisher apart like
+    a publisher process would, reader() forgets what was mapped like a new reader process."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        for name, value in [("CHART_DATA_DIR", self.dir), ("_published", {}), ("_version", None),
+                            ("_manifest_mtime", None), ("_matrices", {}), ("_prefixes", {})]:
+            patcher = mock.patch.object(data_plane, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.publisher_version = None
+
+    def publish(self, matrices):
+        reader_version, data_plane._version = data_plane._version, self.publisher_version
+        data_plane.publish(matrices)
+        self.publisher_version, data_plane._version = data_plane._version, reader_version
+
+    def reader(self):
+        data_plane._version, data_plane._manifest_mtime, data_plane._matrices = None, None, {}
+        data_plane._prefixes.clear()
+
+    def files(self):
+        return sorted(name for name in os.listdir(self.dir) if name.endswith(".npy"))
+
+    def assertSameMatrix(self, expected, mapped):
+        self.assertTrue(mapped.read_only)
+        self.assertEqual(expected.dates, mapped.dates)
+        np.testing.assert_array_equal(expected.values(), mapped.values())
+        np.testing.assert_array_equal(expected.summary().to_numpy(), mapped.summary().to_numpy())
+        self.assertTrue(expected.frame().equals(mapped.frame()))
+
+    def test_nothing_published(self):
+        self.assertIsNone(data_plane.load())
+
+    def test_round_trip(self):
+        pv, wind = matrix(3), matrix(5, 2.0)
+        self.publish({"Pv": pv, "Wind": wind})
+        self.assertEqual(6, len(self.files()))
+        self.reader()
+        loaded = data_plane.load()
+        self.assertEqual({"Pv", "Wind"}, set(loaded))
+        self.assertSameMatrix(pv, loaded["Pv"])
+        self.assertSameMatrix(wind, loaded["Wind"])
+        self.assertIsInstance(loaded["Pv"].values(), np.memmap)
+        self.assertIs(loaded, data_plane.load())  # unchanged, not mapped again
+
+    def test_changed_source_replaced(self):
+        pv, wind = matrix(3), matrix(5)
+        self.publish({"Pv": pv, "Wind": wind})
+        self.reader()
+        first = data_plane.load()
+        files = self.files()
+        pv.update(datetime(2024, 1, 4), {"10:00": 42.0})
+        self.publish({"Pv": pv, "Wind": wind})
+        self.assertEqual(6, len(self.files()))  # the files of the previous Pv are removed
+        self.assertEqual(3, len(set(files) & set(self.files())))  # the files of Wind are kept
+        data_plane._manifest_mtime = None  # the manifest may be rewritten within the mtime resolution
+        second = data_plane.load()
+        self.assertIs(first["Wind"], second["Wind"])
+        self.assertSameMatrix(pv, second["Pv"])
+
+    def test_nothing_changed(self):
+        pv = matrix(3)
+        self.publish({"Pv": pv})
+        files, version = self.files(), self.publisher_version
+        self.publish({"Pv": pv})
+        self.assertEqual((files, version), (self.files(), self.publisher_version))
+
+    def test_removed_source(self):
+        pv, wind = matrix(3), matrix(5)
+        self.publish({"Pv": pv, "Wind": wind})
+        self.publish({"Pv": pv})
+        self.assertEqual(3, len(self.files()))
+        self.reader()
+        self.assertEqual({"Pv"}, set(data_plane.load()))
+
+    def test_new_publisher_continues_version(self):
+        self.publish({"Pv": matrix(3)})
+        version = self.publisher_version
+        self.publisher_version, data_plane._published = None, {}
+        self.publish({"Pv": matrix(3)})
+        self.assertEqual(version + 1, self.publisher_version)
+
+    def test_stale_manifest(self):
+        self.publish({"Pv": matrix(3)})
+        self.reader()
+        mapped = data_plane.load()
+        # a manifest of files that were already replaced by a newer version
+        with open(os.path.join(self.dir, data_plane.MANIFEST), "w") as f:
+            json.dump({"version": 99, "sources": {"Pv": {"prefix": "98.0", "version": 7}}}, f)
+        data_plane._manifest_mtime = None
+        self.assertIs(mapped, data_plane.load())  # keeps what it mapped
+        self.reader()
+        self.assertIsNone(data_plane.load())
+
+    def test_missing_manifest(self):
+        self.publish({"Pv": matrix(3)})
+        os.remove(os.path.join(self.dir, data_plane.MANIFEST))
+        self.reader()
+        self.assertIsNone(data_plane.load())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import unittest
+from parameterized import parameterized
+from scripts.json_stream import JsonArrayStream
+
+ITEMS = [
+    {"Date": "01/02/2022", "Time": "10:00", "Pv": "1.5"},
+    {"text": "comma, \"quote\" ] bracket } brace \\ backslash", "unicode": "שלום €"},
+    {"numbers": [0, -1, 12345678901234567890, 3.25, -1e-7, 6.02E+23], "flags": [True, False, None]},
+    {"nested": {"a": {"b": [1, {"c": []}]}, "d": {}}},
+    "a string item",
+    -42.5,
+    [],
+]
+
+
+def feed_in_chunks(stream, data, size):
+    items = []
+    for start in range(0, len(data), size):
+        items.extend(stream.feed(data[start:start + size]))
+    return items + stream.close()
+
+
+class TestJsonArrayStream(unittest.TestCase):
+    @parameterized.expand([(1,), (2,), (3,), (7,), (64,), (100000,)])
+    def test_chunk_boundaries(self, size):
+        data = json.dumps(ITEMS, ensure_ascii=False).encode("utf-8")
+        self.assertEqual(ITEMS, feed_in_chunks(JsonArrayStream(), data, size))
+
+    @parameterized.expand([(1,), (5,), (100000,)])
+    def test_key(self, size):
+        document = {"skipped": [{"x": "]"}, 1], "other": "\"data\": [", "data": ITEMS, "after": {"data": [0]}}
+        data = json.dumps(document).encode("utf-8")
+        self.assertEqual(ITEMS, feed_in_chunks(JsonArrayStream("data"), data, size))
+
+    def test_items_as_they_complete(self):
+        stream = JsonArrayStream()
+        self.assertEqual([{"a": 1}], stream.feed(b'[{"a": 1}, {"b": "x'))
+        self.assertEqual([{"b": "xy"}, {"c": 2}], stream.feed(b'y"}, {"c": 2}, {"d": "a longer item that'))
+        # re-parsed once the buffer doubled, or at the latest by close()
+        self.assertEqual([{"d": "a longer item that ends"}], stream.feed(b' ends"}]') + stream.close())
+
+    def test_number_split_across_chunks(self):
+        stream = JsonArrayStream()
+        self.assertEqual([], stream.feed(b"[12"))  # the number may continue
+        self.assertEqual([], stream.feed(b"3."))
+        self.assertEqual([], stream.feed(b"5e"))
+        self.assertEqual([1235.0], stream.feed(b"1, -"))
+        self.assertEqual([-7], stream.feed(b"7]"))
+        self.assertEqual([], stream.close())
+
+    def test_escape_split_across_chunks(self):
+        stream = JsonArrayStream()
+        items = stream.feed(b'["a\\') + stream.feed(b'"b\\u05') + stream.feed(b'e9"]')
+        self.assertEqual(['a"bש'], items + stream.close())
+
+    def test_multibyte_character_split_across_chunks(self):
+        data = json.dumps(["ש"], ensure_ascii=False).encode("utf-8")
+        self.assertEqual(["ש"], feed_in_chunks(JsonArrayStream(), data, 1))
+
+    def test_whitespace(self):
+        data = b' \n[ 1 ,\t2\r\n, { "a" : [ ] } ] \n'
+        self.assertEqual([1, 2, {"a": []}], feed_in_chunks(JsonArrayStream(), data, 1))
+
+    def test_empty_array(self):
+        self.assertEqual([], feed_in_chunks(JsonArrayStream(), b"[]", 1))
+        self.assertEqual([], feed_in_chunks(JsonArrayStream("data"), b'{"data": []}', 1))
+
+    @parameterized.expand([
+        ("empty", b""),
+        ("in_item", b'[{"a": 1}, {"b": '),
+        ("in_string", b'["abc'),
+        ("no_end", b"[1, 2"),
+        ("no_key_array", b'{"data": '),
+    ])
+    def test_truncated(self, _, data):
+        with self.assertRaises(ValueError):
+            feed_in_chunks(JsonArrayStream("data" if data.startswith(b"{") else None), data, 3)
+
+    def test_truncated_keeps_complete_items(self):
+        stream = JsonArrayStream()
+        self.assertEqual([1, 2], stream.feed(b"[1, 2, 3"))
+        self.assertRaises(ValueError, stream.close)
+
+    @parameterized.expand([
+        ("not_array", None, b'{"a": 1}'),
+        ("not_object", "data", b"[1]"),
+        ("missing_key", "data", b'{"other": [1]}'),
+        ("key_not_array", "data", b'{"data": {"a": 1}}'),
+        ("no_colon", "data", b'{"data" [1]}'),
+        ("bad_item", None, b"[1, nope]"),
+    ])
+    def test_invalid(self, _, key, data):
+        with self.assertRaises(ValueError):
+            feed_in_chunks(JsonArrayStream(key), data, 100000)
+
+
+if __name__ == '__main__':
+    unittest.main()
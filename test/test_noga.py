@@ -0,0 +1,173 @@
+import datetime
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+import scripts.noga as noga
+import scripts.storage.storage_util as storage
+
+NAMESPACE = "noga2.energy"
+TYPE_START = datetime.date(2023, 3, 5)  # start date of the energy type
+TODAY = datetime.date.today()
+SETTLED_UNTIL = TODAY - datetime.timedelta(days=noga.LEDGER_SETTLE_DAYS + 1)
+
+
+def day(value):
+    return datetime.date.fromisoformat(value)
+
+
+def days(count):
+    return datetime.timedelta(days=count)
+
+
+def ledger_date(date):
+    return date.strftime(noga.DATE_FORMAT)
+
+
+class TestDfToValues(unittest.TestCase):
+    def test_df_to_values(self):
+        df = pd.DataFrame({
+            "Date": [datetime.datetime(2022, 2, 1), "02/02/2022", "03-02-2022", "03-02-2022"],
+            "Time": [datetime.time(10, 0), datetime.time(10, 5, 30), "10:10", "10:10"],
+            "Pv (MW)": [1.5, "-", "3.2 x", "3.2 x"],
+            "Unnamed: 3": ["a", "b", "c", "c"],
+            "Wind [MW]": [None, "", 4, 4],
+            "Actual Demand": [7, 8, 9, 9],
+        })
+        self.assertEqual([
+            (NAMESPACE, "01-02-2022", "10:00", "Pv", 1.5),
+            (NAMESPACE, "01-02-2022", "10:00", "ActualDemand", 7.0),
+            (NAMESPACE, "02-02-2022", "10:05", "ActualDemand", 8.0),
+            (NAMESPACE, "03-02-2022", "10:10", "Pv", 3.2),
+            (NAMESPACE, "03-02-2022", "10:10", "Wind", 4.0),
+            (NAMESPACE, "03-02-2022", "10:10", "ActualDemand", 9.0),
+        ], noga.df_to_values(NAMESPACE, df))
+
+    def test_datetime_dates(self):
+        df = pd.DataFrame({"Date": pd.to_datetime(["2022-02-01", "2022-02-02"]), "Time": ["00:00:00", "23:55:00"],
+                           "Pv": [1, 2]})
+        self.assertEqual([(NAMESPACE, "01-02-2022", "00:00", "Pv", 1.0), (NAMESPACE, "02-02-2022", "23:55", "Pv", 2.0)],
+                         noga.df_to_values(NAMESPACE, df))
+
+    def test_to_numbers(self):
+        np.testing.assert_array_equal([1.0, 2.5, np.nan], noga.to_numbers(pd.Series([1, 2.5, None])))
+        np.testing.assert_array_equal([1.0, -2.5, 3.2, 4.0, np.nan, np.nan, np.nan, np.nan],
+                                      noga.to_numbers(pd.Series([1, "-2.5", "3.2 x", " 4 ", "-", "", None, "x 5"])))
+
+
+class TestWindows(unittest.TestCase):
+    def test_date_windows(self):
+        self.assertEqual([(day("2022-02-01"), day("2022-02-05")), (day("2022-02-06"), day("2022-02-10"))],
+                         noga.date_windows(day("2022-02-01"), day("2022-02-10"), 5))
+        self.assertEqual([(day("2022-02-01"), day("2022-02-05")), (day("2022-02-06"), day("2022-02-06"))],
+                         noga.date_windows(day("2022-02-01"), day("2022-02-06"), 5))
+        self.assertEqual([(day("2022-02-01"), day("2022-02-01"))],
+                         noga.date_windows(day("2022-02-01"), day("2022-02-01"), 5))
+        self.assertEqual([(day("2022-02-01"), day("2022-02-01")), (day("2022-02-02"), day("2022-02-02"))],
+                         noga.date_windows(day("2022-02-01"), day("2022-02-02"), 1))
+        self.assertEqual([], noga.date_windows(day("2022-02-02"), day("2022-02-01"), 5))
+
+    def test_missing_ranges(self):
+        start, end = day("2022-02-01"), day("2022-02-28")
+        self.assertEqual([(start, end)], noga.missing_ranges(start, end, []))
+        self.assertEqual([], noga.missing_ranges(start, end, [(day("2022-01-01"), day("2022-03-31"))]))
+        # gaps at the start, in the middle and at the end, windows unsorted and partly outside the range
+        completed = [(day("2022-02-15"), day("2022-02-20")), (day("2022-02-05"), day("2022-02-10")),
+                     (day("2022-01-01"), day("2022-01-10")), (day("2022-03-01"), day("2022-03-05"))]
+        self.assertEqual([(day("2022-02-01"), day("2022-02-04")), (day("2022-02-11"), day("2022-02-14")),
+                          (day("2022-02-21"), end)],
+                         noga.missing_ranges(start, end, completed))
+        # windows that overlap the start and each other, adjacent windows
+        completed = [(day("2022-01-20"), day("2022-02-03")), (day("2022-02-02"), day("2022-02-09")),
+                     (day("2022-02-10"), day("2022-02-12"))]
+        self.assertEqual([(day("2022-02-13"), end)], noga.missing_ranges(start, end, completed))
+
+
+class FakeClient:
+    """NogaClient returning the day items of responses[(from_date, to_date)], none for other windows."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def __call__(self, *args):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def post_stream(self, path, from_date, to_date, token, key=None):
+        self.requests.append((from_date, to_date))
+        for item in self.responses.get((from_date, to_date), []):
+            yield item
+
+
+def day_items(date, value):
+    return [{"date": date.strftime("%d/%m/%Y"), "hourlyData": [{"time": "10:00", "coal": value}]}]
+
+
+class TestUpdate(unittest.TestCase):
+    def setUp(self):
+        self.store = storage.new_instance("cache")
+        self.requested = []
+
+    async def fetch_windows(self, store, windows, new_keys, settled_until):
+        self.requested.extend(window for _, window in windows)
+        return [0] * len(windows)
+
+    def update(self, end_date=None, start_date=None, window_days=5):
+        with mock.patch.object(noga, "fetch_windows", self.fetch_windows):
+            return noga.update(self.store, "energy", start_date, end_date, window_days)
+
+    def test_only_missing_windows(self):
+        self.store.record_window(NAMESPACE, ledger_date(TYPE_START), "31-01-2024", 10, True)
+        self.store.record_window(NAMESPACE, "11-02-2024", "20-02-2024", 10, True)
+        self.store.record_window(NAMESPACE, "21-02-2024", "23-02-2024", 10, False)  # not complete
+        self.update("29-02-2024")
+        self.assertEqual([(day("2024-02-01"), day("2024-02-05")), (day("2024-02-06"), day("2024-02-10")),
+                          (day("2024-02-21"), day("2024-02-25")), (day("2024-02-26"), day("2024-02-29"))],
+                         self.requested)
+
+    def test_start_date_fetches_complete_windows(self):
+        self.store.record_window(NAMESPACE, ledger_date(TYPE_START), "31-01-2024", 10, True)
+        self.update("08-01-2024", start_date="01-01-2024")
+        self.assertEqual([(day("2024-01-01"), day("2024-01-05")), (day("2024-01-06"), day("2024-01-08"))],
+                         self.requested)
+
+    def test_windows_split_at_settled_date(self):
+        self.store.record_window(NAMESPACE, ledger_date(TYPE_START), ledger_date(SETTLED_UNTIL - days(3)), 10, True)
+        self.update(window_days=30)
+        self.assertEqual([(SETTLED_UNTIL - days(2), SETTLED_UNTIL), (SETTLED_UNTIL + days(1), TODAY)],
+                         self.requested)
+
+    def test_ledger_seeded_from_latest_date(self):
+        self.store.insert(NAMESPACE, "10-02-2024", "10:00", "Coal", 1.0)
+        self.update("15-02-2024")
+        # the latest date may be partial, it is fetched again
+        self.assertEqual([(day("2024-02-10"), day("2024-02-14")), (day("2024-02-15"), day("2024-02-15"))],
+                         self.requested)
+        self.assertEqual([(ledger_date(TYPE_START), "09-02-2024")],
+                         [tuple(ledger_date(noga.parse_date(date)) for date in window)
+                          for window in self.store.completed_windows(NAMESPACE)])
+
+    def test_complete_only_when_settled_and_not_empty(self):
+        self.store.record_window(NAMESPACE, ledger_date(TYPE_START), "31-01-2024", 10, True)
+        client = FakeClient({("01-02-2024", "05-02-2024"): day_items(day("2024-02-01"), 5),
+                             (ledger_date(SETTLED_UNTIL + days(1)), ledger_date(TODAY)): day_items(TODAY, 6)})
+        with mock.patch.object(noga.noga_client, "NogaClient", client), \
+                mock.patch.object(noga, "missing_ranges", lambda start, end, completed:
+                                  [(day("2024-02-01"), day("2024-02-10")), (SETTLED_UNTIL + days(1), TODAY)]):
+            message = noga.update(self.store, "energy", None, None, 5)
+        self.assertIn("Inserted 2 values", message)
+        self.assertEqual(3, len(client.requests))
+        # 06-02 to 10-02 was empty, today isn't settled
+        self.assertEqual([(ledger_date(TYPE_START), "31-01-2024"), ("01-02-2024", "05-02-2024")],
+                         [tuple(ledger_date(noga.parse_date(date)) for date in window)
+                          for window in self.store.completed_windows(NAMESPACE)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import json
+import os
+import unittest
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import plotly.utils
+
+from scripts.pages import render_pool
+from scripts.pages.heatmap import heatmap_figure
+
+SHM_DIR = "/dev/shm"
+
+
+def heatmap_data():
+    dates = pd.date_range("2024-01-01", periods=40)
+    times = ["{:02d}:{:02d}".format(m // 60, m % 60) for m in range(0, 24 * 60, 5)]
+    values = np.arange(len(times) * len(dates), dtype=float).reshape(len(times), len(dates)) % 97
+    return {"values": values, "dates": dates.values, "times": times, "scatter_y": values.sum(axis=0)}
+
+
+def failing(data):
+    raise ValueError("bad data {}".format(data["values"].shape))
+
+
+def as_json(figure):
+    return json.loads(json.dumps(figure if isinstance(figure, dict) else figure.to_dict(),
+                                 cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def shared_blocks():
+    return {name for name in os.listdir(SHM_DIR) if name.startswith("psm_")} if os.path.isdir(SHM_DIR) else set()
+
+
+class TestRenderPool(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(render_pool, "RENDER_PROCESSES", 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.shutdown)
+        self.blocks = shared_blocks()
+
+    @staticmethod
+    def shutdown():
+        if render_pool._executor is not None:
+            render_pool._executor.shutdown()
+            render_pool._executor = None
+
+    def test_same_figure_as_in_process(self):
+        data = heatmap_data()
+        figure = render_pool.render(heatmap_figure, data, False, 0, 100, [0, 5000], 800)
+        self.assertIsInstance(figure, dict)
+        self.assertEqual(as_json(heatmap_figure(data, False, 0, 100, [0, 5000], 800)), as_json(figure))
+        self.assertEqual(self.blocks, shared_blocks())  # the shared memory is unlinked
+
+    def test_exception(self):
+        with self.assertRaisesRegex(ValueError, r"bad data \(288, 40\)"):
+            render_pool.render(failing, heatmap_data())
+        self.assertEqual(self.blocks, shared_blocks())
+        self.assertIsNotNone(render_pool._executor)  # the pool is still used
+
+    def test_broken_pool_falls_back(self):
+        executor = render_pool._pool()
+        data = heatmap_data()
+        with mock.patch.object(executor, "submit", side_effect=BrokenProcessPool("gone")):
+            figure = render_pool.render(heatmap_figure, data, True, 0, 100, [0, 100], 800)
+        self.assertEqual(as_json(heatmap_figure(data, True, 0, 100, [0, 100], 800)), as_json(figure))
+        self.assertIsNone(render_pool._executor)  # the next render starts a new pool
+        self.assertEqual(self.blocks, shared_blocks())
+
+    def test_without_pool(self):
+        with mock.patch.object(render_pool, "RENDER_PROCESSES", 0):
+            data = heatmap_data()
+            figure = render_pool.render(heatmap_figure, data, False, 0, 100, [0, 5000], 800)
+        self.assertNotIsInstance(figure, dict)  # a go.Figure, built in this thread
+        self.assertIsNone(render_pool._executor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from unittest import mock
+from scripts.result_cache import ResultCache
+
+NAMESPACE = "noga2.energy"
+NAMESPACE_2 = "noga2.smp"
+FROM_DATE = "2022-02-01"
+TO_DATE = "2022-02-10"
+
+
+class TestResultCache(unittest.TestCase):
+    def put(self, cache, key, size=1, namespaces=(NAMESPACE,), from_date=FROM_DATE, to_date=TO_DATE, version=None):
+        cache.put(key, "value " + key, size, namespaces, from_date, to_date,
+                  cache.version() if version is None else version)
+
+    def test_get_put(self):
+        cache = ResultCache()
+        self.assertIsNone(cache.get("a"))
+        self.put(cache, "a", size=10)
+        self.assertEqual("value a", cache.get("a"))
+        self.assertEqual((1, 10), cache.size())
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_put_replaces(self):
+        cache = ResultCache()
+        self.put(cache, "a", size=10)
+        cache.put("a", "new", 3, [NAMESPACE], FROM_DATE, TO_DATE, cache.version())
+        self.assertEqual("new", cache.get("a"))
+        self.assertEqual((1, 3), cache.size())
+
+    def test_lru_eviction(self):
+        cache = ResultCache(max_entries=2)
+        self.put(cache, "a")
+        self.put(cache, "b")
+        cache.get("a")  # b is now the least recently used
+        self.put(cache, "c")
+        self.assertEqual("value a", cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual("value c", cache.get("c"))
+        self.assertEqual((2, 2), cache.size())
+
+    def test_size_budget(self):
+        cache = ResultCache(max_size=100)
+        self.put(cache, "a", size=40)
+        self.put(cache, "b", size=40)
+        self.put(cache, "c", size=40)  # evicts a, the least recently used
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((2, 80), cache.size())
+        self.put(cache, "d", size=100)  # evicts everything else
+        self.assertEqual((1, 100), cache.size())
+        self.assertEqual("value d", cache.get("d"))
+
+    def test_larger_than_budget_not_cached(self):
+        cache = ResultCache(max_size=100)
+        self.put(cache, "a", size=40)
+        self.put(cache, "b", size=101)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual("value a", cache.get("a"))
+        self.assertEqual((1, 40), cache.size())
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=60)
+        with mock.patch("scripts.result_cache.time.monotonic", return_value=1000):
+            self.put(cache, "a", size=5)
+        with mock.patch("scripts.result_cache.time.monotonic", return_value=1060):
+            self.assertEqual("value a", cache.get("a"))
+        with mock.patch("scripts.result_cache.time.monotonic", return_value=1060.5):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual((0, 0), cache.size())  # the expired entry is removed
+
+    def test_put_after_invalidation_dropped(self):
+        cache = ResultCache()
+        version = cache.version()  # the value is computed from this version of the data...
+        cache.invalidate(NAMESPACE_2, "2000-01-01", "2000-01-01")  # ...while a write happens
+        self.put(cache, "a", version=version)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((0, 0), cache.size())
+        self.put(cache, "a")  # computed again after the write
+        self.assertEqual("value a", cache.get("a"))
+
+    def test_put_after_clear_dropped(self):
+        cache = ResultCache()
+        version = cache.version()
+        cache.clear()
+        self.put(cache, "a", version=version)
+        self.assertIsNone(cache.get("a"))
+
+    def test_invalidate_range(self):
+        cache = ResultCache()
+        self.put(cache, "before", from_date="2022-01-01", to_date="2022-01-31")
+        self.put(cache, "touching_start", from_date="2022-01-15", to_date=FROM_DATE)
+        self.put(cache, "inside", from_date="2022-02-03", to_date="2022-02-04")
+        self.put(cache, "around", from_date="2022-01-01", to_date="2022-12-31")
+        self.put(cache, "touching_end", from_date=TO_DATE, to_date="2022-03-01")
+        self.put(cache, "after", from_date="2022-02-11", to_date="2022-03-01")
+        self.put(cache, "other_namespace", namespaces=[NAMESPACE_2])
+        self.put(cache, "both_namespaces", namespaces=[NAMESPACE_2, NAMESPACE])
+        cache.invalidate(NAMESPACE, FROM_DATE, TO_DATE)
+        kept = [key for key in ["before", "touching_start", "inside", "around", "touching_end", "after",
+                                "other_namespace", "both_namespaces"] if cache.get(key) is not None]
+        self.assertEqual(["before", "after", "other_namespace"], kept)
+        self.assertEqual((3, 3), cache.size())
+
+    def test_clear(self):
+        cache = ResultCache()
+        self.put(cache, "a", size=5)
+        cache.clear()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual((0, 0), cache.size())
+
+
+if __name__ == '__main__':
+    unittest.main()
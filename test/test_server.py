@@ -0,0 +1,224 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import unittest
+from unittest import mock
+
+os.environ["STORAGE_URI"] = "sqlite://"  # a temporary database, the server's store is created on import
+import scripts.metrics as metrics  # noqa: E402
+import scripts.noga as noga  # noqa: E402
+from scripts import server  # noqa: E402
+
+NAMESPACE = "noga2.energy"
+QUERY = {"source": "noga2", "type": "energy", "start_date": "01-02-2022", "end_date": "02-02-2022", "time": "all"}
+ROWS = [(NAMESPACE, date, time, tag, value)
+        for date, day_value in [("01-02-2022", 10), ("02-02-2022", 20)]
+        for time, time_value in [("10:00", 1), ("10:30", 2)]
+        for tag, value in [("Pv", float(day_value + time_value)), ("Wind", float(-day_value - time_value))]
+        if (date, time, tag) != ("02-02-2022", "10:30", "Wind")]
+CSV_LINES = ["type,date,time,Pv,Wind",
+             "noga2.energy,01-02-2022,10:00,11.0,-11.0",
+             "noga2.energy,01-02-2022,10:30,12.0,-12.0",
+             "noga2.energy,02-02-2022,10:00,21.0,-21.0",
+             "noga2.energy,02-02-2022,10:30,22.0,"]
+
+
+def failing_rows(*args, **kwargs):
+    yield [ROWS[0], ROWS[1]]
+    yield [ROWS[2]]  # completes the first line
+    raise RuntimeError("db went away")
+
+
+class TestStreamedFormats(unittest.TestCase):
+    def setUp(self):
+        server.store.clear()
+        server.result_cache.clear()
+        rows = list(ROWS)
+        random.Random(1).shuffle(rows)  # the lines rely on the storage ordering the rows, not the insert order
+        server.store.bulk_insert(rows)
+        self.client = server.app.test_client()
+
+    def get(self, result_format, **params):
+        return self.client.get("/get", query_string=dict(QUERY, format=result_format, **params))
+
+    def test_csv(self):
+        response = self.get("csv")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(CSV_LINES, response.get_data(as_text=True).splitlines())
+
+    def test_tsv(self):
+        response = self.get("tsv")
+        self.assertEqual([line.replace(",", "\t") for line in CSV_LINES], response.get_data(as_text=True).splitlines())
+
+    def test_ndjson(self):
+        response = self.get("ndjson")
+        self.assertEqual("application/x-ndjson", response.mimetype)
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(4, len(lines))
+        self.assertEqual({"type": NAMESPACE, "date": "01-02-2022", "time": "10:00", "Pv": 11.0, "Wind": -11.0},
+                         lines[0])
+        self.assertEqual({"type": NAMESPACE, "date": "02-02-2022", "time": "10:30", "Pv": 22.0}, lines[3])
+
+    def test_after(self):
+        response = self.get("csv", after="10:00")
+        self.assertEqual(CSV_LINES[:1] + CSV_LINES[2:], response.get_data(as_text=True).splitlines())
+
+    def test_empty(self):
+        response = self.get("csv", start_date="01-02-2020", end_date="02-02-2020")
+        self.assertEqual("type,date,time\n", response.get_data(as_text=True))
+
+    def test_cached(self):
+        self.assertEqual(CSV_LINES, self.get("csv").get_data(as_text=True).splitlines())
+        with mock.patch.object(noga, "iter_rows", side_effect=AssertionError("not cached")):
+            self.assertEqual(CSV_LINES, self.get("csv").get_data(as_text=True).splitlines())
+
+    def test_error_before_response(self):
+        with mock.patch.object(noga, "iter_rows", side_effect=RuntimeError("db went away")):
+            response = self.get("csv")
+        self.assertEqual(400, response.status_code)
+        self.assertIn("db went away", response.get_data(as_text=True))
+
+    def test_wide_lines_across_batches(self):
+        batches = [[ROWS[0]], [ROWS[1], ROWS[2]], [ROWS[3]]]
+        # a line is yielded once a row of another time shows that it is complete, the last one at the end
+        self.assertEqual([[], [[NAMESPACE, "01-02-2022", "10:00", 11.0, -11.0]], [],
+                          [[NAMESPACE, "01-02-2022", "10:30", 12.0, -12.0]]],
+                         list(server.wide_lines(batches, ["Pv", "Wind"])))
+
+
+class TestLargeStreams(TestStreamedFormats):
+    """Responses larger than RESULT_CACHE_ITEM_MB, every response here, are streamed and hold a slot."""
+
+    def setUp(self):
+        super().setUp()
+        self.slots = threading.BoundedSemaphore(1)
+        for name, value in [("RESULT_CACHE_ITEM_MB", 0), ("STREAM_WAIT", 0), ("_stream_slots", self.slots)]:
+            patcher = mock.patch.object(server, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assert_slot_free(self):
+        self.assertTrue(self.slots.acquire(timeout=0))
+        self.slots.release()
+
+    def test_csv(self):
+        super().test_csv()
+        self.assert_slot_free()
+        self.assertEqual((0, 0), server.result_cache.size())  # not cached
+
+    def test_cached(self):
+        pass  # large streams aren't cached
+
+    def test_slots_exhausted(self):
+        first = self.get("csv", buffered=False)
+        self.assertEqual(200, first.status_code)
+        self.assertEqual(503, self.get("csv").status_code)
+        first.close()
+        self.assertEqual(CSV_LINES, self.get("csv").get_data(as_text=True).splitlines())
+        self.assert_slot_free()
+
+    def test_error_in_stream(self):
+        with mock.patch.object(noga, "iter_rows", failing_rows):
+            response = self.get("csv")
+            ndjson_response = self.get("ndjson")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([CSV_LINES[0], CSV_LINES[1], "# Error: db went away"],
+                         response.get_data(as_text=True).splitlines())
+        ndjson_lines = ndjson_response.get_data(as_text=True).splitlines()
+        self.assertEqual(2, len(ndjson_lines))
+        self.assertEqual({"error": "db went away"}, json.loads(ndjson_lines[-1]))
+        self.assert_slot_free()
+
+    def get(self, result_format, buffered=True, **params):
+        return self.client.get("/get", query_string=dict(QUERY, format=result_format, **params), buffered=buffered)
+
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)",?')
+UNESCAPE = {"\\\\": "\\", '\\"': '"', "\\n": "\n"}
+
+
+def parse_metrics(text):
+    """{name: (type, help, [(sample name, {label: value}, value)])} of the Prometheus text format."""
+    families = {}
+    family = None
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, help_text = line[7:].split(" ", 1)
+            family = families[name] = [None, help_text, []]
+        elif line.startswith("# TYPE "):
+            name, a_type = line[7:].split(" ")
+            assert name in families and families[name][0] is None, "TYPE of {} without HELP".format(name)
+            families[name][0] = a_type
+        elif line and not line.startswith("#"):
+            name, labels, value = SAMPLE.match(line).groups()
+            assert family is not None and family[0] and name.startswith(list(families)[-1]), \
+                "{} without HELP and TYPE".format(name)
+            parsed = {}
+            for label, label_value in LABEL.findall(labels or ""):
+                parsed[label] = re.sub(r'\\\\|\\"|\\n', lambda m: UNESCAPE[m.group(0)], label_value)
+            family[2].append((name, parsed, float(value)))
+    return {name: tuple(family) for name, family in families.items()}
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        server.result_cache.clear()
+        self.client = server.app.test_client()
+
+    def scrape(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.mimetype.startswith("text/plain"))
+        return parse_metrics(response.get_data(as_text=True))
+
+    def samples(self, families, name, suffix, **labels):
+        return [value for sample, sample_labels, value in families[name][2]
+                if sample == name + suffix and all(sample_labels.get(k) == v for k, v in labels.items())]
+
+    def test_format(self):
+        self.client.get("/get", query_string=dict(QUERY, format="json"))
+        families = self.scrape()
+        for name, (a_type, help_text, samples) in families.items():
+            self.assertIn(a_type, ["counter", "gauge", "histogram"], name)
+            self.assertTrue(help_text, name)
+        self.assertEqual("histogram", families["http_request_duration_seconds"][0])
+        self.assertEqual("gauge", families["result_cache_misses"][0])
+        self.assertTrue(self.samples(families, "storage_operation_duration_seconds", "_count",
+                                     backend="InMemSqlStorage"))
+
+    def test_histogram(self):
+        labels = {"endpoint": "/get", "status": "200"}
+        before = self.samples(self.scrape(), "http_request_duration_seconds", "_count", **labels)
+        self.client.get("/get", query_string=dict(QUERY, format="json"))
+        families = self.scrape()
+        buckets = [(sample_labels["le"], value) for sample, sample_labels, value
+                   in families["http_request_duration_seconds"][2]
+                   if sample.endswith("_bucket") and all(sample_labels[k] == v for k, v in labels.items())]
+        bounds = [float(le) for le, _ in buckets]
+        self.assertEqual(list(metrics.DEFAULT_BUCKETS) + [math.inf], bounds)
+        self.assertEqual("+Inf", buckets[-1][0])
+        counts = [value for _, value in buckets]
+        self.assertEqual(sorted(counts), counts)  # cumulative
+        count = self.samples(families, "http_request_duration_seconds", "_count", **labels)
+        self.assertEqual([counts[-1]], count)
+        self.assertEqual((before or [0])[0] + 1, count[0])
+        self.assertGreater(self.samples(families, "http_request_duration_seconds", "_sum", **labels)[0], 0)
+        self.assertEqual([], self.samples(families, "http_request_duration_seconds", "_count",
+                                          endpoint="/metrics"))  # scrapes aren't timed
+
+    def test_label_escaping(self):
+        counter = metrics.Counter("test_escaping_total", "Label values to escape", ("path",))
+        self.addCleanup(metrics._metrics.remove, counter)
+        value = 'a "quoted" C:\\path\nand a second line'
+        counter.inc(2, value)
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn('test_escaping_total{path="a \\"quoted\\" C:\\\\path\\nand a second line"} 2', text)
+        self.assertEqual([("test_escaping_total", {"path": value}, 2.0)], parse_metrics(text)["test_escaping_total"][2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from collections import OrderedDict
+from unittest import mock
+
+import scripts.noga as noga
+from scripts import upload_jobs
+
+
+def zip_bytes(members):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members:
+            if name.endswith("/"):
+                archive.writestr(zipfile.ZipInfo(name), b"")
+            else:
+                archive.writestr(name, content)
+    return data.getvalue()
+
+
+class TestUploadJobs(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        self.uploaded = []
+        self.release = threading.Event()
+        self.release.set()
+        for target, name, value in [(upload_jobs, "UPLOAD_DIR", self.dir), (upload_jobs, "_jobs", OrderedDict()),
+                                    (noga, "upload_bytes", self.upload_bytes)]:
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload_bytes(self, store, name, data):
+        self.release.wait(10)
+        self.uploaded.append((name, data))
+        if b"boom" in data:
+            raise RuntimeError("boom")
+        if b"bad" in data:
+            return {"failure": "bad file"}
+        return {"success": True, "count": len(data)}
+
+    def submit(self, *parts, source="noga"):
+        return upload_jobs.submit(None, source, [(name, io.BytesIO(data)) for name, data in parts])
+
+    def wait(self, job):
+        deadline = time.monotonic() + 10
+        while job.to_dict()["finished"] is None:
+            self.assertLess(time.monotonic(), deadline, "job didn't finish")
+            time.sleep(0.01)
+        return job.to_dict()
+
+    def assertNoTempFiles(self):
+        self.assertEqual([], os.listdir(self.dir))
+
+    def test_zip_listing(self):
+        archive = zip_bytes([("a.xlsx", b"aa"), ("dir/", None), ("dir/b.XLS", b"bbb"), ("__MACOSX/._a.xlsx", b"x"),
+                             ("notes.txt", b"x"), ("dir/c.xlsx/", None)])
+        job = self.submit(("f.zip", archive), ("d.xlsx", b"dddd"))
+        result = self.wait(job)
+        self.assertEqual(["f.zip/a.xlsx", "f.zip/dir/b.XLS", "d.xlsx"], [file["name"] for file in result["files"]])
+        self.assertEqual([("f.zip/a.xlsx", b"aa"), ("f.zip/dir/b.XLS", b"bbb"), ("d.xlsx", b"dddd")], self.uploaded)
+        self.assertEqual(("done", 3, 3, 9), (result["state"], result["done"], result["total"], result["count"]))
+        self.assertNoTempFiles()
+
+    def test_too_large(self):
+        with mock.patch.object(upload_jobs, "UPLOAD_MAX_FILE_MB", 1):
+            with self.assertRaisesRegex(ValueError, "f.zip/b.xlsx is larger than 1 MB"):
+                self.submit(("a.xlsx", b"a"), ("f.zip", zip_bytes([("b.xlsx", b"0" * (1024 * 1024 + 1))])))
+            with self.assertRaisesRegex(ValueError, "c.xlsx is larger than 1 MB"):
+                self.submit(("c.xlsx", b"0" * (1024 * 1024 + 1)))
+        self.assertEqual([], self.uploaded)
+        self.assertNoTempFiles()
+
+    def test_bad_zip(self):
+        with self.assertRaises(zipfile.BadZipFile):
+            self.submit(("a.xlsx", b"a"), ("f.zip", b"not a zip"))
+        self.assertNoTempFiles()
+
+    def test_no_files(self):
+        for parts in [[], [("f.zip", zip_bytes([("notes.txt", b"x")]))]]:
+            with self.assertRaisesRegex(ValueError, "No files"):
+                self.submit(*parts)
+        self.assertNoTempFiles()
+
+    def test_states(self):
+        self.release.clear()
+        job = self.submit(("a.xlsx", b"a"), ("b.xlsx", b"bad"), ("c.xlsx", b"boom"))
+        result = job.to_dict()
+        self.assertIn(result["state"], ["queued", "running"])
+        self.assertEqual((0, 3, None), (result["done"], result["total"], result["finished"]))
+        self.assertIs(job, upload_jobs.get(job.id))
+        self.release.set()
+        result = self.wait(job)
+        self.assertEqual("done", result["state"])  # some files were stored
+        self.assertEqual([("done", 1), ("failed", 0), ("failed", 0)],
+                         [(file["state"], file["count"]) for file in result["files"]])
+        self.assertEqual(["bad file", "boom"], [file["failure"] for file in result["files"][1:]])
+        self.assertNoTempFiles()
+
+    def test_all_failed(self):
+        result = self.wait(self.submit(("a.xlsx", b"bad"), ("b.xlsx", b"boom")))
+        self.assertEqual("failed", result["state"])
+        result = self.wait(self.submit(("a.xlsx", b"a"), source="other"))
+        self.assertEqual(("failed", "Unsupported source other"), (result["state"], result["files"][0]["failure"]))
+        self.assertNoTempFiles()
+
+    def test_finished_jobs_pruned(self):
+        with mock.patch.object(upload_jobs, "UPLOAD_JOBS_KEPT", 1):
+            jobs = [self.submit(("a.xlsx", b"a")) for _ in range(3)]
+            for job in jobs:
+                self.wait(job)
+            self.release.clear()
+            running = self.submit(("a.xlsx", b"a"))
+            self.assertEqual([None, None], [upload_jobs.get(job.id) for job in jobs[:2]])
+            self.assertIs(jobs[2], upload_jobs.get(jobs[2].id))
+            self.assertIs(running, upload_jobs.get(running.id))  # unfinished jobs aren't pruned
+            self.release.set()
+            self.wait(running)
+
+
+if __name__ == '__main__':
+    unittest.main()